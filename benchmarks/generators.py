@@ -0,0 +1,306 @@
+"""
+Seeded generators of synthetic benchmark inputs, every generator scales with size
+"""
+import os
+import json
+import yaml
+import numpy as np
+import pandas as pd
+
+# prefix of the synthetic source tree, funcFile is absolute like CodeQL output
+BASE_PATH = "/src/example.com/repo/"
+MODULE = "example.com/repo"
+
+
+def synthetic_functions(size: int, seed: int = 0, functions_per_file: int = 20) -> pd.DataFrame:
+    """Function table with the extract_functions_module.ql columns.
+    Functions of a file are laid out back to back, 5% are closures nested in the previous function.
+
+    Args:
+        size (int): Number of functions
+        seed (int, optional): Random seed. Defaults to 0.
+        functions_per_file (int, optional): Functions per file. Defaults to 20.
+
+    Returns:
+        pd.DataFrame: funcFile, functionName, funcStartLine, funcEndLine, funcNumLines,
+            functionQualifiedName, funcLocation
+    """
+    rng = np.random.default_rng(seed)
+
+    file_ids = np.arange(size) // functions_per_file
+    position = np.arange(size) % functions_per_file
+    lengths = rng.integers(3, 60, size)
+    gaps = rng.integers(1, 5, size)
+
+    # back to back layout within each file
+    spans = lengths + gaps
+    starts = pd.Series(spans).groupby(file_ids).cumsum().to_numpy() - spans + 1
+    ends = starts + lengths - 1
+
+    # closures sit inside the previous function of the same file
+    nested = (rng.random(size) < 0.05) & (position > 0)
+    previous = np.maximum(np.arange(size) - 1, 0)
+    starts = np.where(nested, starts[previous] + 1, starts)
+    ends = np.where(nested, np.minimum(starts + 1, ends[previous]), ends)
+
+    packages = file_ids // 5
+    files = [f"{BASE_PATH}pkg{p}/file{f}.go" for p, f in zip(packages, file_ids)]
+    names = [f"Func{i}" for i in range(size)]
+
+    return pd.DataFrame(
+        {
+            "funcFile": files,
+            "functionName": names,
+            "funcStartLine": starts,
+            "funcEndLine": ends,
+            "funcNumLines": ends - starts + 1,
+            "functionQualifiedName": [f"{MODULE}/pkg{p}.{n}" for p, n in zip(packages, names)],
+            "funcLocation": [f"file://{f}:{s}:1:{e}:2" for f, s, e in zip(files, starts, ends)],
+        }
+    )
+
+
+def synthetic_call_graph(functions: pd.DataFrame, edges_per_function: int = 4, seed: int = 0) -> pd.DataFrame:
+    """Call graph edge list with the call_graph.ql columns.
+    Most calls stay within a neighbourhood of the caller, some jump anywhere, cycles included.
+
+    Args:
+        functions (pd.DataFrame): Output of synthetic_functions
+        edges_per_function (int, optional): Average calls per function. Defaults to 4.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: Call graph edges
+    """
+    rng = np.random.default_rng(seed)
+    count = len(functions)
+    edges = count * edges_per_function
+
+    callers = rng.integers(0, count, edges)
+    local = callers + rng.integers(-50, 50, edges)
+    anywhere = rng.integers(0, count, edges)
+    callees = np.clip(np.where(rng.random(edges) < 0.8, local, anywhere), 0, count - 1)
+
+    caller_rows = functions.iloc[callers]
+    callee_rows = functions.iloc[callees]
+
+    return pd.DataFrame(
+        {
+            "callerFunction": caller_rows["functionName"].to_numpy(),
+            "callerLocation": caller_rows["funcLocation"].to_numpy(),
+            "callerFunctionFile": caller_rows["funcFile"].to_numpy(),
+            "callerFunctionStartLine": caller_rows["funcStartLine"].to_numpy(),
+            "calleeFunction": callee_rows["functionName"].to_numpy(),
+            "calleeFunctionFile": callee_rows["funcFile"].to_numpy(),
+            "calleeFunctionStartLine": callee_rows["funcStartLine"].to_numpy(),
+            "calleeFunctionEndLineTest": callee_rows["funcEndLine"].to_numpy(),
+        }
+    )
+
+
+def synthetic_diff(functions: pd.DataFrame, hunks: int, seed: int = 0) -> pd.DataFrame:
+    """Unified diff hunks inside random functions, shaped like git_diff(df=True) before
+    the changed line columns are added
+
+    Args:
+        functions (pd.DataFrame): Output of synthetic_functions
+        hunks (int): Number of hunks
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: file_name, raw_patch_header, raw_patch, original_line_start,
+            modified_line_start, additions, deletions
+    """
+    rng = np.random.default_rng(seed)
+    targets = functions.iloc[rng.integers(0, len(functions), hunks)]
+
+    rows = []
+    for func_file, start in zip(targets["funcFile"], targets["funcStartLine"]):
+        context = int(rng.integers(1, 4))
+        removed = int(rng.integers(0, 6))
+        added = int(rng.integers(0 if removed else 1, 8))
+
+        body = [f" context {i}" for i in range(context)]
+        body += [f"-old line {i}" for i in range(removed)]
+        body += [f"+new line {i}" for i in range(added)]
+        body += [f" context {i}" for i in range(context)]
+
+        original_length = 2 * context + removed
+        modified_length = 2 * context + added
+        header = f"@@ -{start},{original_length} +{start},{modified_length} @@"
+
+        rows.append(
+            {
+                "file_name": func_file[len(BASE_PATH):],
+                "raw_patch_header": header,
+                "raw_patch": " func() {\n" + "\n".join(body) + "\n",
+                "original_line_start": int(start),
+                "modified_line_start": int(start),
+                "additions": added,
+                "deletions": removed,
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def synthetic_spdx_sbom(sbom_path: str, size: int, seed: int = 0, width: int = 8) -> str:
+    """SPDX tag-value SBOM of a layered dependency DAG, every package depends on up to 3
+    packages of the next layer so paths fork and rejoin (diamonds)
+
+    Args:
+        sbom_path (str): Output SBOM location
+        size (int): Number of packages
+        seed (int, optional): Random seed. Defaults to 0.
+        width (int, optional): Packages per layer. Defaults to 8.
+
+    Returns:
+        str: Name of a package in the last layer, a target with many paths
+    """
+    rng = np.random.default_rng(seed)
+    names = [MODULE] + [f"example.com/dep{i}" for i in range(1, size)]
+
+    lines = ["SPDXVersion: SPDX-2.2", "DataLicense: CC0-1.0", "SPDXID: SPDXRef-DOCUMENT", ""]
+    for i, name in enumerate(names):
+        lines += [
+            f"PackageName: {name}",
+            f"SPDXID: SPDXRef-Package-{i}",
+            f"PackageVersion: v1.{i % 20}.{i % 7}",
+            "",
+        ]
+
+    lines.append("Relationship: SPDXRef-DOCUMENT DESCRIBES SPDXRef-Package-0")
+    # the root depends on the whole first layer
+    for j in range(1, min(width + 1, size)):
+        lines.append(f"Relationship: SPDXRef-Package-0 DEPENDS_ON SPDXRef-Package-{j}")
+    for i in range(1, size):
+        layer_start = ((i - 1) // width + 1) * width + 1
+        layer_end = min(layer_start + width, size)
+        if layer_start >= size:
+            continue
+        for j in rng.choice(np.arange(layer_start, layer_end), min(3, layer_end - layer_start), replace=False):
+            lines.append(f"Relationship: SPDXRef-Package-{i} DEPENDS_ON SPDXRef-Package-{j}")
+
+    with open(sbom_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return names[-1]
+
+
+def synthetic_govulndb(reports_path: str, size: int, seed: int = 0):
+    """GoVulnDB data/reports tree of YAML reports
+
+    Args:
+        reports_path (str): Output directory of the reports
+        size (int): Number of reports
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(reports_path, exist_ok=True)
+
+    for i in range(size):
+        report_id = f"GO-{2020 + i // 10000}-{i % 10000:04d}"
+        owner, name = f"owner{i % 97}", f"repo{i}"
+        references = [{"web": f"https://example.com/advisory/{i}"}]
+        references += [
+            {"fix": f"https://github.com/{owner}/{name}/commit/{rng.bytes(20).hex()}"}
+            for _ in range(int(rng.integers(0, 3)))
+        ]
+
+        report = {
+            "id": report_id,
+            "modules": [
+                {
+                    "module": f"github.com/{owner}/{name}",
+                    "versions": [{"fixed": f"1.{i % 10}.{int(rng.integers(1, 20))}"}],
+                    "vulnerable_at": f"1.{i % 10}.0",
+                    "packages": [
+                        {
+                            "package": f"github.com/{owner}/{name}/pkg",
+                            "symbols": [f"Func{x}" for x in rng.integers(0, 1000, 3)],
+                            "derived_symbols": [f"Type.Method{x}" for x in rng.integers(0, 1000, 2)],
+                        }
+                    ],
+                }
+            ],
+            "description": "Synthetic report. " * int(rng.integers(5, 40)),
+            "references": references,
+        }
+
+        with open(os.path.join(reports_path, f"{report_id}.yaml"), "w") as f:
+            yaml.safe_dump(report, f, sort_keys=False)
+
+
+def synthetic_osv_advisories(osv_path: str, size: int, seed: int = 0):
+    """Directory of Go OSV advisories, each with one or two affected ranges
+
+    Args:
+        osv_path (str): Output directory of the OSV JSON files
+        size (int): Number of advisories
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(osv_path, exist_ok=True)
+
+    for i in range(size):
+        owner, name = f"owner{i % 97}", f"repo{i % 500}"
+        events = [{"introduced": "0"}, {"fixed": f"1.{i % 10}.{int(rng.integers(1, 20))}"}]
+        if rng.random() < 0.3:
+            events += [{"introduced": "2.0.0"}, {"fixed": f"2.{i % 5}.{int(rng.integers(1, 9))}"}]
+
+        advisory = {
+            "id": f"GHSA-{i:04d}-synt-hetc",
+            "modified": "2023-01-01T00:00:00Z",
+            "published": "2023-01-01T00:00:00Z",
+            "aliases": [f"CVE-2023-{i:05d}"],
+            "summary": "Synthetic advisory",
+            "details": "Synthetic details. " * int(rng.integers(5, 40)),
+            "affected": [
+                {
+                    "package": {"ecosystem": "Go", "name": f"github.com/{owner}/{name}"},
+                    "ranges": [{"type": "SEMVER", "events": events}],
+                }
+            ],
+            "references": [
+                {"type": "ADVISORY", "url": f"https://nvd.nist.gov/vuln/detail/CVE-2023-{i:05d}"},
+                {"type": "FIX", "url": f"https://github.com/{owner}/{name}/commit/{rng.bytes(20).hex()}"},
+            ],
+            "database_specific": {"cwe_ids": ["CWE-79"], "severity": "MODERATE"},
+        }
+
+        with open(os.path.join(osv_path, f"{advisory['id']}.json"), "w") as f:
+            json.dump(advisory, f)
+
+
+def synthetic_module_versions(size: int, seed: int = 0) -> pd.DataFrame:
+    """Module versions (e.g., SBOM components) over the packages of synthetic_osv_advisories,
+    pseudo-versions and +incompatible included
+
+    Args:
+        size (int): Number of module versions
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: package.name and version
+    """
+    rng = np.random.default_rng(seed)
+    kinds = rng.integers(0, 3, size)
+    majors = rng.integers(0, 3, size)
+    minors = rng.integers(0, 10, size)
+    patches = rng.integers(0, 20, size)
+
+    versions = [
+        f"v{a}.{b}.{c}"
+        if kind == 0
+        else f"v{a}.{b}.{c + 1}-0.20230101000000-abcdef123456"
+        if kind == 1
+        else f"v{a}.{b}.{c}+incompatible"
+        for kind, a, b, c in zip(kinds, majors, minors, patches)
+    ]
+
+    return pd.DataFrame(
+        {
+            "package.name": [f"github.com/owner{i % 97}/repo{i % 500}" for i in rng.integers(0, 10**6, size)],
+            "version": versions,
+        }
+    )
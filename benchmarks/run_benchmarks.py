@@ -0,0 +1,348 @@
+"""
+Benchmarks of the helper hot paths on seeded synthetic inputs, no network or CodeQL needed
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --size 500 --save-baseline
+    python -m benchmarks.run_benchmarks --size 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import networkx as nx
+import pandas as pd
+from utils import git_helper, govulndb_helper, osv_helper, sbom_helper, callgraph_helper, version_helper
+from benchmarks import generators
+
+# default location of the recorded numbers
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# a benchmark is slower than its baseline by more than this fraction
+DEFAULT_THRESHOLD = 0.25
+
+# and by more than this many seconds, so timer noise on fast benchmarks is not a regression
+MIN_SLOWDOWN = 0.005
+
+# fewer timed runs give a min that is too noisy to compare
+MIN_REPEAT = 5
+
+
+def changed_files_setup(workdir: str, size: int, seed: int):
+    """Functions and a grouped diff like the notebook builds before matching"""
+    functions = generators.synthetic_functions(size * 20, seed)
+    diff_df = git_helper.add_changed_line_columns(generators.synthetic_diff(functions, size, seed))
+    changed_files = (
+        diff_df.groupby("file_name").agg({"new_modified_lines": "sum"}).reset_index(drop=False)
+    )
+    return functions, diff_df, changed_files
+
+
+def bench_match_functions_per_file(workdir: str, size: int, seed: int):
+    functions, _, changed_files = changed_files_setup(workdir, size, seed)
+
+    def run():
+        matches = [
+            git_helper.match_functions(
+                temp_functions=functions,
+                temp_file_name=row.file_name,
+                temp_lines=row.new_modified_lines,
+            )
+            for row in changed_files.itertuples()
+        ]
+        return pd.concat(matches)
+
+    return run
+
+
+def bench_match_changed_lines(workdir: str, size: int, seed: int):
+    functions, diff_df, _ = changed_files_setup(workdir, size, seed)
+
+    def run():
+        function_index = git_helper.build_function_index(functions, base_path=generators.BASE_PATH)
+        return git_helper.match_changed_lines(function_index, diff_df)
+
+    return run
+
+
+def bench_changed_lines_per_hunk(workdir: str, size: int, seed: int):
+    diff_df = generators.synthetic_diff(generators.synthetic_functions(size * 20, seed), size, seed)
+
+    def run():
+        return [
+            (
+                git_helper.git_changed_original_lines(row.raw_patch, row.original_line_start),
+                git_helper.git_changed_modified_lines(row.raw_patch, row.modified_line_start),
+            )
+            for row in diff_df.itertuples()
+        ]
+
+    return run
+
+
+def bench_add_changed_line_columns(workdir: str, size: int, seed: int):
+    diff_df = generators.synthetic_diff(generators.synthetic_functions(size * 20, seed), size, seed)
+
+    def run():
+        return git_helper.add_changed_line_columns(diff_df.copy())
+
+    return run
+
+
+def bench_load_all_reports(workdir: str, size: int, seed: int):
+    reports_path = os.path.join(workdir, "reports", "")
+    generators.synthetic_govulndb(reports_path, size, seed)
+
+    def run():
+        return govulndb_helper.load_all_reports(reports_path, verbose=False)
+
+    return run
+
+
+def bench_load_all_reports_cached(workdir: str, size: int, seed: int):
+    reports_path = os.path.join(workdir, "reports", "")
+    cache_path = os.path.join(workdir, "report_cache")
+    generators.synthetic_govulndb(reports_path, size, seed)
+    govulndb_helper.load_all_reports(reports_path, verbose=False, cache_path=cache_path)
+
+    def run():
+        return govulndb_helper.load_all_reports(reports_path, verbose=False, cache_path=cache_path)
+
+    return run
+
+
+def bench_parse_osv_per_file(workdir: str, size: int, seed: int):
+    osv_path = os.path.join(workdir, "osv")
+    generators.synthetic_osv_advisories(osv_path, size, seed)
+    files = sorted(os.path.join(osv_path, x) for x in os.listdir(osv_path))
+
+    def run():
+        return [osv_helper.parse_osv(x) for x in files]
+
+    return run
+
+
+def bench_parse_osv_bulk(workdir: str, size: int, seed: int):
+    osv_path = os.path.join(workdir, "osv")
+    generators.synthetic_osv_advisories(osv_path, size, seed)
+
+    def run():
+        return osv_helper.parse_osv_bulk(osv_path)
+
+    return run
+
+
+def bench_dependency_paths(workdir: str, size: int, seed: int):
+    sbom_path = os.path.join(workdir, "bom-go-mod.spdx")
+    target = generators.synthetic_spdx_sbom(sbom_path, size, seed)
+
+    def run():
+        graph = sbom_helper.load_sbom_graph(sbom_path)
+        return sbom_helper.dependency_paths(graph, generators.MODULE, target)
+
+    return run
+
+
+def call_graph_setup(size: int, seed: int):
+    """Call graph with keys and 20 vulnerable functions"""
+    functions = generators.synthetic_functions(size * 20, seed)
+    temp_cg = generators.synthetic_call_graph(functions, seed=seed)
+    keys = callgraph_helper.unique_function_keys(functions, "functionName", "funcFile", "funcStartLine")
+    return temp_cg, keys.sample(20, random_state=seed).tolist()
+
+
+def bench_networkx_ancestors(workdir: str, size: int, seed: int):
+    temp_cg, vulnerable = call_graph_setup(size, seed)
+
+    def run():
+        # the notebook flow: apply keys, DiGraph from tuples, ancestors per function
+        temp_cg["uniqueCallee"] = temp_cg.apply(
+            lambda x: f"{x['calleeFunction']}_{x['calleeFunctionFile']}_{x['calleeFunctionStartLine']}",
+            axis=1,
+        )
+        temp_cg["uniqueCaller"] = temp_cg.apply(
+            lambda x: f"{x['callerFunction']}_{x['callerFunctionFile']}_{x['callerFunctionStartLine']}",
+            axis=1,
+        )
+        graph = nx.DiGraph([tuple(x) for x in temp_cg[["uniqueCaller", "uniqueCallee"]].values.tolist()])
+        return [nx.ancestors(graph, x) for x in vulnerable if x in graph]
+
+    return run
+
+
+def bench_vulnerable_ancestors(workdir: str, size: int, seed: int):
+    temp_cg, vulnerable = call_graph_setup(size, seed)
+
+    def run():
+        call_graph = callgraph_helper.build_call_graph(temp_cg)
+        return callgraph_helper.vulnerable_ancestors(call_graph, vulnerable)
+
+    return run
+
+
+def bench_affected_versions(workdir: str, size: int, seed: int):
+    osv_path = os.path.join(workdir, "osv")
+    generators.synthetic_osv_advisories(osv_path, size, seed)
+    _, ranges_df, _ = osv_helper.parse_osv_bulk(osv_path)
+    modules_df = generators.synthetic_module_versions(size * 100, seed)
+
+    def run():
+        return version_helper.affected_versions(ranges_df, modules_df)
+
+    return run
+
+
+# name -> setup(workdir, size, seed) returning the callable to time
+BENCHMARKS = {
+    "match_functions_per_file": bench_match_functions_per_file,
+    "match_changed_lines": bench_match_changed_lines,
+    "changed_lines_per_hunk": bench_changed_lines_per_hunk,
+    "add_changed_line_columns": bench_add_changed_line_columns,
+    "load_all_reports": bench_load_all_reports,
+    "load_all_reports_cached": bench_load_all_reports_cached,
+    "parse_osv_per_file": bench_parse_osv_per_file,
+    "parse_osv_bulk": bench_parse_osv_bulk,
+    "dependency_paths": bench_dependency_paths,
+    "networkx_ancestors": bench_networkx_ancestors,
+    "vulnerable_ancestors": bench_vulnerable_ancestors,
+    "affected_versions": bench_affected_versions,
+}
+
+
+def run_benchmarks(names: list, size: int, seed: int, repeat: int) -> dict:
+    """Times each benchmark repeat times on freshly generated inputs
+
+    Args:
+        names (list): Benchmarks to run
+        size (int): Scale of the synthetic inputs
+        seed (int): Random seed of the generators
+        repeat (int): Timed runs per benchmark
+
+    Returns:
+        dict: meta and {name: {min, median, repeat}} in seconds
+    """
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as workdir:
+            run = BENCHMARKS[name](workdir, size, seed)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+
+        results[name] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "repeat": repeat,
+        }
+        print(f"{name}: {results[name]['min']:.4f}s (median {results[name]['median']:.4f}s)")
+
+    return {
+        "meta": {
+            "size": size,
+            "seed": seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare_to_baseline(
+    results: dict,
+    baseline: dict,
+    threshold: float = DEFAULT_THRESHOLD,
+    min_slowdown: float = MIN_SLOWDOWN,
+) -> pd.DataFrame:
+    """Compares the min timings with a baseline, a benchmark may carry its own threshold.
+    A regression is slower by more than the threshold fraction and by more than min_slowdown.
+
+    Args:
+        results (dict): Output of run_benchmarks
+        baseline (dict): Saved baseline (run_benchmarks output plus thresholds)
+        threshold (float, optional): Allowed slowdown fraction when the baseline has none.
+            Defaults to DEFAULT_THRESHOLD.
+        min_slowdown (float, optional): Allowed slowdown in seconds. Defaults to MIN_SLOWDOWN.
+
+    Returns:
+        pd.DataFrame: benchmark, baseline, current, ratio, threshold and regression
+    """
+    threshold = baseline.get("threshold", threshold)
+
+    rows = []
+    for name, current in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        recorded = baseline["benchmarks"][name]
+        limit = recorded.get("threshold", threshold)
+        ratio = current["min"] / recorded["min"] if recorded["min"] > 0 else float("inf")
+        regression = ratio > 1 + limit and current["min"] - recorded["min"] > min_slowdown
+        rows.append([name, recorded["min"], current["min"], ratio, limit, regression])
+
+    return pd.DataFrame(
+        rows, columns=["benchmark", "baseline", "current", "ratio", "threshold", "regression"]
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=500, help="scale of the synthetic inputs")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the generators")
+    parser.add_argument("--repeat", type=int, default=MIN_REPEAT, help="timed runs per benchmark")
+    parser.add_argument("--only", default=None, help="comma separated benchmarks to run")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare with or save")
+    parser.add_argument("--save-baseline", action="store_true", help="record the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown fraction")
+    parser.add_argument("--min-slowdown", type=float, default=MIN_SLOWDOWN, help="allowed slowdown in seconds")
+    parser.add_argument("--output", default=None, help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [x for x in names if x not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks {unknown}, expected some of {list(BENCHMARKS)}")
+    if args.repeat < MIN_REPEAT:
+        parser.error(f"--repeat must be at least {MIN_REPEAT} for stable timings")
+
+    results = run_benchmarks(names, args.size, args.seed, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        results["threshold"] = args.threshold
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+
+    if (baseline["meta"]["size"], baseline["meta"]["seed"]) != (args.size, args.seed):
+        print(
+            f"Baseline was recorded with size={baseline['meta']['size']} seed={baseline['meta']['seed']}, "
+            f"rerun with the same values to compare"
+        )
+        return 2
+
+    comparison = compare_to_baseline(results, baseline, args.threshold, args.min_slowdown)
+    print(comparison.to_string(index=False))
+
+    return 1 if comparison["regression"].any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,517 @@
+"""
+Helper functions for compact call graphs from call_graph.ql
+"""
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+
+def unique_function_keys(
+    temp_df: pd.DataFrame, name_column: str, file_column: str, line_column: str
+) -> pd.Series:
+    """Builds the {function name}_{file of function}_{line start of function} keys without a row-wise apply
+
+    Args:
+        temp_df (pd.DataFrame): Functions or call graph edges
+        name_column (str): Function name column (e.g., callerFunction)
+        file_column (str): Function file column (e.g., callerFunctionFile)
+        line_column (str): Function start line column (e.g., callerFunctionStartLine)
+
+    Returns:
+        pd.Series: Unique function keys
+    """
+    return (
+        temp_df[name_column].astype(str)
+        + "_"
+        + temp_df[file_column].astype(str)
+        + "_"
+        + temp_df[line_column].astype(str)
+    )
+
+
+def csr_from_edges(src: np.ndarray, dst: np.ndarray, num_nodes: int):
+    """Builds a CSR adjacency (indptr, indices) where the neighbors of node i are
+    indices[indptr[i]:indptr[i + 1]]
+
+    Args:
+        src (np.ndarray): Edge sources
+        dst (np.ndarray): Edge targets
+        num_nodes (int): Number of nodes
+
+    Returns:
+        (np.ndarray, np.ndarray): indptr (int64), indices (int32)
+    """
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+
+    return indptr, dst[order].astype(np.int32)
+
+
+def csr_neighbors(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray):
+    """Expands the neighbors of many nodes at once
+
+    Args:
+        indptr (np.ndarray): CSR indptr
+        indices (np.ndarray): CSR indices
+        nodes (np.ndarray): Nodes to expand
+
+    Returns:
+        (np.ndarray, np.ndarray): Position in nodes of each neighbor, neighbors
+    """
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+
+    position = np.repeat(np.arange(len(nodes)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return position, indices[starts[position] + offsets]
+
+
+def build_call_graph(
+    temp_cg: pd.DataFrame,
+    caller_column: str = "uniqueCaller",
+    callee_column: str = "uniqueCallee",
+) -> dict:
+    """Interns the functions of a call graph into integer IDs and stores the edges as CSR arrays.
+    Missing key columns are built from the call_graph.ql columns.
+
+    Args:
+        temp_cg (pd.DataFrame): Call graph from call_graph.ql
+        caller_column (str, optional): Caller key column. Defaults to "uniqueCaller".
+        callee_column (str, optional): Callee key column. Defaults to "uniqueCallee".
+
+    Returns:
+        dict: nodes (pd.Index of keys, position is the ID), src/dst edge arrays and the
+            forward (caller -> callee) and reverse (callee -> caller) CSR arrays
+    """
+    if caller_column in temp_cg.columns:
+        callers = temp_cg[caller_column]
+    else:
+        callers = unique_function_keys(
+            temp_cg, "callerFunction", "callerFunctionFile", "callerFunctionStartLine"
+        )
+
+    if callee_column in temp_cg.columns:
+        callees = temp_cg[callee_column]
+    else:
+        callees = unique_function_keys(
+            temp_cg, "calleeFunction", "calleeFunctionFile", "calleeFunctionStartLine"
+        )
+
+    # one ID space for callers and callees
+    codes, nodes = pd.factorize(
+        pd.concat([callers, callees], ignore_index=True).astype(str)
+    )
+    num_nodes = len(nodes)
+
+    # drop duplicate edges, as the DiGraph did
+    edges = np.stack([codes[: len(callers)], codes[len(callers):]], axis=1)
+    edges = np.unique(edges.astype(np.int32), axis=0)
+    src, dst = edges[:, 0], edges[:, 1]
+
+    forward_indptr, forward_indices = csr_from_edges(src, dst, num_nodes)
+    reverse_indptr, reverse_indices = csr_from_edges(dst, src, num_nodes)
+
+    return {
+        "nodes": pd.Index(nodes),
+        "src": src,
+        "dst": dst,
+        "forward_indptr": forward_indptr,
+        "forward_indices": forward_indices,
+        "reverse_indptr": reverse_indptr,
+        "reverse_indices": reverse_indices,
+    }
+
+
+def reverse_reachability(call_graph: dict, source_ids: np.ndarray):
+    """Multi-source reverse BFS from all sources at once.
+    Each node carries a bitset of the sources it reaches, bits are pushed to the
+    callers until nothing changes.
+
+    Args:
+        call_graph (dict): Call graph from build_call_graph
+        source_ids (np.ndarray): Node IDs of the sources (e.g., vulnerable functions)
+
+    Returns:
+        (np.ndarray, np.ndarray): Ancestor node IDs, index into source_ids each ancestor reaches
+    """
+    source_ids = np.asarray(source_ids, dtype=np.int64)
+    num_nodes = len(call_graph["nodes"])
+    num_words = max(1, (len(source_ids) + 63) // 64)
+
+    # bit i of reach[node] is set when node reaches source_ids[i]
+    reach = np.zeros((num_nodes, num_words), dtype=np.uint64)
+    source_bits = np.arange(len(source_ids))
+    np.bitwise_or.at(
+        reach,
+        (source_ids, source_bits // 64),
+        np.left_shift(np.uint64(1), (source_bits % 64).astype(np.uint64)),
+    )
+
+    frontier = np.unique(source_ids)
+    while len(frontier) > 0:
+        position, callers = csr_neighbors(
+            call_graph["reverse_indptr"], call_graph["reverse_indices"], frontier
+        )
+        if len(callers) == 0:
+            break
+
+        before = reach[callers].copy()
+        np.bitwise_or.at(reach, callers, reach[frontier[position]])
+
+        # only callers that gained new bits need to be expanded again
+        changed = np.any(reach[callers] != before, axis=1)
+        frontier = np.unique(callers[changed])
+
+    ancestors = []
+    reached_sources = []
+    for index, source_id in enumerate(source_ids):
+        word, bit = divmod(index, 64)
+        nodes = np.flatnonzero(reach[:, word] & np.uint64(1 << bit))
+
+        # like nx.ancestors, a function is not its own ancestor
+        nodes = nodes[nodes != source_id]
+        ancestors.append(nodes)
+        reached_sources.append(np.full(len(nodes), index, dtype=np.int64))
+
+    if len(ancestors) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    return np.concatenate(ancestors), np.concatenate(reached_sources)
+
+
+def vulnerable_ancestors(call_graph: dict, vulnerable_functions: list) -> pd.DataFrame:
+    """Finds every function with a path to any vulnerable function in one traversal
+
+    Args:
+        call_graph (dict): Call graph from build_call_graph
+        vulnerable_functions (list): uniqueFunction keys of the vulnerable functions
+
+    Returns:
+        pd.DataFrame: uniqueFunction (ancestor) and vulnerableFunction it reaches, one row per pair
+    """
+    vulnerable_functions = pd.unique(pd.Series(vulnerable_functions, dtype=object))
+    source_ids = call_graph["nodes"].get_indexer(vulnerable_functions)
+
+    # vulnerable functions that are not in the call graph have no ancestors
+    found = source_ids >= 0
+    source_ids = source_ids[found]
+    vulnerable_functions = vulnerable_functions[found]
+
+    ancestor_ids, source_index = reverse_reachability(call_graph, source_ids)
+
+    return pd.DataFrame(
+        {
+            "uniqueFunction": call_graph["nodes"][ancestor_ids],
+            "vulnerableFunction": vulnerable_functions[source_index],
+        }
+    )
+
+
+def strongly_connected_components(call_graph: dict) -> np.ndarray:
+    """Iterative Tarjan over the forward CSR arrays.
+    Components are numbered in completion order, which is a reverse topological order of
+    the condensation and a post-order of the DFS, so every component's DFS subtree is a
+    contiguous block of component IDs.
+
+    Args:
+        call_graph (dict): Call graph from build_call_graph
+
+    Returns:
+        np.ndarray: Component ID of every node (int32)
+    """
+    num_nodes = len(call_graph["nodes"])
+    indptr = call_graph["forward_indptr"].tolist()
+    indices = call_graph["forward_indices"].tolist()
+
+    index = [-1] * num_nodes
+    low = [0] * num_nodes
+    on_stack = [False] * num_nodes
+    component = [-1] * num_nodes
+    stack = []
+    counter = 0
+    num_components = 0
+
+    for root in range(num_nodes):
+        if index[root] != -1:
+            continue
+
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, indptr[root])]
+
+        while work:
+            node, edge = work[-1]
+            if edge < indptr[node + 1]:
+                callee = indices[edge]
+                work[-1] = (node, edge + 1)
+                if index[callee] == -1:
+                    index[callee] = low[callee] = counter
+                    counter += 1
+                    stack.append(callee)
+                    on_stack[callee] = True
+                    work.append((callee, indptr[callee]))
+                elif on_stack[callee] and index[callee] < low[node]:
+                    low[node] = index[callee]
+            else:
+                work.pop()
+                if work and low[node] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[node]
+
+                # node is the root of a component
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = num_components
+                        if member == node:
+                            break
+                    num_components += 1
+
+    return np.asarray(component, dtype=np.int32)
+
+
+def build_reachability_index(call_graph: dict) -> dict:
+    """Condenses the call graph into strongly connected components and stores, for every
+    component, the components it reaches as a few merged ranges of component IDs.
+
+    Args:
+        call_graph (dict): Call graph from build_call_graph
+
+    Returns:
+        dict: nodes, component of every node and the reach ranges of every component in
+            CSR form (indptr, starts, ends)
+    """
+    component = strongly_connected_components(call_graph)
+    num_components = int(component.max()) + 1 if len(component) else 0
+
+    # condensation edges between different components
+    src = component[call_graph["src"]]
+    dst = component[call_graph["dst"]]
+    keep = src != dst
+    condensed = np.unique(np.stack([src[keep], dst[keep]], axis=1), axis=0)
+    child_indptr, children = csr_from_edges(
+        condensed[:, 0], condensed[:, 1], num_components
+    )
+    child_indptr = child_indptr.tolist()
+    children = children.tolist()
+
+    # children always have lower IDs, so their ranges are complete when a parent is reached
+    reach = []
+    for comp in range(num_components):
+        ranges = [(comp, comp)]
+        for child in children[child_indptr[comp]:child_indptr[comp + 1]]:
+            ranges.extend(reach[child])
+        ranges.sort()
+
+        merged = [ranges[0]]
+        for start, end in ranges[1:]:
+            if start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        reach.append(merged)
+
+    reach_indptr = np.zeros(num_components + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in reach], out=reach_indptr[1:])
+    flat = [x for ranges in reach for x in ranges]
+
+    return {
+        "nodes": call_graph["nodes"],
+        "component": component,
+        "reach_indptr": reach_indptr,
+        "reach_starts": np.asarray([x[0] for x in flat], dtype=np.int32),
+        "reach_ends": np.asarray([x[1] for x in flat], dtype=np.int32),
+    }
+
+
+def reachability_index_path(index_root: str, module: str, commit_sha: str) -> str:
+    """Location of the reachability index of a module at a commit
+
+    Args:
+        index_root (str): Root folder of the reachability indexes
+        module (str): Module (e.g., github.com/hashicorp/consul)
+        commit_sha (str): Commit of the module
+
+    Returns:
+        str: Index folder
+    """
+    return os.path.join(index_root, module.replace("/", "__"), commit_sha)
+
+
+def save_reachability_index(index: dict, index_root: str, module: str, commit_sha: str):
+    """Persists a reachability index for (module, commit_sha)
+
+    Args:
+        index (dict): Index from build_reachability_index
+        index_root (str): Root folder of the reachability indexes
+        module (str): Module (e.g., github.com/hashicorp/consul)
+        commit_sha (str): Commit of the module
+    """
+    index_path = reachability_index_path(index_root, module, commit_sha)
+    tmp_path = f"{index_path}.tmp"
+
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    pd.DataFrame({"uniqueFunction": index["nodes"]}).to_parquet(
+        os.path.join(tmp_path, "nodes.parquet"), index=False
+    )
+    np.savez(
+        os.path.join(tmp_path, "reach.npz"),
+        component=index["component"],
+        reach_indptr=index["reach_indptr"],
+        reach_starts=index["reach_starts"],
+        reach_ends=index["reach_ends"],
+    )
+
+    # rename into place so readers never see a partial index
+    if os.path.exists(index_path):
+        shutil.rmtree(index_path)
+    os.rename(tmp_path, index_path)
+
+
+def load_reachability_index(index_root: str, module: str, commit_sha: str):
+    """Loads a persisted reachability index for (module, commit_sha)
+
+    Args:
+        index_root (str): Root folder of the reachability indexes
+        module (str): Module (e.g., github.com/hashicorp/consul)
+        commit_sha (str): Commit of the module
+
+    Returns:
+        dict: Reachability index, None if it was never built
+    """
+    index_path = reachability_index_path(index_root, module, commit_sha)
+
+    if not os.path.exists(os.path.join(index_path, "reach.npz")):
+        return None
+
+    nodes = pd.read_parquet(os.path.join(index_path, "nodes.parquet"))["uniqueFunction"]
+
+    with np.load(os.path.join(index_path, "reach.npz")) as arrays:
+        index = {x: arrays[x] for x in arrays.files}
+    index["nodes"] = pd.Index(nodes)
+
+    return index
+
+
+def get_reachability_index(
+    index_root: str, module: str, commit_sha: str, temp_cg=None
+) -> dict:
+    """Loads the reachability index of (module, commit_sha), building and saving it on first use
+
+    Args:
+        index_root (str): Root folder of the reachability indexes
+        module (str): Module (e.g., github.com/hashicorp/consul)
+        commit_sha (str): Commit of the module
+        temp_cg (pd.DataFrame or callable, optional): Call graph from call_graph.ql, or a
+            function returning it so CodeQL only runs on a miss. Defaults to None.
+
+    Returns:
+        dict: Reachability index
+    """
+    index = load_reachability_index(index_root, module, commit_sha)
+    if index is not None:
+        return index
+
+    if temp_cg is None:
+        raise FileNotFoundError(
+            f"No reachability index for {module}@{commit_sha} and no call graph to build it"
+        )
+    if callable(temp_cg):
+        temp_cg = temp_cg()
+
+    index = build_reachability_index(build_call_graph(temp_cg))
+    save_reachability_index(index, index_root, module, commit_sha)
+
+    return index
+
+
+def exported_functions(index: dict) -> list:
+    """uniqueFunction keys of exported Go functions (name starts with an upper case letter)
+
+    Args:
+        index (dict): Call graph or reachability index
+
+    Returns:
+        list: Exported uniqueFunction keys
+    """
+    nodes = pd.Series(index["nodes"])
+
+    return nodes[nodes.str[0].str.isupper().fillna(False)].tolist()
+
+
+def reachable_pairs(
+    index: dict, entry_functions: list, vulnerable_functions: list
+) -> pd.DataFrame:
+    """Looks up which vulnerable functions each entry function reaches, without a traversal.
+    An entry function that is itself vulnerable reaches itself.
+
+    Args:
+        index (dict): Index from build_reachability_index/get_reachability_index
+        entry_functions (list): uniqueFunction keys of the entry points
+        vulnerable_functions (list): uniqueFunction keys of the vulnerable functions
+
+    Returns:
+        pd.DataFrame: entryFunction and the vulnerableFunction it reaches, one row per pair
+    """
+    entry_functions = pd.unique(pd.Series(entry_functions, dtype=object))
+    vulnerable_functions = pd.unique(pd.Series(vulnerable_functions, dtype=object))
+
+    entry_ids = index["nodes"].get_indexer(entry_functions)
+    vulnerable_ids = index["nodes"].get_indexer(vulnerable_functions)
+    entry_functions = entry_functions[entry_ids >= 0]
+    entry_ids = entry_ids[entry_ids >= 0]
+    vulnerable_functions = vulnerable_functions[vulnerable_ids >= 0]
+    vulnerable_ids = vulnerable_ids[vulnerable_ids >= 0]
+
+    # vulnerable components sorted so every reach range is a searchsorted slice
+    vulnerable_components = index["component"][vulnerable_ids]
+    order = np.argsort(vulnerable_components, kind="stable")
+    vulnerable_components = vulnerable_components[order]
+    vulnerable_functions = vulnerable_functions[order]
+
+    entry_components = index["component"][entry_ids]
+    starts = index["reach_indptr"][entry_components]
+    counts = index["reach_indptr"][entry_components + 1] - starts
+    range_entry = np.repeat(np.arange(len(entry_ids)), counts)
+    range_ids = starts[range_entry] + (
+        np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    )
+
+    lo = np.searchsorted(vulnerable_components, index["reach_starts"][range_ids], side="left")
+    hi = np.searchsorted(vulnerable_components, index["reach_ends"][range_ids], side="right")
+    matches = hi - lo
+
+    pair_entry = np.repeat(range_entry, matches)
+    pair_vulnerable = np.repeat(lo, matches) + (
+        np.arange(matches.sum()) - np.repeat(np.cumsum(matches) - matches, matches)
+    )
+
+    return pd.DataFrame(
+        {
+            "entryFunction": entry_functions[pair_entry],
+            "vulnerableFunction": vulnerable_functions[pair_vulnerable],
+        }
+    )
+
+
+def is_reachable(index: dict, entry_functions: list, vulnerable_functions: list) -> bool:
+    """Checks whether any vulnerable function is reachable from any entry function
+
+    Args:
+        index (dict): Index from build_reachability_index/get_reachability_index
+        entry_functions (list): uniqueFunction keys of the entry points
+        vulnerable_functions (list): uniqueFunction keys of the vulnerable functions
+
+    Returns:
+        bool: True if at least one vulnerable function is reachable
+    """
+    return len(reachable_pairs(index, entry_functions, vulnerable_functions)) > 0
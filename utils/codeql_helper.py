@@ -3,34 +3,533 @@ CodeQL Helper Functions
 """
 import subprocess
 import os
+import json
+import time
+import uuid
+import shutil
+import fcntl
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import csv
+from functools import lru_cache
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+from . import trace_helper
 
+# custom queries shipped with the package
+QUERY_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "codeql_queries"
+)
+# generated queries sit inside the shipped pack so they resolve its locked dependencies
+GENERATED_QUERY_PATH = os.path.join(QUERY_PATH, "generated")
 
-def build_db(package_path: str, output_db_path: str):
+
+def build_db(package_path: str, output_db_path: str, threads: int = None, ram: int = None):
     """Builds a CodeQL DB
     Info: https://docs.github.com/en/code-security/codeql-cli/using-the-codeql-cli/creating-codeql-databases
 
     Args:
         package_path (str): Location of source code
         output_db_path (str): Desired output DB name from CodeQL
+        threads (int, optional): Threads CodeQL may use. Defaults to None (CodeQL default).
+        ram (int, optional): Memory CodeQL may use in MB. Defaults to None (CodeQL default).
     """
 
-    if os.path.exists(output_db_path):
+    if is_valid_db(output_db_path):
         print(f"CodeQL DB {output_db_path} already exists.")
 
     else:
         create_cmd = [
             f"codeql database create --language=go --source-root {package_path} {output_db_path} --overwrite"
+            f"{resource_args(threads, ram)}"
         ]
 
         status = subprocess.run(create_cmd, shell=True, check=True)
 
 
+def resource_args(threads: int = None, ram: int = None) -> str:
+    """CodeQL --threads/--ram arguments
+
+    Args:
+        threads (int, optional): Threads CodeQL may use. Defaults to None.
+        ram (int, optional): Memory CodeQL may use in MB. Defaults to None.
+
+    Returns:
+        str: Arguments to append to a CodeQL command, starting with a space
+    """
+    args = ""
+    if threads is not None:
+        args += f" --threads={threads}"
+    if ram is not None:
+        args += f" --ram={ram}"
+
+    return args
+
+
+@lru_cache(maxsize=None)
+def codeql_version() -> str:
+    """Version of the installed CodeQL CLI
+
+    Returns:
+        str: CodeQL version (e.g., 2.15.1)
+    """
+    return subprocess.run(
+        ["codeql", "version", "--format=terse"],
+        check=True,
+        capture_output=True,
+        encoding="utf-8",
+    ).stdout.strip()
+
+
+def is_valid_db(db_path: str) -> bool:
+    """Checks that a CodeQL DB was completely built and finalized
+
+    Args:
+        db_path (str): CodeQL DB path
+
+    Returns:
+        bool: True if the DB can be reused
+    """
+    db_yml = os.path.join(db_path, "codeql-database.yml")
+
+    if not os.path.isfile(db_yml) or not os.path.isdir(os.path.join(db_path, "db-go")):
+        return False
+
+    with open(db_yml, "r", encoding="utf-8") as f:
+        return "finalised: true" in f.read()
+
+
+def db_source_root(db_path: str) -> str:
+    """Source root a CodeQL DB was built from, the prefix of every file path in its results
+
+    A cached DB keeps the path of the checkout it was created in, which is not
+    necessarily the checkout currently in use.
+
+    Args:
+        db_path (str): CodeQL DB path
+
+    Returns:
+        str: sourceLocationPrefix of the DB ending with "/", None if it is not recorded
+    """
+    db_yml = os.path.join(db_path, "codeql-database.yml")
+
+    if not os.path.isfile(db_yml):
+        return None
+
+    with open(db_yml, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("sourceLocationPrefix:"):
+                prefix = line.split(":", 1)[1].strip().strip("\"'")
+                return prefix.rstrip("/") + "/" if prefix else None
+
+    return None
+
+
+def db_cache_key(
+    repo: str, commit_sha: str, version: str, extractor_options: dict = None
+) -> str:
+    """Content address of a CodeQL DB
+
+    Args:
+        repo (str): Repository (e.g., hashicorp/consul)
+        commit_sha (str): Commit the DB is built from
+        version (str): CodeQL CLI version
+        extractor_options (dict, optional): Extractor options used for the build. Defaults to None.
+
+    Returns:
+        str: SHA-256 hex digest of the key
+    """
+    key = json.dumps(
+        [repo, commit_sha, version, extractor_options or {}], sort_keys=True
+    )
+
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def dir_size(path: str) -> int:
+    """Total size of the files in a directory
+
+    Args:
+        path (str): Directory
+
+    Returns:
+        int: Size in bytes
+    """
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+
+    return total
+
+
+@contextmanager
+def file_lock(lock_path: str):
+    """Exclusive inter-process lock on a lock file
+
+    Args:
+        lock_path (str): Lock file location
+    """
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_db_cache_index(cache_root: str) -> dict:
+    """Reads the DB cache index, callers must hold the index lock
+
+    Args:
+        cache_root (str): Root of the CodeQL DB cache
+
+    Returns:
+        dict: {"entries": {key: metadata}, "stats": {hits, misses, evictions}}
+    """
+    index_path = os.path.join(cache_root, "index.json")
+
+    if not os.path.exists(index_path):
+        return {"entries": {}, "stats": {"hits": 0, "misses": 0, "evictions": 0}}
+
+    with open(index_path, "r") as f:
+        return json.load(f)
+
+
+def write_db_cache_index(cache_root: str, index: dict):
+    """Atomically writes the DB cache index, callers must hold the index lock
+
+    Args:
+        cache_root (str): Root of the CodeQL DB cache
+        index (dict): DB cache index
+    """
+    index_path = os.path.join(cache_root, "index.json")
+
+    with open(f"{index_path}.tmp", "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(f"{index_path}.tmp", index_path)
+
+
+def get_cached_db(
+    package_path: str,
+    repo: str,
+    commit_sha: str,
+    cache_root: str,
+    disk_budget: int = None,
+    extractor_options: dict = None,
+    threads: int = None,
+    ram: int = None,
+) -> str:
+    """Returns a CodeQL DB for (repo, commit_sha) from the managed DB cache, building it on a miss.
+    DBs are built in a temporary folder and renamed into place once finalized, a DB that
+    fails the integrity check is rebuilt. Least recently used DBs are evicted to stay
+    within disk_budget.
+
+    Args:
+        package_path (str): Location of source code, checked out at commit_sha
+        repo (str): Repository (e.g., hashicorp/consul)
+        commit_sha (str): Commit the source code is checked out at
+        cache_root (str): Root of the CodeQL DB cache
+        disk_budget (int, optional): Maximum size of the cache in bytes. Defaults to None (no limit).
+        extractor_options (dict, optional): Go extractor options passed with
+            --extractor-option. Defaults to None.
+        threads (int, optional): Threads CodeQL may use, not part of the key. Defaults to None.
+        ram (int, optional): Memory CodeQL may use in MB, not part of the key. Defaults to None.
+
+    Returns:
+        str: Path of the CodeQL DB
+    """
+    for folder in ["dbs", "tmp", "locks"]:
+        os.makedirs(os.path.join(cache_root, folder), exist_ok=True)
+
+    key = db_cache_key(repo, commit_sha, codeql_version(), extractor_options)
+    db_path = os.path.join(cache_root, "dbs", key)
+    index_lock = os.path.join(cache_root, "index.lock")
+
+    # one build per key at a time, concurrent callers wait and reuse it
+    with file_lock(os.path.join(cache_root, "locks", f"{key}.lock")):
+        hit = is_valid_db(db_path)
+        trace_helper.record_cache("codeql_db", hits=int(hit), misses=int(not hit), key=key)
+
+        if not hit:
+            print(f"CodeQL DB cache miss: {repo}@{commit_sha}")
+            tmp_path = os.path.join(cache_root, "tmp", f"{key}.{uuid.uuid4().hex}")
+
+            create_cmd = [
+                "codeql",
+                "database",
+                "create",
+                "--language=go",
+                f"--source-root={package_path}",
+                tmp_path,
+                "--overwrite",
+            ]
+            for option, value in (extractor_options or {}).items():
+                create_cmd.append(f"--extractor-option={option}={value}")
+            create_cmd.extend(resource_args(threads, ram).split())
+
+            try:
+                subprocess.run(create_cmd, check=True)
+
+                if not is_valid_db(tmp_path):
+                    raise RuntimeError(f"CodeQL DB for {repo}@{commit_sha} was not finalized")
+
+                # replace a corrupt/partial DB, then finalize by renaming
+                if os.path.exists(db_path):
+                    shutil.rmtree(db_path)
+                os.rename(tmp_path, db_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+
+        with file_lock(index_lock):
+            index = read_db_cache_index(cache_root)
+            index["stats"]["hits" if hit else "misses"] += 1
+
+            entry = index["entries"].get(key, {})
+            if not hit or "size" not in entry:
+                entry = {
+                    "repo": repo,
+                    "commit_sha": commit_sha,
+                    "codeql_version": codeql_version(),
+                    "extractor_options": extractor_options or {},
+                    "size": dir_size(db_path),
+                    "created": time.time(),
+                }
+            entry["last_used"] = time.time()
+            index["entries"][key] = entry
+
+            write_db_cache_index(cache_root, index)
+
+    if disk_budget is not None:
+        evict_db_cache(cache_root, disk_budget, keep=[key])
+
+    return db_path
+
+
+def total_memory_mb() -> int:
+    """Physical memory of the machine
+
+    Returns:
+        int: Memory in MB
+    """
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+
+
+class ResourceBudget:
+    """Global thread/RAM budget shared by concurrent CodeQL builds"""
+
+    def __init__(self, threads: int, ram: int):
+        self.threads = threads
+        self.ram = ram
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, threads: int, ram: int):
+        """Blocks until threads/ram are available and holds them for the block
+
+        Args:
+            threads (int): Threads to reserve
+            ram (int): Memory to reserve in MB
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.threads >= threads and self.ram >= ram)
+            self.threads -= threads
+            self.ram -= ram
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.threads += threads
+                self.ram += ram
+                self.condition.notify_all()
+
+
+def build_dbs(
+    jobs: list,
+    total_threads: int = None,
+    total_ram: int = None,
+    threads_per_job: int = 4,
+    ram_per_job: int = 8192,
+    cache_root: str = None,
+    disk_budget: int = None,
+) -> pd.DataFrame:
+    """Builds many CodeQL DBs concurrently within a global thread and RAM budget.
+    Every build gets its own --threads/--ram limits, identical jobs are built once and
+    a failing job does not stop the rest of the batch.
+
+    Args:
+        jobs (list): Dicts with package_path, repo, commit_sha and either output_db_path or
+            a cache_root to build into. Optional keys: threads, ram, extractor_options
+        total_threads (int, optional): Threads shared by all builds. Defaults to os.cpu_count().
+        total_ram (int, optional): Memory shared by all builds in MB. Defaults to the physical memory.
+        threads_per_job (int, optional): Default threads per build. Defaults to 4.
+        ram_per_job (int, optional): Default memory per build in MB. Defaults to 8192.
+        cache_root (str, optional): Build through the managed DB cache (get_cached_db).
+            Defaults to None.
+        disk_budget (int, optional): Disk budget of the managed DB cache in bytes. Defaults to None.
+
+    Returns:
+        pd.DataFrame: One row per unique job with db_path, status, error and seconds
+    """
+    total_threads = total_threads or os.cpu_count()
+    total_ram = total_ram or total_memory_mb()
+    budget = ResourceBudget(total_threads, total_ram)
+
+    # identical jobs are only built once
+    unique_jobs = {}
+    for job in jobs:
+        key = (
+            job["repo"],
+            job["commit_sha"],
+            job.get("output_db_path"),
+            json.dumps(job.get("extractor_options") or {}, sort_keys=True),
+        )
+        unique_jobs.setdefault(key, job)
+    unique_jobs = list(unique_jobs.values())
+
+    progress = {"done": 0}
+    progress_lock = threading.Lock()
+
+    def run_job(job: dict) -> dict:
+        threads = min(job.get("threads", threads_per_job), total_threads)
+        ram = min(job.get("ram", ram_per_job), total_ram)
+
+        result = {
+            "repo": job["repo"],
+            "commit_sha": job["commit_sha"],
+            "db_path": job.get("output_db_path"),
+            "status": "built",
+            "error": None,
+            "seconds": None,
+        }
+
+        with budget.reserve(threads, ram):
+            start = time.time()
+            try:
+                if cache_root is not None:
+                    result["db_path"] = get_cached_db(
+                        package_path=job["package_path"],
+                        repo=job["repo"],
+                        commit_sha=job["commit_sha"],
+                        cache_root=cache_root,
+                        disk_budget=disk_budget,
+                        extractor_options=job.get("extractor_options"),
+                        threads=threads,
+                        ram=ram,
+                    )
+                else:
+                    build_db(
+                        package_path=job["package_path"],
+                        output_db_path=job["output_db_path"],
+                        threads=threads,
+                        ram=ram,
+                    )
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = str(e)
+            result["seconds"] = time.time() - start
+
+        with progress_lock:
+            progress["done"] += 1
+            print(
+                f"[{progress['done']}/{len(unique_jobs)}] {job['repo']}@{job['commit_sha']} "
+                f"{result['status']} ({result['seconds']:.1f}s)"
+            )
+
+        return result
+
+    # threads only wait on the budget, the builds themselves are CodeQL processes
+    with ThreadPoolExecutor(max_workers=max(1, min(len(unique_jobs), total_threads))) as executor:
+        results = list(executor.map(run_job, unique_jobs))
+
+    return pd.DataFrame(
+        results, columns=["repo", "commit_sha", "db_path", "status", "error", "seconds"]
+    )
+
+
+def evict_db_cache(cache_root: str, disk_budget: int, keep: list = None) -> list:
+    """Evicts least recently used CodeQL DBs until the cache fits within disk_budget
+
+    Args:
+        cache_root (str): Root of the CodeQL DB cache
+        disk_budget (int): Maximum size of the cache in bytes
+        keep (list, optional): Cache keys that must not be evicted. Defaults to None.
+
+    Returns:
+        list: Evicted cache keys
+    """
+    keep = set(keep or [])
+    evicted = []
+
+    with file_lock(os.path.join(cache_root, "index.lock")):
+        index = read_db_cache_index(cache_root)
+        entries = index["entries"]
+
+        total = sum(x["size"] for x in entries.values())
+        for key, entry in sorted(entries.items(), key=lambda x: x[1]["last_used"]):
+            if total <= disk_budget:
+                break
+            if key in keep:
+                continue
+
+            # skip DBs that are being rebuilt by another process
+            key_lock = os.path.join(cache_root, "locks", f"{key}.lock")
+            with open(key_lock, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    shutil.rmtree(os.path.join(cache_root, "dbs", key), ignore_errors=True)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            total -= entry["size"]
+            evicted.append(key)
+
+        for key in evicted:
+            del entries[key]
+        index["stats"]["evictions"] += len(evicted)
+
+        write_db_cache_index(cache_root, index)
+
+    return evicted
+
+
+def db_cache_stats(cache_root: str) -> dict:
+    """Hit/miss/eviction statistics and size of the CodeQL DB cache
+
+    Args:
+        cache_root (str): Root of the CodeQL DB cache
+
+    Returns:
+        dict: Cache statistics
+    """
+    with file_lock(os.path.join(cache_root, "index.lock")):
+        index = read_db_cache_index(cache_root)
+
+    stats = dict(index["stats"])
+    stats["dbs"] = len(index["entries"])
+    stats["size"] = sum(x["size"] for x in index["entries"].values())
+
+    return stats
+
+
 def run_codeql(
     output_db_path: str,
     output_file_name: str,
     custom_query_path: str,
     return_results=True,
+    typed=False,
 ):
     """Runs a CodeQL query and decodes the bqrs output from the query. Saves results to a CSV.
     Info: https://docs.github.com/en/code-security/codeql-cli/codeql-cli-manual/query-run
@@ -40,6 +539,8 @@ def run_codeql(
         output_file_name (str): Desired output query result filename
         custom_query_path (str): Path to custom query
         return_results (bool, optional): Option to return CSV results in a pd.DataFrame. Defaults to True.
+        typed (bool, optional): Decode straight to typed columns and save a Parquet file
+            instead of a CSV, see decode_bqrs. Defaults to False.
 
     Returns:
         pd.DataFrame: Results from custom query
@@ -52,6 +553,13 @@ def run_codeql(
 
     run_process = subprocess.run(run_cmd, shell=True, check=True)
 
+    if typed:
+        return decode_bqrs(
+            bqrs_path=f"{output_file_name}.bqrs",
+            parquet_path=f"{output_file_name}.parquet",
+            return_results=return_results,
+        )
+
     # decode the query output from bqrs type to csv
     decode_cmd = [
         f"codeql bqrs decode {output_file_name}.bqrs --format=csv --output={output_file_name}.csv"
@@ -66,65 +574,531 @@ def run_codeql(
         return results
 
 
-def custom_function_extractor_query(
-    output_query_name: str, target_file: str, target_line: str
+def result_dtypes(columns: list) -> dict:
+    """Compact dtypes for CodeQL result columns.
+    Line numbers become Int32, paths/names/locations are dictionary encoded.
+
+    Args:
+        columns (list): Result set column names
+
+    Returns:
+        dict: {column: dtype}
+    """
+    return {x: "Int32" if "Line" in x else "category" for x in columns}
+
+
+def iter_bqrs_chunks(bqrs_path: str, chunksize: int = 1_000_000, result_set: str = None):
+    """Streams a BQRS result set as typed DataFrame chunks without writing a CSV to disk
+
+    Args:
+        bqrs_path (str): BQRS file from a CodeQL query
+        chunksize (int, optional): Rows per chunk. Defaults to 1_000_000.
+        result_set (str, optional): Result set to decode. Defaults to None (the first one).
+
+    Yields:
+        pd.DataFrame: Typed chunk of the result set
+    """
+    decode_cmd = ["codeql", "bqrs", "decode", "--format=csv", bqrs_path]
+    if result_set is not None:
+        decode_cmd.insert(3, f"--result-set={result_set}")
+
+    with subprocess.Popen(
+        decode_cmd, stdout=subprocess.PIPE, encoding="utf-8"
+    ) as decode_process:
+        # the header sets the dtypes of every chunk
+        header = decode_process.stdout.readline()
+        if header:
+            columns = next(csv.reader([header]))
+
+            for chunk in pd.read_csv(
+                decode_process.stdout,
+                names=columns,
+                header=None,
+                dtype=result_dtypes(columns),
+                chunksize=chunksize,
+            ):
+                yield chunk
+
+    if decode_process.returncode != 0:
+        raise subprocess.CalledProcessError(decode_process.returncode, decode_cmd)
+
+
+def concat_typed_chunks(chunks: list) -> pd.DataFrame:
+    """Concatenates typed chunks, merging the categories of dictionary encoded columns
+
+    Args:
+        chunks (list): Typed DataFrame chunks
+
+    Returns:
+        pd.DataFrame: Single typed DataFrame
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+
+    results = pd.concat(chunks, ignore_index=True)
+
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            # an all-null chunk has empty float categories, the others strings
+            results[column] = union_categoricals(
+                [
+                    x[column].cat.rename_categories(x[column].cat.categories.astype(str))
+                    for x in chunks
+                ]
+            )
+
+    return results
+
+
+def decode_bqrs(
+    bqrs_path: str,
+    parquet_path: str = None,
+    return_results=True,
+    chunksize: int = 1_000_000,
+    result_set: str = None,
 ):
-    """Generates a new function extractor query based on the target file/line parameters.
+    """Decodes a BQRS result set to typed columns, optionally saving it to Parquet.
+    Huge result sets are streamed in chunks, with return_results=False only one chunk is
+    held in memory while writing the Parquet file.
 
     Args:
-        output_query_name (str): Name of new query file to generate
-        target_file (str): Target file path to extract function
-        target_line (str): Target line number to extract function
+        bqrs_path (str): BQRS file from a CodeQL query
+        parquet_path (str, optional): Parquet output location. Defaults to None.
+        return_results (bool, optional): Option to return the results. Defaults to True.
+        chunksize (int, optional): Rows per decoded chunk. Defaults to 1_000_000.
+        result_set (str, optional): Result set to decode. Defaults to None (the first one).
+
+    Returns:
+        pd.DataFrame: Typed results
     """
+    chunks = []
+    writer = None
 
-    template = open(
-        "/home/tad/Documents/GitHub/summer-research-23/code/go-vulnerable-symbol-analysis/codeql_queries/function_extractor.ql",
-        "r",
-        encoding="utf-8",
-    ).read()
+    try:
+        for chunk in iter_bqrs_chunks(bqrs_path, chunksize=chunksize, result_set=result_set):
+            if parquet_path is not None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    # the schema follows result_dtypes, not the values of the first chunk
+                    # (an all-null column would fix its type to null), int32 dictionary
+                    # indices so chunks of any cardinality share it
+                    schema = pa.schema(
+                        [
+                            pa.field(
+                                column,
+                                pa.int32()
+                                if dtype == "Int32"
+                                else pa.dictionary(pa.int32(), pa.string()),
+                            )
+                            for column, dtype in result_dtypes(chunk.columns).items()
+                        ],
+                        metadata=table.schema.metadata,
+                    )
+                    writer = pq.ParquetWriter(f"{parquet_path}.tmp", schema)
+                writer.write_table(table.cast(writer.schema))
 
-    update_template = template.replace("LINE_NUMBER", str(target_line))
-    update_template = update_template.replace("FILE_NAME", target_file)
+            if return_results:
+                chunks.append(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
 
-    # write new updated query
-    update_query = open(
-        f"/home/tad/Documents/GitHub/summer-research-23/code/go-vulnerable-symbol-analysis/codeql_queries/custom_queries/{output_query_name}.ql",
-        "w",
-        encoding="utf-8",
-    )
-    update_query.write(update_template)
-    update_query.close()
+    if parquet_path is not None and writer is not None:
+        os.replace(f"{parquet_path}.tmp", parquet_path)
 
-    print(
-        f"New query written to: ./code/go-vulnerable-symbol-analysis/codeql_queries/custom_queries/{output_query_name}.ql"
-    )
+    if return_results:
+        if len(chunks) == 0:
+            return pd.DataFrame()
+        return concat_typed_chunks(chunks)
 
 
-def custom_extract_functions_in_file_query(output_query_name: str, target_file: str):
-    """Generates a new function extractor query based on the target file/line parameters.
+def load_results(parquet_path: str) -> pd.DataFrame:
+    """Reloads typed query results saved by decode_bqrs, no parsing or type inference needed
 
     Args:
-        output_query_name (str): Name of new query file to generate
-        target_file (str): Target file path to extract function
+        parquet_path (str): Parquet file from decode_bqrs
+
+    Returns:
+        pd.DataFrame: Typed results
     """
+    return pd.read_parquet(parquet_path)
 
-    template = open(
-        "/home/tad/Documents/GitHub/summer-research-23/code/go-vulnerable-symbol-analysis/codeql_queries/extract_functions_in_file.ql",
-        "r",
-        encoding="utf-8",
-    ).read()
 
-    update_template = template.replace("FILE_NAME", str(target_file))
+def find_query_pack(query_path: str):
+    """Finds the CodeQL pack that contains a query
 
-    # write new updated query
-    update_query = open(
-        f"/home/tad/Documents/GitHub/summer-research-23/code/go-vulnerable-symbol-analysis/codeql_queries/custom_queries/{output_query_name}.ql",
-        "w",
-        encoding="utf-8",
+    Args:
+        query_path (str): Path to a .ql query
+
+    Returns:
+        (str, str): Pack name from qlpack.yml, query path relative to the pack root
+    """
+    query_path = os.path.abspath(query_path)
+    pack_root = os.path.dirname(query_path)
+
+    while not os.path.exists(os.path.join(pack_root, "qlpack.yml")):
+        parent = os.path.dirname(pack_root)
+        if parent == pack_root:
+            raise FileNotFoundError(f"No qlpack.yml found for {query_path}")
+        pack_root = parent
+
+    with open(os.path.join(pack_root, "qlpack.yml"), "r", encoding="utf-8") as f:
+        pack_name = [
+            x.split(":", 1)[1].strip() for x in f if x.startswith("name:")
+        ][0]
+
+    return pack_name, os.path.relpath(query_path, pack_root)
+
+
+def run_codeql_queries(
+    output_db_path: str,
+    output_file_name: str,
+    custom_query_paths: list,
+    return_results=True,
+    threads: int = 0,
+    ram: int = None,
+    compilation_cache: str = None,
+    typed=False,
+) -> dict:
+    """Runs several CodeQL queries against one DB in a single CodeQL invocation
+    (one JVM startup and DB open) and decodes every result set.
+    Info: https://docs.github.com/en/code-security/codeql-cli/codeql-cli-manual/database-run-queries
+
+    codeql bqrs decode takes a single BQRS file, so decoding still starts one CLI
+    process (about a second of JVM startup) per query on top of the shared run.
+
+    Args:
+        output_db_path (str): Built DB path from CodeQL
+        output_file_name (str): Prefix of the query result files, each query writes
+            {output_file_name}__{query name}.bqrs/.csv with "/" in the query name as "__"
+        custom_query_paths (list): Paths to custom queries, all within a CodeQL pack
+        return_results (bool, optional): Option to return CSV results. Defaults to True.
+        threads (int, optional): Evaluator threads, 0 uses one per core. Defaults to 0.
+        ram (int, optional): Evaluator memory in MB. Defaults to None (CodeQL default).
+        compilation_cache (str, optional): Shared compiled query cache directory, reused
+            across DBs. Defaults to None.
+        typed (bool, optional): Decode straight to typed columns and save Parquet files
+            instead of CSVs, see decode_bqrs. Defaults to False.
+
+    Returns:
+        dict: {query name: pd.DataFrame} of the query results, the query name is its path
+            relative to the pack root without .ql (e.g., call_graph)
+    """
+    # run-queries writes results/<pack name>/<query path>.bqrs inside the DB
+    queries = {}
+    for query_path in custom_query_paths:
+        pack_name, relative_query = find_query_pack(query_path)
+        query_name = os.path.splitext(relative_query)[0].replace(os.sep, "/")
+        if query_name in queries:
+            raise ValueError(
+                f"Queries {queries[query_name][0]} and {query_path} share the result name {query_name}"
+            )
+        queries[query_name] = (query_path, pack_name, relative_query)
+
+    run_cmd = [
+        "codeql",
+        "database",
+        "run-queries",
+        f"--threads={threads}",
+        output_db_path,
+    ] + list(custom_query_paths)
+    if ram is not None:
+        run_cmd.insert(4, f"--ram={ram}")
+    if compilation_cache is not None:
+        run_cmd.insert(4, f"--compilation-cache={compilation_cache}")
+
+    subprocess.run(run_cmd, check=True)
+
+    results = {}
+    for query_name, (query_path, pack_name, relative_query) in queries.items():
+        db_bqrs = os.path.join(
+            output_db_path,
+            "results",
+            pack_name,
+            f"{os.path.splitext(relative_query)[0]}.bqrs",
+        )
+
+        query_output = f"{output_file_name}__{query_name.replace('/', '__')}"
+        shutil.copyfile(db_bqrs, f"{query_output}.bqrs")
+
+        if typed:
+            query_results = decode_bqrs(
+                bqrs_path=f"{query_output}.bqrs",
+                parquet_path=f"{query_output}.parquet",
+                return_results=return_results,
+            )
+            if return_results:
+                results[query_name] = query_results
+            continue
+
+        # decode the query output from bqrs type to csv
+        decode_cmd = [
+            "codeql",
+            "bqrs",
+            "decode",
+            f"{query_output}.bqrs",
+            "--format=csv",
+            f"--output={query_output}.csv",
+        ]
+        subprocess.run(decode_cmd, check=True)
+
+        if return_results:
+            results[query_name] = pd.read_csv(f"{query_output}.csv")
+
+    return results
+
+
+def generate_query(template_name: str) -> str:
+    """Copies a query template from codeql_queries into the generated workspace, under a
+    folder named by the hash of the template. Per-commit targets are passed as external
+    predicates rather than written into the query, so the query text and its hash stay
+    the same across commits and an edited template gets a fresh folder.
+
+    Args:
+        template_name (str): Template file name without .ql (e.g., function_extractor)
+
+    Returns:
+        str: Path of the generated query
+    """
+    with open(os.path.join(QUERY_PATH, f"{template_name}.ql"), "rb") as f:
+        template = f.read()
+
+    query_dir = os.path.join(GENERATED_QUERY_PATH, hashlib.sha256(template).hexdigest()[:16])
+    query_path = os.path.join(query_dir, f"{template_name}.ql")
+
+    if not os.path.exists(query_path):
+        os.makedirs(query_dir, exist_ok=True)
+        tmp_path = f"{query_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(template)
+        os.replace(tmp_path, query_path)
+
+    return query_path
+
+
+def compile_query(query_path: str, compilation_cache: str = None) -> str:
+    """Compiles a generated query once per template hash, later runs reuse the compiled
+    query from the compilation cache
+
+    Args:
+        query_path (str): Query from generate_query
+        compilation_cache (str, optional): Compilation cache directory. Defaults to None
+            (a cache in the folder of the generated query).
+
+    Returns:
+        str: Compilation cache directory to run the query with
+    """
+    query_dir = os.path.dirname(query_path)
+    compilation_cache = compilation_cache or os.path.join(query_dir, "compilation-cache")
+    cache_id = hashlib.sha256(os.path.abspath(compilation_cache).encode()).hexdigest()[:8]
+    marker = os.path.join(query_dir, f".compiled-{cache_id}")
+
+    with file_lock(os.path.join(query_dir, ".compile.lock")):
+        hit = os.path.exists(marker)
+        trace_helper.record_cache("compiled_query", hits=int(hit), misses=int(not hit))
+        if not hit:
+            subprocess.run(
+                [
+                    "codeql",
+                    "query",
+                    "compile",
+                    f"--compilation-cache={compilation_cache}",
+                    query_path,
+                ],
+                check=True,
+            )
+            open(marker, "w").close()
+
+    return compilation_cache
+
+
+def run_parameterized_query(
+    output_db_path: str,
+    output_file_name: str,
+    template_name: str,
+    externals: dict,
+    return_results=True,
+    threads: int = 0,
+    ram: int = None,
+    typed=False,
+):
+    """Runs a query template once for all its targets, the targets are rows of the
+    template's external predicates
+    Info: https://docs.github.com/en/code-security/codeql-cli/codeql-cli-manual/query-run
+
+    Args:
+        output_db_path (str): Built DB path from CodeQL
+        output_file_name (str): Desired output query result filename
+        template_name (str): Template in codeql_queries without .ql
+        externals (dict): {external predicate: list of row tuples}
+        return_results (bool, optional): Option to return the results. Defaults to True.
+        threads (int, optional): Evaluator threads, 0 uses one per core. Defaults to 0.
+        ram (int, optional): Evaluator memory in MB. Defaults to None (CodeQL default).
+        typed (bool, optional): Decode straight to typed columns and save a Parquet file
+            instead of a CSV, see decode_bqrs. Defaults to False.
+
+    Returns:
+        pd.DataFrame: Results from the query
+    """
+    query_path = generate_query(template_name)
+    compilation_cache = compile_query(query_path)
+
+    with tempfile.TemporaryDirectory() as external_path:
+        run_cmd = [
+            "codeql",
+            "query",
+            "run",
+            f"--database={output_db_path}",
+            f"--threads={threads}",
+            f"--compilation-cache={compilation_cache}",
+            f"--output={output_file_name}.bqrs",
+        ]
+        if ram is not None:
+            run_cmd.append(f"--ram={ram}")
+
+        # external predicates are read from headerless CSVs
+        for predicate, rows in externals.items():
+            csv_path = os.path.join(external_path, f"{predicate}.csv")
+            with open(csv_path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(rows)
+            run_cmd.append(f"--external={predicate}={csv_path}")
+
+        run_cmd.append(query_path)
+        subprocess.run(run_cmd, check=True)
+
+    if typed:
+        return decode_bqrs(
+            bqrs_path=f"{output_file_name}.bqrs",
+            parquet_path=f"{output_file_name}.parquet",
+            return_results=return_results,
+        )
+
+    decode_cmd = [
+        "codeql",
+        "bqrs",
+        "decode",
+        f"{output_file_name}.bqrs",
+        "--format=csv",
+        f"--output={output_file_name}.csv",
+    ]
+    subprocess.run(decode_cmd, check=True)
+
+    if return_results:
+        return pd.read_csv(f"{output_file_name}.csv")
+
+
+def extract_functions_at_lines(
+    output_db_path: str,
+    output_file_name: str,
+    changed_files: pd.DataFrame,
+    lines_column: str = "new_modified_lines",
+    file_column: str = "file_name",
+    **options,
+) -> pd.DataFrame:
+    """Extracts the functions enclosing every changed line of a commit with one evaluation
+    of function_extractor.ql, however many files and lines changed
+
+    Args:
+        output_db_path (str): Built DB path from CodeQL, its source root is the repository root
+        output_file_name (str): Desired output query result filename
+        changed_files (pd.DataFrame): Output of git_diff(df=True), or the grouped changed_files
+        lines_column (str, optional): Column holding the changed line numbers.
+            Defaults to "new_modified_lines".
+        file_column (str, optional): Column holding the repo-relative file name. Defaults to "file_name".
+        **options: return_results, threads, ram and typed of run_parameterized_query
+
+    Returns:
+        pd.DataFrame: extract_functions_module.ql columns plus the targetFile/targetLine they enclose
+    """
+    pairs = changed_files[[file_column, lines_column]]
+
+    # only list-like entries hold line numbers (see git_helper.match_functions)
+    pairs = pairs[pairs[lines_column].map(lambda x: isinstance(x, (list, tuple, np.ndarray)))]
+    pairs = pairs.explode(lines_column).dropna()
+    rows = sorted({(str(file), int(line)) for file, line in pairs.itertuples(index=False)})
+
+    if len(rows) == 0:
+        return pd.DataFrame()
+
+    return run_parameterized_query(
+        output_db_path=output_db_path,
+        output_file_name=output_file_name,
+        template_name="function_extractor",
+        externals={"targetLine": rows},
+        **options,
     )
-    update_query.write(update_template)
-    update_query.close()
 
-    print(
-        f"New query written to: ./code/go-vulnerable-symbol-analysis/codeql_queries/custom_queries/{output_query_name}.ql"
+
+def extract_functions_in_files(
+    output_db_path: str, output_file_name: str, file_names: list, **options
+) -> pd.DataFrame:
+    """Extracts every function of a set of files with one evaluation of extract_functions_in_file.ql
+
+    Args:
+        output_db_path (str): Built DB path from CodeQL, its source root is the repository root
+        output_file_name (str): Desired output query result filename
+        file_names (list): Repo-relative file names
+        **options: return_results, threads, ram and typed of run_parameterized_query
+
+    Returns:
+        pd.DataFrame: extract_functions_module.ql columns plus the targetFile they are in
+    """
+    rows = sorted({(str(x),) for x in file_names})
+
+    if len(rows) == 0:
+        return pd.DataFrame()
+
+    return run_parameterized_query(
+        output_db_path=output_db_path,
+        output_file_name=output_file_name,
+        template_name="extract_functions_in_file",
+        externals={"targetFile": rows},
+        **options,
     )
+
+
+def custom_function_extractor_query(
+    output_query_name: str, target_file: str, target_line: str
+):
+    """Generates the function extractor query and its targetLine rows for one file/line.
+    extract_functions_at_lines covers every changed line of a commit in one evaluation.
+
+    Args:
+        output_query_name (str): Name of the targetLine CSV to generate
+        target_file (str): Target file path (repo-relative) to extract function
+        target_line (str): Target line number to extract function
+
+    Returns:
+        (str, str): Generated query path, external CSV for --external=targetLine=<csv>
+    """
+    query_path = generate_query("function_extractor")
+    csv_path = os.path.join(os.path.dirname(query_path), f"{output_query_name}.csv")
+
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([target_file, int(target_line)])
+
+    print(f"New query written to: {query_path} (--external=targetLine={csv_path})")
+
+    return query_path, csv_path
+
+
+def custom_extract_functions_in_file_query(output_query_name: str, target_file: str):
+    """Generates the extract functions in file query and its targetFile rows for one file.
+    extract_functions_in_files covers every file of a commit in one evaluation.
+
+    Args:
+        output_query_name (str): Name of the targetFile CSV to generate
+        target_file (str): Target file path (repo-relative) to extract function
+
+    Returns:
+        (str, str): Generated query path, external CSV for --external=targetFile=<csv>
+    """
+    query_path = generate_query("extract_functions_in_file")
+    csv_path = os.path.join(os.path.dirname(query_path), f"{output_query_name}.csv")
+
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([target_file])
+
+    print(f"New query written to: {query_path} (--external=targetFile={csv_path})")
+
+    return query_path, csv_path
@@ -2,61 +2,217 @@
 Helper git functions
 """
 import os
+import re
+import shutil
 import git
 import patchparser
 import subprocess
 import pandas as pd
-from packaging.version import Version, parse
+import numpy as np
 import datetime
+import threading
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from .version_helper import version_keys
+from . import trace_helper
 
 
-def clone_repo(repo_owner: str, repo_name: str, clone_path: str, local_name=False):
+# base url of the remotes, a file:// url can be used for local remotes
+GITHUB_URL = "https://github.com/"
+
+# clone strategies supported by clone_repo
+CLONE_STRATEGIES = ["full", "blobless", "mirror", "shallow"]
+
+# one lock per mirror so concurrent clones do not update the same mirror twice
+mirror_locks = defaultdict(threading.Lock)
+
+
+def repo_url(repo_owner: str, repo_name: str, base_url: str = GITHUB_URL) -> str:
+    """Remote url of a repository
+
+    Args:
+        repo_owner (str): GitHub Repo Owner
+        repo_name (str): GitHub Repo Project Name
+        base_url (str, optional): Base url of the remote. Defaults to GITHUB_URL.
+
+    Returns:
+        str: Remote url
+    """
+    return f"{base_url}{repo_owner}/{repo_name.replace('.git', '')}.git"
+
+
+def clone_repo(
+    repo_owner: str,
+    repo_name: str,
+    clone_path: str,
+    local_name=False,
+    strategy: str = "full",
+    mirror_path: str = None,
+    commit_shas: list = None,
+    base_url: str = GITHUB_URL,
+):
     """Clones a GitHub repository to a desired location
 
+    Strategies:
+        full: complete clone of the whole history
+        blobless: partial clone (--filter=blob:none), file contents are fetched on checkout
+        mirror: clone that borrows its objects from a shared bare mirror in mirror_path
+        shallow: only fetches commit_shas and their parents (--depth=2)
+
     Args:
         repo_owner (str): GitHub Repo Owner
         repo_name (str): GitHub Repo Project Name
         clone_path (str): Desired location to clone repository
         local_name (bool): Use a differnt local folder name
+        strategy (str, optional): One of CLONE_STRATEGIES. Defaults to "full".
+        mirror_path (str, optional): Location of the shared mirror cache, required for "mirror".
+            Defaults to None.
+        commit_shas (list, optional): Commits to fetch, required for "shallow". Defaults to None.
+        base_url (str, optional): Base url of the remote. Defaults to GITHUB_URL.
     """
+    if strategy not in CLONE_STRATEGIES:
+        raise ValueError(f"Unknown clone strategy {strategy}, expected one of {CLONE_STRATEGIES}")
+    if strategy == "mirror" and mirror_path is None:
+        raise ValueError("The mirror strategy requires a mirror_path")
+    if strategy == "shallow" and not commit_shas:
+        raise ValueError("The shallow strategy requires commit_shas")
+
     # set path
     if not local_name:
         clone_path = f"{clone_path}{repo_owner}/"
+        target_path = f"{clone_path}{repo_name.replace('.git', '')}"
     else:
         clone_path = f"{clone_path}"
+        target_path = f"{clone_path}{local_name}"
 
     if not os.path.exists(clone_path):
-        os.makedirs(clone_path)
+        os.makedirs(clone_path, exist_ok=True)
 
-    if not local_name:
-        # check if clone already exists
-        if os.path.exists(f"{clone_path}{repo_name}"):
-            print(f"Path already exists: {clone_path}{repo_name}")
-        else:
-            print(f"Cloning repo to: {clone_path}{repo_name}")
-            try:
-                git.Git(clone_path).clone(
-                    f"https://github.com/{repo_owner}/"
-                    f"{repo_name.replace('.git', '')}.git"
-                )
+    url = repo_url(repo_owner, repo_name, base_url)
 
-                return True
+    # check if clone already exists
+    if os.path.exists(target_path):
+        print(f"Path already exists: {target_path}")
+        if strategy == "shallow":
+            try:
+                fetch_commits(target_path, commit_shas)
             except Exception as e:
+                # the existing clone is missing commit_shas
                 print(e)
                 return False
+        return None
+
+    print(f"Cloning repo to: {target_path}")
+    try:
+        if strategy == "full":
+            git.Git(clone_path).clone(url, target_path)
+        elif strategy == "blobless":
+            git.Git(clone_path).clone("--filter=blob:none", url, target_path)
+        elif strategy == "mirror":
+            mirror = update_mirror(repo_owner, repo_name, mirror_path, base_url)
+            git.Git(clone_path).clone("--reference", mirror, url, target_path)
+        elif strategy == "shallow":
+            repo = git.Repo.init(target_path)
+            repo.create_remote("origin", url)
+            try:
+                fetch_commits(target_path, commit_shas)
+            except Exception:
+                # git clone cleans up after itself, the manual init does not
+                shutil.rmtree(target_path, ignore_errors=True)
+                raise
 
-    else:  # specific local folder name
-        # check if clone already exists
-        if os.path.exists(f"{clone_path}{local_name}"):
-            print(f"Path already exists: {clone_path}{local_name}")
+        return True
+    except Exception as e:
+        print(e)
+        return False
+
+
+def update_mirror(
+    repo_owner: str, repo_name: str, mirror_path: str, base_url: str = GITHUB_URL
+) -> str:
+    """Creates or refreshes the shared bare mirror of a repository
+
+    Args:
+        repo_owner (str): GitHub Repo Owner
+        repo_name (str): GitHub Repo Project Name
+        mirror_path (str): Location of the shared mirror cache
+        base_url (str, optional): Base url of the remote. Defaults to GITHUB_URL.
+
+    Returns:
+        str: Path of the bare mirror
+    """
+    mirror = f"{mirror_path}{repo_owner}/{repo_name.replace('.git', '')}.git"
+
+    with mirror_locks[mirror]:
+        if os.path.exists(mirror):
+            git.Git(mirror).remote("update", "--prune")
         else:
-            # clone repo
-            print(f"Cloning repo to: {clone_path}{local_name}")
-            git.Git(clone_path).clone(
-                f"https://github.com/{repo_owner}/"
-                f"{repo_name.replace('.git', '')}.git"
+            os.makedirs(os.path.dirname(mirror), exist_ok=True)
+            git.Git(os.path.dirname(mirror)).clone(
+                "--mirror", repo_url(repo_owner, repo_name, base_url), mirror
             )
 
+    return mirror
+
+
+def fetch_commits(clone_path: str, commit_shas: list, depth: int = 2):
+    """Fetches specific commits and their parents into a (shallow) clone
+
+    Args:
+        clone_path (str): Location of source code
+        commit_shas (list): Commits to fetch
+        depth (int, optional): History depth per commit, 2 includes the parent. Defaults to 2.
+    """
+    repo = git.Repo(clone_path)
+
+    # skip commits whose parents are already present
+    missing = []
+    for commit_sha in commit_shas:
+        try:
+            repo.git.cat_file("-e", f"{commit_sha}^{{commit}}")
+            if depth < 2 or repo.commit(commit_sha).parents:
+                continue
+        except git.GitCommandError:
+            pass
+        missing.append(commit_sha)
+
+    if missing:
+        repo.git.fetch(f"--depth={depth}", "origin", *missing)
+
+
+def clone_repos(
+    repos: list, clone_path: str, max_workers: int = 4, **clone_options
+) -> pd.DataFrame:
+    """Clones many repositories with a bounded thread pool
+
+    Args:
+        repos (list): Dicts with repo_owner, repo_name and optionally commit_shas/local_name
+        clone_path (str): Desired location to clone repositories
+        max_workers (int, optional): Concurrent clones. Defaults to 4.
+        **clone_options: strategy, mirror_path, base_url passed to clone_repo
+
+    Returns:
+        pd.DataFrame: repo_owner, repo_name and status (cloned, exists or failed) per repository
+    """
+
+    def clone(repo: dict) -> dict:
+        cloned = clone_repo(
+            repo_owner=repo["repo_owner"],
+            repo_name=repo["repo_name"],
+            clone_path=clone_path,
+            local_name=repo.get("local_name", False),
+            commit_shas=repo.get("commit_shas"),
+            **clone_options,
+        )
+        status = {True: "cloned", False: "failed", None: "exists"}[cloned]
+
+        return {"repo_owner": repo["repo_owner"], "repo_name": repo["repo_name"], "status": status}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return pd.DataFrame(list(executor.map(clone, repos)))
+
 
 def git_checkout_commit(clone_path: str, commit_sha: str):
     """Checkout a target commit
@@ -73,6 +229,139 @@ def git_checkout_commit(clone_path: str, commit_sha: str):
     repo.git.checkout(commit_sha, force=True)
 
 
+# reference counts of the worktrees handed out by acquire_worktree
+worktree_refs = defaultdict(int)
+worktree_refs_lock = threading.Lock()
+repo_locks = defaultdict(threading.Lock)
+
+
+def worktree_path(clone_path: str, commit_sha: str, worktree_root: str = None) -> str:
+    """Location of the worktree of a commit
+
+    Args:
+        clone_path (str): Location of source code
+        commit_sha (str): Commit of the worktree
+        worktree_root (str, optional): Folder of the worktrees. Defaults to {clone_path}__worktrees/.
+
+    Returns:
+        str: Worktree path (with a trailing slash like REPO_PATH)
+    """
+    if worktree_root is None:
+        worktree_root = f"{clone_path.rstrip('/')}__worktrees/"
+
+    return f"{worktree_root}{commit_sha}/"
+
+
+def acquire_worktree(clone_path: str, commit_sha: str, worktree_root: str = None) -> str:
+    """Gives a (repo, commit) its own checkout sharing the objects of the clone.
+    Every acquire must be paired with a release_worktree, the worktree is shared while
+    it is referenced.
+
+    Args:
+        clone_path (str): Location of source code
+        commit_sha (str): Commit to check out
+        worktree_root (str, optional): Folder of the worktrees. Defaults to {clone_path}__worktrees/.
+
+    Returns:
+        str: Worktree path
+    """
+    path = worktree_path(clone_path, commit_sha, worktree_root)
+
+    # git serializes changes to the worktree list of a repo
+    with repo_locks[os.path.abspath(clone_path)]:
+        with worktree_refs_lock:
+            worktree_refs[path] += 1
+
+        if not os.path.exists(path):
+            try:
+                git.Repo(path=clone_path).git.worktree(
+                    "add", "--detach", "--force", path, commit_sha
+                )
+            except Exception:
+                with worktree_refs_lock:
+                    worktree_refs[path] -= 1
+                raise
+
+    return path
+
+
+def release_worktree(
+    clone_path: str, commit_sha: str, worktree_root: str = None, remove=True
+):
+    """Releases a worktree from acquire_worktree, removing it once nothing references it
+
+    Args:
+        clone_path (str): Location of source code
+        commit_sha (str): Commit of the worktree
+        worktree_root (str, optional): Folder of the worktrees. Defaults to {clone_path}__worktrees/.
+        remove (bool, optional): Remove the worktree when unreferenced. Defaults to True.
+    """
+    path = worktree_path(clone_path, commit_sha, worktree_root)
+
+    with repo_locks[os.path.abspath(clone_path)]:
+        with worktree_refs_lock:
+            worktree_refs[path] = max(worktree_refs[path] - 1, 0)
+            unreferenced = worktree_refs[path] == 0
+            if unreferenced:
+                del worktree_refs[path]
+
+        if unreferenced and remove and os.path.exists(path):
+            git.Repo(path=clone_path).git.worktree("remove", "--force", path)
+
+
+@contextmanager
+def commit_worktree(clone_path: str, commit_sha: str, worktree_root: str = None):
+    """Context manager around acquire_worktree/release_worktree
+
+    Args:
+        clone_path (str): Location of source code
+        commit_sha (str): Commit to check out
+        worktree_root (str, optional): Folder of the worktrees. Defaults to {clone_path}__worktrees/.
+
+    Yields:
+        str: Worktree path
+    """
+    path = acquire_worktree(clone_path, commit_sha, worktree_root)
+    try:
+        yield path
+    finally:
+        release_worktree(clone_path, commit_sha, worktree_root)
+
+
+def cleanup_worktrees(clone_path: str, worktree_root: str = None) -> list:
+    """Removes the worktrees of a clone that are not referenced (e.g., left by a crashed run)
+    and prunes stale worktree metadata
+
+    Args:
+        clone_path (str): Location of source code
+        worktree_root (str, optional): Folder of the worktrees. Defaults to {clone_path}__worktrees/.
+
+    Returns:
+        list: Removed worktree paths
+    """
+    root = os.path.dirname(worktree_path(clone_path, "x", worktree_root).rstrip("/"))
+    removed = []
+
+    with repo_locks[os.path.abspath(clone_path)]:
+        repo = git.Repo(path=clone_path)
+
+        if os.path.exists(root):
+            for commit_sha in os.listdir(root):
+                path = worktree_path(clone_path, commit_sha, worktree_root)
+                with worktree_refs_lock:
+                    referenced = worktree_refs.get(path, 0) > 0
+                if not referenced:
+                    try:
+                        repo.git.worktree("remove", "--force", path)
+                    except git.GitCommandError:
+                        shutil.rmtree(path, ignore_errors=True)
+                    removed.append(path)
+
+        repo.git.worktree("prune")
+
+    return removed
+
+
 def git_diff(clone_path: str, commit_sha: str, df=False) -> dict:
     """Obtains the git diff information using patchparser
     Info: https://github.com/tdunlap607/patchparser
@@ -99,31 +388,446 @@ def git_diff(clone_path: str, commit_sha: str, df=False) -> dict:
     if df:
         diff_df = pd.DataFrame(diff)
 
-        # calculate the line numbers modified in relational to the original file
-        diff_df["original_modified_lines"] = diff_df.apply(
-                lambda x: git_changed_original_lines(
-                        raw_patch=x["raw_patch"],
-                        original_line_start=x["original_line_start"],
-                )
-                if x["deletions"] > 0
-                else None,
-                axis=1,
-        )
+        # calculate the line numbers modified in relation to the original/fresh commit file
+        return add_changed_line_columns(diff_df)
+    else:
+        return diff
 
-        # calculate the line numbers modified in relation to the fresh commit file
-        diff_df["new_modified_lines"] = diff_df.apply(
-                lambda x: git_changed_modified_lines(
-                        raw_patch=x["raw_patch"],
-                        modified_line_start=x["modified_line_start"],
-                )
-                if x["additions"] > 0
-                else None,
-                axis=1,
-        )
 
-        return diff_df
+# commit records in the batched git log stream are wrapped in \x1e, fields split by \x1f
+COMMIT_FIELDS = [
+    "sha",
+    "parents",
+    "tree",
+    "author_name",
+    "author_email",
+    "author_date",
+    "committer_name",
+    "committer_email",
+    "committer_date",
+    "message",
+]
+COMMIT_FORMAT = "%x1e" + "%x1f".join(["%H", "%P", "%T", "%an", "%ae", "%aI", "%cn", "%ce", "%cI", "%B"]) + "%x1e"
+
+
+def unquote_path(path: str) -> str:
+    """Strips the a/ b/ prefix and C-style quotes git adds to unusual file names"""
+    path = path.split("\t")[0]
+    if path.startswith('"') and path.endswith('"'):
+        path = path[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape")
+        path = path.encode("latin-1").decode("utf-8", "replace")
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+
+def parse_git_log_patches(lines, max_files: int = 1000):
+    """Incrementally parses `git log -p --format=COMMIT_FORMAT` output
+
+    Files without hunks (binary, mode or pure rename changes) are skipped,
+    same as patchparser's commit_local.
+
+    Args:
+        lines (iterable): Output lines without their trailing newline
+        max_files (int, optional): Files kept per commit, same cap as commit_local. Defaults to 1000.
+
+    Yields:
+        tuple: (commit dict of COMMIT_FIELDS, list of patchparser file dicts)
+    """
+    commit = None
+    header = None
+    files = []
+    current = None
+
+    def close_file():
+        if current is not None and current["hunks"] and len(files) < max_files:
+            lines = current["hunks"]
+            additions = sum(1 for line in lines if line.startswith("+"))
+            deletions = sum(1 for line in lines if line.startswith("-"))
+            old_path = current["old_path"] or current["new_path"]
+            new_path = current["new_path"] or current["old_path"]
+            files.append(
+                {
+                    "filename": old_path if current["status"] == "D" else new_path,
+                    "a_file": f"a/{old_path}",
+                    "b_file": f"b/{new_path}",
+                    "additions": additions,
+                    "deletions": deletions,
+                    "changes": additions + deletions,
+                    "patch": "\n".join(lines) + "\n",
+                    "status": current["status"],
+                }
+            )
+
+    def close_commit():
+        if commit is not None:
+            # commit_local loses the trailing newline of the last file in the diff
+            if files:
+                files[-1]["patch"] = files[-1]["patch"][:-1]
+            return commit, files
+
+    for line in lines:
+        if header is not None:
+            header.append(line)
+            if not line.endswith("\x1e"):
+                continue
+            values = "\n".join(header)[1:-1].split("\x1f", len(COMMIT_FIELDS) - 1)
+            commit = dict(zip(COMMIT_FIELDS, values))
+            header = None
+            continue
+
+        if line.startswith("\x1e"):
+            close_file()
+            current = None
+            parsed = close_commit()
+            if parsed is not None:
+                yield parsed
+            commit, files = None, []
+            header = [line]
+            # commits with an empty message close the record on the same line
+            if len(line) > 1 and line.endswith("\x1e") and line.count("\x1f") == len(COMMIT_FIELDS) - 1:
+                commit = dict(zip(COMMIT_FIELDS, line[1:-1].split("\x1f")))
+                header = None
+            continue
+
+        if line.startswith("diff --git "):
+            close_file()
+            # fallback names for diffs without ---/+++ lines, ambiguous with spaces
+            paths = line[len("diff --git ") :].split(" b/", 1)
+            current = {
+                "old_path": unquote_path(paths[0]),
+                "new_path": unquote_path(paths[-1]),
+                "status": "M",
+                "hunks": [],
+            }
+        elif current is None:
+            continue
+        elif current["hunks"] or line.startswith("@@"):
+            current["hunks"].append(line)
+        elif line.startswith("new file mode"):
+            current["status"] = "A"
+        elif line.startswith("deleted file mode"):
+            current["status"] = "D"
+        elif line.startswith("rename from "):
+            current["old_path"] = line[len("rename from ") :]
+            current["status"] = "R"
+        elif line.startswith("rename to "):
+            current["new_path"] = line[len("rename to ") :]
+        elif line.startswith("--- ") and line[4:] != "/dev/null":
+            current["old_path"] = unquote_path(line[4:])
+        elif line.startswith("+++ ") and line[4:] != "/dev/null":
+            current["new_path"] = unquote_path(line[4:])
+
+    close_file()
+    parsed = close_commit()
+    if parsed is not None:
+        yield parsed
+
+
+def iter_git_diffs(
+    clone_path: str,
+    commit_shas: list,
+    repo_owner: str = None,
+    repo_name: str = None,
+    max_files: int = 1000,
+):
+    """Streams the git_diff rows of many commits from a single git process
+
+    Args:
+        clone_path (str): Location of source code
+        commit_shas (list): Target commits
+        repo_owner (str, optional): Defaults to the owner inferred from clone_path like git_diff.
+        repo_name (str, optional): Defaults to the name inferred from clone_path like git_diff.
+        max_files (int, optional): Files kept per commit. Defaults to 1000.
+
+    Yields:
+        tuple: (commit_sha, list of git_diff dicts for the commit), the list is None for
+            unknown commits and commits that neither the batch nor git_diff could parse
+    """
+    repo_owner = repo_owner or clone_path.rstrip("/").split("/")[-2]
+    repo_name = repo_name or clone_path.rstrip("/").split("/")[-1]
+
+    # an unknown revision makes git log fail as a whole, filter them out first
+    check = subprocess.run(
+        ["git", "-C", clone_path, "cat-file", "--batch-check=%(objectname) %(objecttype)"],
+        input="".join(f"{sha}^{{commit}}\n" for sha in commit_shas),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    known = []
+    for commit_sha, result in zip(commit_shas, check.stdout.splitlines()):
+        if result.endswith(" commit"):
+            known.append(commit_sha)
+        else:
+            print(f"Unknown commit {commit_sha} in {clone_path}")
+            yield commit_sha, None
+    if not known:
+        return
+
+    command = [
+        "git",
+        "-C",
+        clone_path,
+        "-c",
+        "core.quotepath=false",
+        "log",
+        "--no-walk=unsorted",
+        "--stdin",
+        "--patch",
+        "--no-color",
+        "--no-ext-diff",
+        "--diff-merges=first-parent",
+        f"--format={COMMIT_FORMAT}",
+    ]
+    process = subprocess.Popen(
+        command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    # git reads every revision from stdin before it starts writing
+    process.stdin.write("".join(f"{sha}\n" for sha in known).encode())
+    process.stdin.close()
+
+    # bytes keep stray \r inside patches from splitting lines
+    lines = (
+        line.rstrip(b"\n").decode("utf-8", "replace") for line in process.stdout
+    )
+    try:
+        for commit, files in parse_git_log_patches(lines, max_files=max_files):
+            parsed_commit = patchparser.github_parser_local.CommitParseLocal(
+                repo_owner=repo_owner, repo_name=repo_name, sha=commit["sha"]
+            )
+            parsed_commit.message = commit["message"]
+            parsed_commit.commit_author_name = commit["author_name"]
+            parsed_commit.commit_author_email = commit["author_email"]
+            parsed_commit.commit_author_date = datetime.datetime.fromisoformat(commit["author_date"])
+            parsed_commit.commit_committer_name = commit["committer_name"]
+            parsed_commit.commit_committer_email = commit["committer_email"]
+            parsed_commit.commit_committer_date = datetime.datetime.fromisoformat(
+                commit["committer_date"]
+            )
+            parsed_commit.commit_tree_sha = commit["tree"]
+            parsed_commit.parents = commit["parents"].split()
+
+            # one commit patchparser cannot handle must not end the stream
+            try:
+                rows = patchparser.github_parser_local.parse_commit_info(files, parsed_commit)
+            except Exception as e:
+                print(f"Unable to parse {commit['sha']} from the batch ({e!r}), falling back to git_diff")
+                try:
+                    rows = patchparser.github_parser_local.commit_local(
+                        repo_owner=repo_owner,
+                        repo_name=repo_name,
+                        sha=commit["sha"],
+                        base_repo_path=clone_path,
+                    )
+                except Exception as e:
+                    print(f"Unable to parse {commit['sha']} ({e!r}), skipping it")
+                    rows = None
+
+            yield commit["sha"], rows
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode("utf-8", "replace")
+        process.stderr.close()
+        if process.wait() not in (0, -13):
+            raise git.GitCommandError(command, process.returncode, stderr)
+
+
+def git_diff_batch(
+    clone_path: str,
+    commit_shas: list,
+    df=False,
+    repo_owner: str = None,
+    repo_name: str = None,
+    return_skipped=False,
+):
+    """Obtains the git_diff information of many commits with one git invocation.
+    Unknown or unparsable commits are skipped and reported, the other commits are kept.
+
+    Args:
+        clone_path (str): Location of source code
+        commit_shas (list): Target commits to parse
+        df (bool): If you want a pandas DF back
+        repo_owner (str, optional): Defaults to the owner inferred from clone_path like git_diff.
+        repo_name (str, optional): Defaults to the name inferred from clone_path like git_diff.
+        return_skipped (bool, optional): Also return the skipped commits. Defaults to False.
+
+    Returns:
+        (list|pd.DataFrame): git_diff dicts of every commit, or one DF with the changed line columns.
+            (diff, skipped commit_shas) when return_skipped is set.
+    """
+    diff = []
+    skipped = []
+    for commit_sha, rows in iter_git_diffs(
+        clone_path, commit_shas, repo_owner=repo_owner, repo_name=repo_name
+    ):
+        if rows is None:
+            skipped.append(commit_sha)
+        else:
+            diff.extend(rows)
+
+    if skipped:
+        print(f"Skipped {len(skipped)}/{len(commit_shas)} commits: {skipped}")
+
+    if df:
+        diff = pd.DataFrame(diff)
+        if not diff.empty:
+            # calculate the line numbers modified in relation to the original/fresh commit file
+            diff = add_changed_line_columns(diff)
+
+    if return_skipped:
+        return diff, skipped
+    return diff
+
+
+# unified diff hunk header, a missing length defaults to 1
+HUNK_HEADER_REGEX = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def parse_hunk_lines(
+    raw_patches,
+    original_line_starts,
+    modified_line_starts,
+    raw_patch_headers=None,
+) -> dict:
+    """Walks each diff hunk once and emits the removed and added line numbers
+
+    Results are stored flat: the line numbers of hunk i are
+    lines[offsets[i]:offsets[i + 1]]. Hunks of many commits can be passed in one call.
+
+    Args:
+        raw_patches (list-like): Diff hunks from git_diff (raw_patch)
+        original_line_starts (list-like): Line number start of each hunk in the original file
+        modified_line_starts (list-like): Line number start of each hunk in the modified file
+        raw_patch_headers (list-like, optional): Hunk headers (e.g., @@ -1,5 +1,6 @@) used
+            to validate the hunk lengths. Defaults to None.
+
+    Returns:
+        dict: original_lines/original_offsets, new_lines/new_offsets (np.ndarray) and
+            error (list), the error is None for well formed hunks
+    """
+    raw_patches = list(raw_patches)
+    original_line_starts = list(original_line_starts)
+    modified_line_starts = list(modified_line_starts)
+    if raw_patch_headers is None:
+        raw_patch_headers = [None] * len(raw_patches)
     else:
-        return diff
+        raw_patch_headers = list(raw_patch_headers)
+
+    original_lines = array("i")
+    new_lines = array("i")
+    original_offsets = array("q", [0])
+    new_offsets = array("q", [0])
+    errors = []
+
+    for raw_patch, original_start, modified_start, header in zip(
+        raw_patches, original_line_starts, modified_line_starts, raw_patch_headers
+    ):
+        error = None
+
+        if not isinstance(raw_patch, str):
+            error = "missing patch"
+        elif pd.isna(original_start) or pd.isna(modified_start):
+            error = "missing hunk line start"
+        else:
+            # expected hunk lengths, only known when the header is available
+            original_length = modified_length = None
+            header_match = HUNK_HEADER_REGEX.search(header) if isinstance(header, str) else None
+            if header_match is not None:
+                original_length = int(header_match.group(2) or 1)
+                modified_length = int(header_match.group(4) or 1)
+
+            original_line = int(original_start)
+            modified_line = int(modified_start)
+            original_seen = modified_seen = 0
+
+            # the first line holds the remainder of the @@ header
+            lines = raw_patch.splitlines()[1:]
+            for position, line in enumerate(lines):
+                if (
+                    original_length is not None
+                    and original_seen >= original_length
+                    and modified_seen >= modified_length
+                ):
+                    # hunk is complete, only blank/no-newline lines may follow
+                    if any(x.strip() and x[0] != "\\" for x in lines[position:]):
+                        error = "unexpected lines after end of hunk"
+                    break
+
+                prefix = line[:1]
+                if prefix == "+":
+                    new_lines.append(modified_line)
+                    modified_line += 1
+                    modified_seen += 1
+                elif prefix == "-":
+                    original_lines.append(original_line)
+                    original_line += 1
+                    original_seen += 1
+                elif prefix == "\\":
+                    # \ No newline at end of file
+                    continue
+                else:
+                    if prefix not in (" ", "") and error is None:
+                        error = f"unexpected line prefix {prefix!r}"
+                    original_line += 1
+                    modified_line += 1
+                    original_seen += 1
+                    modified_seen += 1
+
+            if error is None and original_length is not None and (
+                original_seen != original_length or modified_seen != modified_length
+            ):
+                error = (
+                    f"hunk length mismatch: expected -{original_length} +{modified_length}, "
+                    f"found -{original_seen} +{modified_seen}"
+                )
+
+        original_offsets.append(len(original_lines))
+        new_offsets.append(len(new_lines))
+        errors.append(error)
+
+    return {
+        "original_lines": np.frombuffer(original_lines, dtype=np.int32),
+        "original_offsets": np.frombuffer(original_offsets, dtype=np.int64),
+        "new_lines": np.frombuffer(new_lines, dtype=np.int32),
+        "new_offsets": np.frombuffer(new_offsets, dtype=np.int64),
+        "error": errors,
+    }
+
+
+def add_changed_line_columns(diff_df: pd.DataFrame) -> pd.DataFrame:
+    """Adds original_modified_lines, new_modified_lines and hunk_error to a git_diff DF.
+    The DF may hold the hunks of many commits.
+
+    Args:
+        diff_df (pd.DataFrame): git_diff(df=True) hunks, one row per hunk
+
+    Returns:
+        pd.DataFrame: diff_df with the changed line columns
+    """
+    hunk_lines = parse_hunk_lines(
+        raw_patches=diff_df["raw_patch"],
+        original_line_starts=diff_df["original_line_start"],
+        modified_line_starts=diff_df["modified_line_start"],
+        raw_patch_headers=diff_df["raw_patch_header"]
+        if "raw_patch_header" in diff_df.columns
+        else None,
+    )
+
+    original = np.split(hunk_lines["original_lines"], hunk_lines["original_offsets"][1:-1])
+    new = np.split(hunk_lines["new_lines"], hunk_lines["new_offsets"][1:-1])
+
+    deletions = pd.to_numeric(diff_df["deletions"], errors="coerce").fillna(0).to_numpy()
+    additions = pd.to_numeric(diff_df["additions"], errors="coerce").fillna(0).to_numpy()
+
+    # lists keep the groupby/sum over file_name working
+    diff_df["original_modified_lines"] = [
+        x.tolist() if count > 0 else None for x, count in zip(original, deletions)
+    ]
+    diff_df["new_modified_lines"] = [
+        x.tolist() if count > 0 else None for x, count in zip(new, additions)
+    ]
+    diff_df["hunk_error"] = hunk_lines["error"]
+
+    return diff_df
 
 
 def git_changed_original_lines(raw_patch: str, original_line_start: int) -> list:
@@ -136,26 +840,10 @@ def git_changed_original_lines(raw_patch: str, original_line_start: int) -> list
     Returns:
         list: List of modified line numbers from the original file
     """
-    # split the diff hunk based on newlines
-    original = raw_patch.splitlines()
-
-    try:
     # original lines can only be removed, we handled additions in git_changed_modified_lines
-        original_lines = [x for x in original if x[0] != "+"][1:]
-
-        # get the line numbers that were removed
-        original_line_numbers = [
-            idx + original_line_start for idx, i in enumerate(original_lines) if i[0] == "-"
-        ]
-    except:
-        original_lines = [x for x in original[1:] if x[0] != "+"]
+    hunk_lines = parse_hunk_lines([raw_patch], [original_line_start], [original_line_start])
 
-        # get the line numbers that were removed
-        original_line_numbers = [
-            idx + original_line_start for idx, i in enumerate(original_lines) if i[0] == "-"
-        ]
-
-    return original_line_numbers
+    return hunk_lines["original_lines"].tolist()
 
 
 def git_changed_modified_lines(raw_patch: str, modified_line_start: int) -> list:
@@ -168,92 +856,141 @@ def git_changed_modified_lines(raw_patch: str, modified_line_start: int) -> list
     Returns:
         list: List of modified line numbers
     """
-    # split the diff hunk based on newlines
-    modified = raw_patch.splitlines()
-
     # modified lines can only be added, we handled removals in git_changed_original_lines
-    try:
-        modified_lines = [x for x in modified[1:] if x[0] != "-"]
-    except:
-        print("wait")
-
-    # get the line numbers that were added
-    modified_line_numbers = [
-        idx + modified_line_start for idx, i in enumerate(modified_lines) if i[0] == "+"
-    ]
+    hunk_lines = parse_hunk_lines([raw_patch], [modified_line_start], [modified_line_start])
 
-    return modified_line_numbers
+    return hunk_lines["new_lines"].tolist()
 
 
 def semver_sort(temp_versions):
-    """Sorts semver tags based on pythons packaging.version
+    """Sorts semver tags by Go semver precedence (pseudo-versions and +incompatible included).
+    Module prefixes of Go multi-module tags (e.g., api/v1.2.3) are ignored for the order.
 
     Args:
         temp_versions (list): List of tags
 
     Returns:
-        pd.DataFrame: Sorted tags based on semver
+        pd.DataFrame: Sorted tags based on semver (tag, tag_order), tags that are not versions
+            are dropped. Empty for None or no tags.
     """
-    if temp_versions is not None:
-        if len(temp_versions) > 0:
-            clean_parse = []
-            for each in temp_versions:
-                try:
-                    temp_version = Version(each)
-                    temp_version.raw_version = each
-                    temp_version.error = False
-                    clean_parse.append(temp_version)
-                except Exception as err:
-                    print(err)
-                    # TODO: this needs to be handled better
-                    clean_each = ".".join(each.split(".")[:3])
-                    temp_version = Version(clean_each)
-                    temp_version.raw_version = each
-                    temp_version.error = True
-                    clean_parse.append(temp_version)
-
-            # sort the clean versions
-            clean_parse.sort()
-
-            clean_return = []
-
-            for clean in clean_parse:
-                clean_return.append(clean.raw_version)
-
-            # create a df to sort the versions
-            clean_return_df = pd.DataFrame(clean_return, columns=["tag"])
-            clean_return_df["tag_order"] = clean_return_df.index
-
-            return clean_return_df
-    else:
-        return []
+    if temp_versions is None or len(temp_versions) == 0:
+        return pd.DataFrame({"tag": pd.Series(dtype=object), "tag_order": pd.Series(dtype="int64")})
+
+    # object dtype keeps the .str accessor working whatever the tags look like
+    clean_return_df = pd.DataFrame({"tag": pd.Series(list(temp_versions), dtype=object).astype(str)})
+    clean_return_df["version_key"] = version_keys(clean_return_df["tag"].str.split("/").str[-1])
+
+    clean_return_df = (
+        clean_return_df[clean_return_df["version_key"] >= 0]
+        .sort_values("version_key", kind="stable")
+        .drop(columns=["version_key"])
+        .reset_index(drop=True)
+    )
+    clean_return_df["tag_order"] = clean_return_df.index
 
+    return clean_return_df
 
-def get_tags(repo_owner, repo_name, clone_path):
-    """Obtains the local git repo tags for a given repository in a certain path
+
+# (refs state, tags DF) per repository, see get_tags
+tag_cache = {}
+tag_cache_lock = threading.Lock()
+
+
+def git_common_dir(repo_path: str) -> str:
+    """Location of the refs of a clone, worktree or bare repository
+
+    Args:
+        repo_path (str): Local clone path of repo
+
+    Returns:
+        str: Directory holding packed-refs and refs/
+    """
+    dot_git = os.path.join(repo_path, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git
+    if os.path.isfile(dot_git):
+        # worktrees point to their own git dir, which points to the common dir
+        with open(dot_git, "r") as f:
+            git_dir = f.read().strip().split("gitdir:", 1)[-1].strip()
+        git_dir = os.path.join(repo_path, git_dir)
+        commondir = os.path.join(git_dir, "commondir")
+        if os.path.isfile(commondir):
+            with open(commondir, "r") as f:
+                return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+        return git_dir
+
+    return repo_path
+
+
+def refs_state(repo_path: str) -> tuple:
+    """Cheap fingerprint of the tags of a repository.
+    Creating, moving or deleting a loose tag changes the mtime of its directory,
+    packing or deleting packed tags rewrites packed-refs.
+
+    Args:
+        repo_path (str): Local clone path of repo
+
+    Returns:
+        tuple: packed-refs (mtime_ns, size) and (directory, mtime_ns) of refs/tags
+    """
+    common_dir = git_common_dir(repo_path)
+
+    try:
+        packed = os.stat(os.path.join(common_dir, "packed-refs"))
+        packed_state = (packed.st_mtime_ns, packed.st_size)
+    except FileNotFoundError:
+        packed_state = None
+
+    tag_dirs = []
+    for root, dirs, _ in os.walk(os.path.join(common_dir, "refs", "tags")):
+        dirs.sort()
+        tag_dirs.append((root, os.stat(root).st_mtime_ns))
+
+    return packed_state, tuple(tag_dirs)
+
+
+def get_tags(repo_owner, repo_name, clone_path, cache=True):
+    """Obtains the local git repo tags for a given repository in a certain path.
+    The result is cached per repository until its tags change.
 
     Args:
         repo_owner (str): Repo owner
         repo_name (str): Name of repo
         clone_path (str): Local clone path of repo
+        cache (bool, optional): Reuse the tags while refs are unchanged. Defaults to True.
 
     Returns:
-        pd.DataFrame: A sorted pandas df of tags
+        pd.DataFrame: A sorted pandas df of tags, tag_order is the semver order of the tag
     """
 
     # create repo path
     repo_path = f"{clone_path}"
-
-    # execute the git tags command
-    git_tags_command = (
-        f"(cd {repo_path} && "
-        f"git for-each-ref --sort=v:refname --format '%(refname) %(creatordate)' refs/tags)"
-    )
-
-    # this is all trusted input....not a vulnerability
-    git_tags = subprocess.check_output(
-        git_tags_command, shell=True, encoding="UTF-8"
-    ).splitlines()
+    cache_key = (os.path.abspath(repo_path), repo_owner, repo_name)
+
+    if cache:
+        state = refs_state(repo_path)
+        with tag_cache_lock:
+            cached = tag_cache.get(cache_key)
+        if cached is not None and cached[0] == state:
+            trace_helper.record_cache("tags", hits=1, repo=f"{repo_owner}/{repo_name}")
+            return cached[1].copy()
+        trace_helper.record_cache("tags", misses=1, repo=f"{repo_owner}/{repo_name}")
+
+    # refnames cannot hold NUL, creatordate as unix epoch
+    git_tags = subprocess.run(
+        [
+            "git",
+            "-C",
+            repo_path,
+            "for-each-ref",
+            "--sort=v:refname",
+            "--format=%(refname:strip=2)%00%(creatordate:unix)",
+            "refs/tags",
+        ],
+        capture_output=True,
+        check=True,
+        encoding="UTF-8",
+    ).stdout.splitlines()
 
     # load in the tag outputs
     if len(git_tags) > 0:
@@ -262,28 +999,18 @@ def get_tags(repo_owner, repo_name, clone_path):
         temp_df["repo_name"] = repo_name
         temp_df["tag_count"] = len(temp_df)
 
-        # extract the creatordate
-        temp_df["creatordate"] = temp_df.apply(
-            lambda x: datetime.datetime.strptime(
-                " ".join(x["raw_out"].strip("\n").split(" ")[1:-1]),
-                "%a %b %d %H:%M:%S %Y",
-            ),
-            axis=1,
+        raw_parts = temp_df["raw_out"].str.split("\x00", n=1, expand=True)
+
+        # extract the creatordate (UTC)
+        temp_df["creatordate"] = pd.to_datetime(
+            pd.to_numeric(raw_parts[1], errors="coerce"), unit="s"
         )
         # extract the tag from the list
-        temp_df["tag"] = temp_df.apply(
-            lambda x: x["raw_out"].strip("\n").split(" ")[0].replace("refs/tags/", ""),
-            axis=1,
-        )
-
-        # get the correct semver tag order
-        # temp_tags = temp_df["tag"].values.tolist()
+        temp_df["tag"] = raw_parts[0]
 
-        # sort the tags
-        # sorted_tags = semver_sort(temp_tags)
-
-        # add the sorted tags back to the original df
-        # temp_df_sorted = pd.merge(temp_df, sorted_tags, on="tag", how="left")
+        # add the semver tag order back to the original df
+        sorted_tags = semver_sort(temp_df["tag"].values.tolist())
+        temp_df_sorted = pd.merge(temp_df, sorted_tags, on="tag", how="left")
 
     else:
         temp_df_sorted = pd.DataFrame(
@@ -295,7 +1022,153 @@ def get_tags(repo_owner, repo_name, clone_path):
         temp_df_sorted["tag"] = None
         temp_df_sorted["tag_order"] = None
 
-    return temp_df
+    if cache:
+        with tag_cache_lock:
+            tag_cache[cache_key] = (state, temp_df_sorted)
+
+        return temp_df_sorted.copy()
+
+    return temp_df_sorted
+
+
+def build_function_index(temp_functions: pd.DataFrame, base_path: str = None) -> dict:
+    """Builds a sorted interval index over the output of extract_functions_module.ql
+
+    Every function is placed on a single global axis (file id * stride + line), so
+    the changed lines of every file in a commit can be answered with one batched
+    stabbing query. Files are matched by exact path.
+
+    Args:
+        temp_functions (pd.DataFrame): Functions from extract_functions_module.ql
+        base_path (str, optional): Prefix removed from funcFile (e.g., REPO_PATH) so
+            keys line up with the repo-relative file_name from git_diff. Defaults to None.
+
+    Returns:
+        dict: Interval index used by query_function_index/match_changed_lines
+    """
+    # only functions with a usable location can be indexed
+    usable = (
+        temp_functions["funcFile"].notna()
+        & temp_functions["funcStartLine"].notna()
+        & temp_functions["funcEndLine"].notna()
+    ).to_numpy()
+    valid = temp_functions[usable]
+
+    files = valid["funcFile"].astype(str)
+    if base_path:
+        prefixed = files.str.startswith(base_path)
+        if not prefixed.all():
+            # unprefixed files never match the repo-relative file_name of git_diff
+            print(
+                f"WARNING: {(~prefixed).sum()}/{len(files)} funcFile values do not start with "
+                f"{base_path} (e.g., {files[~prefixed].iloc[0]}), their functions will not match"
+            )
+        files = files.str.slice(len(base_path)).where(prefixed, files)
+
+    file_ids, file_names = pd.factorize(files, sort=False)
+    starts = valid["funcStartLine"].to_numpy(dtype=np.int64)
+    ends = valid["funcEndLine"].to_numpy(dtype=np.int64)
+
+    # stride keeps the line ranges of different files from overlapping
+    stride = int(max(starts.max(initial=0), ends.max(initial=0))) + 2
+
+    global_starts = file_ids.astype(np.int64) * stride + starts
+    global_ends = file_ids.astype(np.int64) * stride + ends
+
+    order = np.argsort(global_starts, kind="stable")
+    global_starts = global_starts[order]
+    global_ends = global_ends[order]
+
+    # running max of the end lines bounds how far back a stabbing query must look
+    max_ends = np.maximum.accumulate(global_ends) if len(global_ends) else global_ends
+
+    # positions of the indexed rows within temp_functions
+    positions = np.flatnonzero(usable)
+
+    return {
+        "functions": temp_functions,
+        "files": pd.Index(file_names),
+        "stride": stride,
+        "starts": global_starts,
+        "ends": global_ends,
+        "max_ends": max_ends,
+        "rows": positions[order],
+    }
+
+
+def query_function_index(function_index: dict, file_names, lines) -> pd.DataFrame:
+    """Finds every function containing each (file_name, line) pair in one batched query
+
+    Args:
+        function_index (dict): Index from build_function_index
+        file_names (list-like): Changed file names, one per line
+        lines (list-like): Changed line numbers
+
+    Returns:
+        pd.DataFrame: Matching functions with the file_name/line that matched them
+    """
+    file_names = np.asarray(file_names, dtype=object)
+    lines = np.asarray(lines, dtype=np.int64)
+
+    # exact path match, unknown files are dropped
+    file_ids = function_index["files"].get_indexer(file_names)
+    known = file_ids >= 0
+    file_names, lines, file_ids = file_names[known], lines[known], file_ids[known]
+
+    stride = function_index["stride"]
+    queries = file_ids.astype(np.int64) * stride + np.clip(lines, 0, stride - 1)
+
+    # candidates start at/before the line and are not excluded by the running max end
+    hi = np.searchsorted(function_index["starts"], queries, side="right")
+    lo = np.searchsorted(function_index["max_ends"], queries, side="left")
+    counts = np.maximum(hi - lo, 0)
+
+    pair_idx = np.repeat(np.arange(len(queries)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    candidates = lo[pair_idx] + offsets
+
+    hits = function_index["ends"][candidates] >= queries[pair_idx]
+    pair_idx = pair_idx[hits]
+    candidates = candidates[hits]
+
+    matches = function_index["functions"].iloc[function_index["rows"][candidates]].copy()
+    matches["file_name"] = file_names[pair_idx]
+    matches["line"] = lines[pair_idx]
+
+    return matches
+
+
+def match_changed_lines(
+    function_index: dict,
+    changed_files: pd.DataFrame,
+    lines_column: str = "new_modified_lines",
+    file_column: str = "file_name",
+) -> pd.DataFrame:
+    """Matches all changed lines of a commit to functions using a prebuilt index
+
+    Args:
+        function_index (dict): Index from build_function_index
+        changed_files (pd.DataFrame): Output of git_diff(df=True), or the grouped changed_files
+        lines_column (str, optional): Column holding the changed line numbers.
+            Defaults to "new_modified_lines".
+        file_column (str, optional): Column holding the file name. Defaults to "file_name".
+
+    Returns:
+        pd.DataFrame: Matching functions with the file_name/line that matched them
+    """
+    pairs = changed_files[[file_column, lines_column]]
+
+    # only list-like entries hold line numbers (see match_functions)
+    pairs = pairs[
+        pairs[lines_column].map(lambda x: isinstance(x, (list, tuple, np.ndarray)))
+    ]
+    pairs = pairs.explode(lines_column).dropna(subset=[lines_column])
+
+    return query_function_index(
+        function_index=function_index,
+        file_names=pairs[file_column].to_numpy(dtype=object),
+        lines=pairs[lines_column].to_numpy(dtype=np.int64),
+    )
 
 
 def match_functions(
@@ -304,9 +1177,9 @@ def match_functions(
     """Matches changed line numbers to functions
 
     Args:
-        temp_functions (_type_): _description_
-        temp_file_name (_type_): _description_
-        temp_lines (_type_): _description_
+        temp_functions (pd.DataFrame): Functions from extract_functions_module.ql
+        temp_file_name (str): Changed file name from git_diff
+        temp_lines (list): Changed line numbers of the file
     """
 
     # match the file
@@ -314,26 +1187,22 @@ def match_functions(
         temp_functions["funcFile"].str.contains(temp_file_name)
     ]
 
-    temp_matches = pd.DataFrame()
-
     # make sure temp_lines is of type list
     # TODO: solve the issue where the modified file only includes deletions
     # Example: https://github.com/theupdateframework/go-tuf/commit/ed6788e710fc3093a7ecc2d078bf734c0f200d8d
     
     # cline/errors.go produces a int(0) for the new_modified_lines
-    if isinstance(temp_lines, list):
-        for line in temp_lines:
-            # match the line number between the StartLine and EndLine of functions
-            temp_line_match = temp_file_match[
-                (temp_file_match["funcStartLine"] <= line)
-                & (temp_file_match["funcEndLine"] >= line)
-            ].copy()
-
-            # add the file_name/line number match back to the df
-            temp_line_match["file_name"] = temp_file_name
-            temp_line_match["line"] = line
-
-            # append to to complete df
-            temp_matches = pd.concat([temp_matches, temp_line_match])
-
-    return temp_matches
\ No newline at end of file
+    if not isinstance(temp_lines, (list, np.ndarray)) or len(temp_file_match) == 0:
+        return pd.DataFrame()
+
+    # index the matched file under the requested name and query every line at once
+    function_index = build_function_index(
+        temp_file_match.assign(funcFile=temp_file_name)
+    )
+    function_index["functions"] = temp_file_match
+
+    return query_function_index(
+        function_index=function_index,
+        file_names=[temp_file_name] * len(temp_lines),
+        lines=temp_lines,
+    )
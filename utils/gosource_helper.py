@@ -0,0 +1,384 @@
+"""
+CodeQL-free extraction of Go function boundaries straight from the source of changed files
+"""
+import os
+import re
+import subprocess
+import posixpath
+import pandas as pd
+from .git_helper import build_function_index, match_changed_lines
+
+# columns of extract_functions_module.ql
+FUNCTION_COLUMNS = [
+    "funcFile",
+    "functionName",
+    "funcStartLine",
+    "funcEndLine",
+    "funcNumLines",
+    "functionQualifiedName",
+    "funcLocation",
+]
+
+# Go tokens the scanner has to tell apart, strings/runes/comments keep their braces inert
+GO_TOKEN_REGEX = re.compile(
+    r"""
+    (?P<newline>\n)
+    | (?P<space>[ \t\r\f]+)
+    | (?P<line_comment>//[^\n]*)
+    | (?P<block_comment>/\*.*?(?:\*/|\Z))
+    | (?P<raw_string>`[^`]*(?:`|\Z))
+    | (?P<string>"(?:[^"\\\n]|\\.)*"?)
+    | (?P<rune>'(?:[^'\\\n]|\\.)*'?)
+    | (?P<ident>[^\W\d]\w*)
+    | (?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)
+    | (?P<op>\+\+|--|\.\.\.|.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# tokens after which a newline ends the statement (Go automatic semicolons)
+SEMICOLON_KEYWORDS = {"break", "continue", "fallthrough", "return"}
+SEMICOLON_OPS = {")", "]", "}", "++", "--"}
+OPENING = {"(": ")", "[": "]", "{": "}"}
+GO_KEYWORDS = {
+    "break", "case", "chan", "const", "continue", "default", "defer", "else",
+    "fallthrough", "for", "func", "go", "goto", "if", "import", "interface",
+    "map", "package", "range", "return", "select", "struct", "switch", "type", "var",
+}
+
+GO_MODULE_REGEX = re.compile(r'^\s*module\s+"?([^"\s]+)"?', re.MULTILINE)
+
+
+def go_tokens(source: str):
+    """Tokenizes Go source into (kind, text, offset, line) with automatic semicolons,
+    comments and whitespace dropped. Kinds are ident, keyword, literal, op and ";".
+
+    Args:
+        source (str): Go source code
+
+    Yields:
+        tuple: kind, text, offset, line
+    """
+    line = 1
+    last_kind, last_text = None, None
+
+    for match in GO_TOKEN_REGEX.finditer(source):
+        kind = match.lastgroup
+        text = match.group()
+
+        if kind == "space" or kind == "line_comment":
+            continue
+
+        # a newline (or a comment spanning one) ends the statement after these tokens
+        newlines = 1 if kind == "newline" else text.count("\n") if kind in ("block_comment", "raw_string") else 0
+        if kind in ("newline", "block_comment"):
+            if newlines and (
+                last_kind in ("ident", "literal")
+                or (last_kind == "keyword" and last_text in SEMICOLON_KEYWORDS)
+                or (last_kind == "op" and last_text in SEMICOLON_OPS)
+            ):
+                yield ";", "\n", match.start(), line
+                last_kind, last_text = ";", "\n"
+            line += newlines
+            continue
+
+        if kind == "ident":
+            kind = "keyword" if text in GO_KEYWORDS else "ident"
+        elif kind in ("raw_string", "string", "rune", "number"):
+            kind = "literal"
+        elif text == ";":
+            kind = ";"
+
+        yield kind, text, match.start(), line
+        line += newlines
+        last_kind, last_text = kind, text
+
+
+def byte_column(source: str, offset: int) -> int:
+    """1-based byte column of an offset, Go (and CodeQL) positions count bytes"""
+    line_start = source.rfind("\n", 0, offset) + 1
+    return len(source[line_start:offset].encode("utf-8")) + 1
+
+
+def receiver_type(tokens: list) -> str:
+    """Base type name of a method receiver, e.g. (s *Stack[T]) -> Stack"""
+    depth = 0
+    names = []
+    for kind, text, _, _ in tokens:
+        if text == "[":
+            depth += 1
+        elif text == "]":
+            depth -= 1
+        elif depth == 0 and kind == "ident":
+            names.append(text)
+
+    return names[-1] if names else None
+
+
+def scan_go_functions(source: str, file_path: str, package_path: str) -> list:
+    """Finds the function and method declarations of a Go file with the columns of
+    extract_functions_module.ql. Like the query, the start line is the line of the
+    function name (its declaring identifier, so funcNumLines is 1), the end line and
+    funcLocation span the whole declaration, and function literals are not functions.
+
+    Args:
+        source (str): Go source code
+        file_path (str): funcFile of the rows (CodeQL reports absolute paths)
+        package_path (str): Import path of the file's package, the prefix of functionQualifiedName
+
+    Returns:
+        list: Dicts with the FUNCTION_COLUMNS
+    """
+    source = source.lstrip("\ufeff")
+    tokens = list(go_tokens(source))
+    functions = []
+
+    depth = 0
+    previous = ";"
+    i = 0
+    while i < len(tokens):
+        kind, text, offset, line = tokens[i]
+
+        # a declaration starts a top-level statement, func elsewhere is a literal or a type
+        if depth == 0 and text == "func" and previous == ";":
+            declaration = parse_func_decl(tokens, i)
+            if declaration is not None:
+                end, name_index, receiver = declaration
+                _, name, _, name_line = tokens[name_index]
+                _, end_text, end_offset, end_line = tokens[end]
+
+                start_column = byte_column(source, offset)
+                end_column = byte_column(source, end_offset) + len(end_text.encode("utf-8")) - 1
+                owner = f"{package_path}.{receiver}" if receiver else package_path
+
+                functions.append(
+                    {
+                        "funcFile": file_path,
+                        "functionName": name,
+                        "funcStartLine": name_line,
+                        "funcEndLine": end_line,
+                        "funcNumLines": 1,
+                        "functionQualifiedName": f"{owner}.{name}",
+                        "funcLocation": f"file://{file_path}:{line}:{start_column}:{end_line}:{end_column}",
+                    }
+                )
+                previous = "}"
+                i = end + 1
+                continue
+
+        if text in OPENING:
+            depth += 1
+        elif text in (")", "]", "}"):
+            depth = max(depth - 1, 0)
+
+        previous = kind
+        i += 1
+
+    return functions
+
+
+def parse_func_decl(tokens: list, start: int):
+    """Parses the declaration starting at the func keyword tokens[start]
+
+    Returns:
+        tuple: Index of the last token, index of the name and receiver base type
+            (None for functions), None if this is not a declaration
+    """
+    i = start + 1
+    receiver = None
+
+    if i < len(tokens) and tokens[i][1] == "(":
+        close = matching(tokens, i)
+        if close is None:
+            return None
+        receiver = receiver_type(tokens[i + 1:close])
+        i = close + 1
+
+    if i >= len(tokens) or tokens[i][0] != "ident":
+        return None
+    name_index = i
+    i += 1
+
+    # type parameters, parameters, then results up to the body or the end of the statement
+    last = i - 1
+    while i < len(tokens):
+        kind, text, _, _ = tokens[i]
+        if text in ("struct", "interface") and i + 1 < len(tokens) and tokens[i + 1][1] == "{":
+            i = matching(tokens, i + 1)
+        elif text in ("(", "["):
+            i = matching(tokens, i)
+        elif text == "{":
+            body_end = matching(tokens, i)
+            return (body_end if body_end is not None else len(tokens) - 1), name_index, receiver
+        elif kind == ";":
+            # body-less declaration (implemented in assembly)
+            return last, name_index, receiver
+        if i is None:
+            return len(tokens) - 1, name_index, receiver
+        last = i
+        i += 1
+
+    return last, name_index, receiver
+
+
+def matching(tokens: list, open_index: int):
+    """Index of the bracket closing tokens[open_index], None if the file ends first"""
+    depth = 0
+    for i in range(open_index, len(tokens)):
+        text = tokens[i][1]
+        if text in OPENING:
+            depth += 1
+        elif text in (")", "]", "}"):
+            depth -= 1
+            if depth == 0:
+                return i
+
+    return None
+
+
+def read_blobs(repo_path: str, objects: list) -> dict:
+    """Reads many files at commits with a single git cat-file --batch
+
+    Args:
+        repo_path (str): Local repository path
+        objects (list): <commit>:<path> object names
+
+    Returns:
+        dict: {object name: decoded content}, missing objects are left out
+    """
+    if len(objects) == 0:
+        return {}
+
+    batch = subprocess.run(
+        ["git", "-C", repo_path, "cat-file", "--batch"],
+        input="".join(f"{x}\n" for x in objects).encode("utf-8"),
+        capture_output=True,
+        check=True,
+    ).stdout
+
+    blobs = {}
+    position = 0
+    for name in objects:
+        header_end = batch.index(b"\n", position)
+        header = batch[position:header_end].split()
+        position = header_end + 1
+        if len(header) != 3 or header[-1] == b"missing":
+            continue
+        size = int(header[2])
+        if header[1] == b"blob":
+            blobs[name] = batch[position:position + size].decode("utf-8", "replace")
+        position += size + 1
+
+    return blobs
+
+
+def package_paths(repo_path: str, commit_sha: str, file_names: list) -> dict:
+    """Import path of the package of each file from the nearest go.mod at a commit
+
+    Args:
+        repo_path (str): Local repository path
+        commit_sha (str): Commit to read go.mod files at
+        file_names (list): Repo-relative file names
+
+    Returns:
+        dict: {file_name: package import path}, the directory name when no go.mod is found
+    """
+    directories = {posixpath.dirname(x) for x in file_names}
+
+    candidates = set()
+    for directory in directories:
+        while True:
+            candidates.add(directory)
+            if directory == "":
+                break
+            directory = posixpath.dirname(directory)
+
+    go_mods = read_blobs(
+        repo_path, [f"{commit_sha}:{posixpath.join(x, 'go.mod')}" for x in sorted(candidates)]
+    )
+    modules = {}
+    for name, content in go_mods.items():
+        module = GO_MODULE_REGEX.search(content)
+        if module:
+            modules[posixpath.dirname(name.split(":", 1)[1])] = module.group(1)
+
+    paths = {}
+    for file_name in file_names:
+        directory = posixpath.dirname(file_name)
+        root = directory
+        while root not in modules and root != "":
+            root = posixpath.dirname(root)
+        if root in modules:
+            relative = posixpath.relpath(directory, root) if directory != root else ""
+            paths[file_name] = posixpath.join(modules[root], relative) if relative else modules[root]
+        else:
+            paths[file_name] = directory
+
+    return paths
+
+
+def extract_functions_at_commit(
+    repo_path: str, commit_sha: str, file_names: list, base_path: str = None
+) -> pd.DataFrame:
+    """extract_functions_module.ql for just some Go files at a commit, read from git
+    objects so nothing is checked out and no CodeQL DB is built
+
+    Args:
+        repo_path (str): Local repository path
+        commit_sha (str): Commit (or revision like <sha>^) to read the files at
+        file_names (list): Repo-relative file names, non-Go files are ignored
+        base_path (str, optional): Prefix of funcFile, the checkout path CodeQL would
+            report. Defaults to None (repo_path).
+
+    Returns:
+        pd.DataFrame: Functions with the FUNCTION_COLUMNS
+    """
+    base_path = repo_path if base_path is None else base_path
+    file_names = sorted({x for x in file_names if isinstance(x, str) and x.endswith(".go")})
+
+    sources = read_blobs(repo_path, [f"{commit_sha}:{x}" for x in file_names])
+    packages = package_paths(repo_path, commit_sha, file_names)
+
+    rows = []
+    for file_name in file_names:
+        source = sources.get(f"{commit_sha}:{file_name}")
+        if source is not None:
+            rows.extend(
+                scan_go_functions(source, os.path.join(base_path, file_name), packages[file_name])
+            )
+
+    return pd.DataFrame(rows, columns=FUNCTION_COLUMNS)
+
+
+def match_vfc_functions(repo_path: str, commit_sha: str, diff_df: pd.DataFrame) -> pd.DataFrame:
+    """Functions a VFC touched: removed lines are matched to the functions at the parent
+    commit, added lines to the functions at the fix commit
+
+    Args:
+        repo_path (str): Local repository path
+        commit_sha (str): VFC
+        diff_df (pd.DataFrame): git_diff(df=True) of the VFC
+
+    Returns:
+        pd.DataFrame: Matching functions with the file_name/line that matched them and
+            commit (parent or fix)
+    """
+    file_names = diff_df["file_name"].dropna().unique().tolist()
+
+    matches = []
+    for side, revision, lines_column in [
+        ("parent", f"{commit_sha}^", "original_modified_lines"),
+        ("fix", commit_sha, "new_modified_lines"),
+    ]:
+        functions = extract_functions_at_commit(repo_path, revision, file_names, base_path="")
+        if len(functions) == 0:
+            continue
+        side_matches = match_changed_lines(
+            build_function_index(functions), diff_df, lines_column=lines_column
+        )
+        matches.append(side_matches.assign(commit=side))
+
+    if len(matches) == 0:
+        return pd.DataFrame(columns=FUNCTION_COLUMNS + ["commit"])
+
+    return pd.concat(matches, ignore_index=True)
@@ -3,7 +3,34 @@ Helper functions for GoVulnDB
 """
 import yaml
 import os
+import json
+import hashlib
+import git
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from . import trace_helper
+
+# libyaml C loader when available, falls back to the pure-Python loader
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# columns produced by parse_report
+REPORT_COLUMNS = [
+    "id",
+    "git_repo",
+    "repo_owner",
+    "repo_name",
+    "fix_links",
+    "vfc",
+    "vfc_sha",
+    "symbols",
+    "derived_symbols",
+    "fixed_version",
+    "vulnerable_version",
+]
+
+# parse_report columns holding lists, Parquet returns these as arrays
+REPORT_LIST_COLUMNS = ["fix_links", "vfc", "vfc_sha", "symbols", "derived_symbols"]
 
 
 def load_report(local_db: str, report_id: str) -> dict:
@@ -23,45 +50,393 @@ def load_report(local_db: str, report_id: str) -> dict:
         report_id = f"{report_id}.yaml"
 
     with open(f"{local_db}{report_id}", "r") as f:
-        temp_yaml = yaml.safe_load(f)
+        temp_yaml = yaml.load(f, Loader=SafeLoader)
 
     return temp_yaml
 
 
-def load_all_reports(govulndb_path: str, verbose=True) -> pd.DataFrame:
+def load_all_reports(
+    govulndb_path: str, verbose=True, workers=None, cache_path: str = None
+) -> pd.DataFrame:
     """Parses and loads all reports in the GoVulnDB
 
     Args:
         govulndb_path (str): Path to the locally cloned GoVulnDB
         verbose (bool): Prints status of loading reports
+        workers (int, optional): Number of processes used to parse the reports.
+            Defaults to os.cpu_count().
+        cache_path (str, optional): Directory of the on-disk report cache. Only reports whose
+            content changed since the last load are parsed again. Defaults to None (no cache).
 
     Returns:
         pd.DataFrame: Complete parsed GoVulnDB reports
     """
     # get reports
-    report_ids = os.listdir(govulndb_path)
+    report_ids = sorted(x for x in os.listdir(govulndb_path) if x.endswith(".yaml"))
+
+    if cache_path is None:
+        parsed_reports = reports_to_df(
+            parse_reports(govulndb_path, report_ids, workers=workers)
+        )
+        if verbose:
+            print(f"Loaded {len(parsed_reports)}/{len(report_ids)}")
+    else:
+        cached_reports, manifest = read_report_cache(cache_path)
 
-    # parse the reports
-    parsed_reports = pd.DataFrame()
+        # only reports with new content need to be parsed
+        manifest, changed_ids = fingerprint_reports(govulndb_path, report_ids, manifest)
+        trace_helper.record_cache(
+            "govulndb_reports",
+            hits=len(report_ids) - len(changed_ids),
+            misses=len(changed_ids),
+        )
+        changed_reports = reports_to_df(
+            parse_reports(govulndb_path, changed_ids, workers=workers),
+            report_files=changed_ids,
+        )
+
+        parsed_reports = patch_reports(
+            cached_reports, changed_reports, keep_files=report_ids
+        )
+        write_report_cache(cache_path, parsed_reports, manifest)
 
-    # get the repos for each report
-    for index, temp_id in enumerate(report_ids):
         if verbose:
-            print(f"Loaded {index+1}/{len(report_ids)}")
-        # parse the reports
-        temp_report = parse_report(local_db=govulndb_path, report_id=temp_id)
-        temp_df = pd.DataFrame.from_dict([temp_report])
+            print(
+                f"Loaded {len(parsed_reports)}/{len(report_ids)} "
+                f"({len(report_ids) - len(changed_ids)} from cache)"
+            )
+
+        parsed_reports = parsed_reports.drop(columns=["report_file"])
+
+    parsed_reports["known_vfc"] = parsed_reports["vfc_sha"].str.len() > 0
+
+    return parsed_reports
+
+
+def parse_reports(govulndb_path: str, report_ids: list, workers=None) -> list:
+    """Runs parse_report over many reports across a process pool
+
+    Args:
+        govulndb_path (str): Path to the locally cloned GoVulnDB
+        report_ids (list): Report file names to parse
+        workers (int, optional): Number of processes. Defaults to os.cpu_count().
+
+    Returns:
+        list: parse_report dicts in the order of report_ids
+    """
+    if len(report_ids) == 0:
+        return []
+
+    # small batches are not worth the process startup
+    if workers == 1 or len(report_ids) < 64:
+        return [parse_report(local_db=govulndb_path, report_id=x) for x in report_ids]
+
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(report_ids) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(
+                parse_report, repeat(govulndb_path), report_ids, chunksize=chunksize
+            )
+        )
+
+
+def reports_to_df(reports: list, report_files: list = None) -> pd.DataFrame:
+    """Builds a single DF from parse_report dicts
+
+    Args:
+        reports (list): parse_report dicts
+        report_files (list, optional): Report file name of each dict, stored in a
+            report_file column. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Parsed reports
+    """
+    parsed_reports = pd.DataFrame.from_records(reports, columns=REPORT_COLUMNS)
+
+    if report_files is not None:
+        parsed_reports["report_file"] = report_files
+
+    return parsed_reports
+
+
+def file_sha256(file_path: str) -> str:
+    """Hashes the content of a file
+
+    Args:
+        file_path (str): File to hash
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def fingerprint_reports(govulndb_path: str, report_ids: list, manifest: dict):
+    """Compares the reports on disk with the cache manifest.
+    The content hash is only computed when a file's mtime or size changed.
+
+    Args:
+        govulndb_path (str): Path to the locally cloned GoVulnDB
+        report_ids (list): Report file names currently on disk
+        manifest (dict): Cached {report_file: {mtime_ns, size, sha256}}
+
+    Returns:
+        (dict, list): Updated manifest, report files whose content changed
+    """
+    updated_manifest = {}
+    changed_ids = []
+
+    for report_id in report_ids:
+        stat = os.stat(f"{govulndb_path}{report_id}")
+        cached = manifest.get(report_id)
+
+        if (
+            cached is not None
+            and cached["mtime_ns"] == stat.st_mtime_ns
+            and cached["size"] == stat.st_size
+        ):
+            updated_manifest[report_id] = cached
+            continue
+
+        sha256 = file_sha256(f"{govulndb_path}{report_id}")
+        if cached is None or cached["sha256"] != sha256:
+            changed_ids.append(report_id)
+
+        updated_manifest[report_id] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+        }
+
+    return updated_manifest, changed_ids
+
+
+def patch_reports(
+    parsed_reports: pd.DataFrame, changed_reports: pd.DataFrame, keep_files: list = None
+) -> pd.DataFrame:
+    """Replaces/adds the changed reports in a cached report DF
+
+    Args:
+        parsed_reports (pd.DataFrame): Cached reports with a report_file column
+        changed_reports (pd.DataFrame): Newly parsed reports with a report_file column
+        keep_files (list, optional): Report files that still exist, others are removed.
+            Defaults to None (keep all).
+
+    Returns:
+        pd.DataFrame: Patched reports sorted by report_file
+    """
+    keep = ~parsed_reports["report_file"].isin(changed_reports["report_file"])
+    if keep_files is not None:
+        keep &= parsed_reports["report_file"].isin(keep_files)
 
-        # combine the reports to a single DF
-        parsed_reports = pd.concat([parsed_reports, temp_df])
+    frames = [x for x in [parsed_reports[keep], changed_reports] if len(x) > 0]
+    if len(frames) == 0:
+        return changed_reports.iloc[0:0]
 
-    parsed_reports["known_vfc"] = parsed_reports.apply(
-        lambda x: True if x["vfc_sha"] != [] else False, axis=1
+    return (
+        pd.concat(frames, ignore_index=True)
+        .sort_values("report_file")
+        .reset_index(drop=True)
     )
 
+
+def read_report_cache(cache_path: str):
+    """Reads the cached reports and manifest
+
+    Args:
+        cache_path (str): Directory of the on-disk report cache
+
+    Returns:
+        (pd.DataFrame, dict): Cached reports, manifest of the cached report files
+    """
+    manifest_path = os.path.join(cache_path, "manifest.json")
+    reports_path = os.path.join(cache_path, "reports.parquet")
+
+    if not (os.path.exists(manifest_path) and os.path.exists(reports_path)):
+        return reports_to_df([], report_files=[]), {}
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    parsed_reports = pd.read_parquet(reports_path)
+
+    # Parquet returns list columns as arrays
+    for column in REPORT_LIST_COLUMNS:
+        parsed_reports[column] = [
+            list(x) if x is not None else None for x in parsed_reports[column]
+        ]
+
+    return parsed_reports, manifest
+
+
+def write_report_cache(cache_path: str, parsed_reports: pd.DataFrame, manifest: dict):
+    """Writes the reports and manifest to the on-disk cache.
+    Files are written next to the target and renamed so a partial write is never read.
+
+    Args:
+        cache_path (str): Directory of the on-disk report cache
+        parsed_reports (pd.DataFrame): Reports with a report_file column
+        manifest (dict): {report_file: {mtime_ns, size, sha256}}
+    """
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path)
+
+    manifest_path = os.path.join(cache_path, "manifest.json")
+    reports_path = os.path.join(cache_path, "reports.parquet")
+
+    parsed_reports.to_parquet(f"{reports_path}.tmp", index=False)
+    os.replace(f"{reports_path}.tmp", reports_path)
+
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+
+def update_report_index(
+    govulndb_path: str, cache_path: str, verbose=True, workers=None
+) -> pd.DataFrame:
+    """Incrementally updates the cached report index from the GoVulnDB git history.
+    Only reports added/modified/deleted since the last indexed commit are parsed again.
+    Falls back to a full load_all_reports when no usable commit or cached reports were recorded.
+
+    Args:
+        govulndb_path (str): Path to the reports folder of the local GoVulnDB clone
+        cache_path (str): Directory of the on-disk report cache (shared with load_all_reports)
+        verbose (bool): Prints status of the update
+        workers (int, optional): Number of processes used to parse reports. Defaults to os.cpu_count().
+
+    Returns:
+        pd.DataFrame: Complete parsed GoVulnDB reports
+    """
+    repo = git.Repo(govulndb_path, search_parent_directories=True)
+    head_sha = repo.head.commit.hexsha
+    last_sha = read_indexed_commit(cache_path)
+
+    # the last indexed commit must still exist (e.g., not lost to a force push)
+    if last_sha is not None:
+        try:
+            repo.commit(last_sha)
+        except (ValueError, git.BadName):
+            last_sha = None
+
+    # an incremental update needs the reports of the indexed commit
+    if last_sha is not None and not all(
+        os.path.exists(os.path.join(cache_path, x)) for x in ["reports.parquet", "manifest.json"]
+    ):
+        last_sha = None
+
+    if last_sha is None:
+        if verbose:
+            print(f"No usable indexed commit found, indexing all reports at {head_sha}")
+        parsed_reports = load_all_reports(
+            govulndb_path, verbose=verbose, workers=workers, cache_path=cache_path
+        )
+        write_indexed_commit(cache_path, head_sha)
+
+        return parsed_reports
+
+    parsed_reports, manifest = read_report_cache(cache_path)
+
+    if last_sha != head_sha:
+        # report files changed between the indexed commit and HEAD
+        reports_dir = os.path.relpath(govulndb_path, repo.working_tree_dir)
+        name_status = repo.git.diff(
+            "--name-status",
+            "--no-renames",
+            f"--relative={reports_dir}" if reports_dir != "." else "--relative",
+            last_sha,
+            head_sha,
+            "--",
+            reports_dir,
+        ).splitlines()
+
+        changed_ids = []
+        deleted_ids = []
+        for line in name_status:
+            status, report_id = line.split("\t", 1)
+            if not report_id.endswith(".yaml") or "/" in report_id:
+                continue
+            if status == "D":
+                deleted_ids.append(report_id)
+            else:
+                changed_ids.append(report_id)
+
+        changed_reports = reports_to_df(
+            parse_reports(govulndb_path, changed_ids, workers=workers),
+            report_files=changed_ids,
+        )
+
+        parsed_reports = patch_reports(parsed_reports, changed_reports)
+        parsed_reports = parsed_reports[
+            ~parsed_reports["report_file"].isin(deleted_ids)
+        ].reset_index(drop=True)
+
+        # keep the manifest in step so load_all_reports can reuse the cache
+        for report_id in deleted_ids:
+            manifest.pop(report_id, None)
+        for report_id in changed_ids:
+            stat = os.stat(f"{govulndb_path}{report_id}")
+            manifest[report_id] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": file_sha256(f"{govulndb_path}{report_id}"),
+            }
+
+        write_report_cache(cache_path, parsed_reports, manifest)
+        write_indexed_commit(cache_path, head_sha)
+
+        if verbose:
+            print(
+                f"Updated index {last_sha[:12]}..{head_sha[:12]}: "
+                f"{len(changed_ids)} added/modified, {len(deleted_ids)} deleted"
+            )
+    elif verbose:
+        print(f"Index is up to date at {head_sha[:12]}")
+
+    parsed_reports = parsed_reports.drop(columns=["report_file"])
+    parsed_reports["known_vfc"] = parsed_reports["vfc_sha"].str.len() > 0
+
     return parsed_reports
 
 
+def read_indexed_commit(cache_path: str):
+    """Reads the last indexed GoVulnDB commit from the cache
+
+    Args:
+        cache_path (str): Directory of the on-disk report cache
+
+    Returns:
+        str: Commit SHA, None if nothing was indexed
+    """
+    state_path = os.path.join(cache_path, "state.json")
+
+    if not os.path.exists(state_path):
+        return None
+
+    with open(state_path, "r") as f:
+        return json.load(f).get("commit")
+
+
+def write_indexed_commit(cache_path: str, commit_sha: str):
+    """Records the last indexed GoVulnDB commit in the cache
+
+    Args:
+        cache_path (str): Directory of the on-disk report cache
+        commit_sha (str): Indexed commit SHA
+    """
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path)
+
+    state_path = os.path.join(cache_path, "state.json")
+
+    with open(f"{state_path}.tmp", "w") as f:
+        json.dump({"commit": commit_sha}, f)
+    os.replace(f"{state_path}.tmp", state_path)
+
+
 def parse_report(local_db: str, report_id: str) -> dict:
     """Parses useful keys from the GoVulnDB report
 
@@ -0,0 +1,287 @@
+"""
+Asyncio driver that streams advisories through clone, diff, DB build, query and matching
+"""
+import os
+import time
+import asyncio
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import pandas as pd
+from . import git_helper, codeql_helper, callgraph_helper, trace_helper
+
+# custom queries shipped with the package
+QUERY_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "codeql_queries"
+)
+
+# stages of an advisory and the limit that gates them
+ADVISORY_STAGES = {
+    "clone": "io",
+    "diff": "io",
+    "checkout": "io",
+    "build_db": "cpu",
+    "queries": "cpu",
+    "match": "cpu",
+}
+
+
+class StageLimits:
+    """Separate concurrency limits for I/O-bound (git, network, disk) and CPU-bound
+    (CodeQL, matching) stages. The blocking helpers run in a shared thread pool, their
+    subprocesses release the GIL so the event loop keeps feeding the other stages.
+    """
+
+    def __init__(self, io_limit: int, cpu_limit: int):
+        self.limits = {"io": asyncio.Semaphore(io_limit), "cpu": asyncio.Semaphore(cpu_limit)}
+        self.executor = ThreadPoolExecutor(max_workers=io_limit + cpu_limit)
+        # one clone/fetch per repository at a time
+        self.repo_locks = defaultdict(asyncio.Lock)
+
+    async def run(self, kind: str, func, *args, **kwargs):
+        """Awaits a blocking helper within the kind ("io" or "cpu") limit, the helper runs
+        in a copy of the caller's context so trace spans keep their advisory
+        """
+        async with self.limits[kind]:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(
+                self.executor, partial(context.run, func, *args, **kwargs)
+            )
+
+    def close(self):
+        """Waits for running helpers and stops the thread pool"""
+        self.executor.shutdown(wait=True)
+
+
+def match_vulnerable_functions(
+    temp_functions: pd.DataFrame, temp_cg: pd.DataFrame, diff_df: pd.DataFrame, base_path: str
+) -> dict:
+    """Matches the changed lines of a VFC to functions and finds their ancestors
+
+    Args:
+        temp_functions (pd.DataFrame): Functions from extract_functions_module.ql
+        temp_cg (pd.DataFrame): Call graph from call_graph.ql
+        diff_df (pd.DataFrame): git_diff(df=True) of the VFC
+        base_path (str): Prefix of funcFile to remove (the source root of the DB)
+
+    Returns:
+        dict: vulnerable_functions and vulnerable_entry uniqueFunction keys
+    """
+    function_index = git_helper.build_function_index(temp_functions, base_path=base_path)
+    matches = git_helper.match_changed_lines(function_index, diff_df)
+    vulnerable_functions = callgraph_helper.unique_function_keys(
+        matches, "functionName", "funcFile", "funcStartLine"
+    ).unique()
+
+    ancestors = callgraph_helper.vulnerable_ancestors(
+        callgraph_helper.build_call_graph(temp_cg), vulnerable_functions
+    )
+
+    return {
+        "vulnerable_functions": vulnerable_functions.tolist(),
+        "vulnerable_entry": ancestors["uniqueFunction"].unique().tolist(),
+    }
+
+
+async def process_advisory(advisory: dict, limits: StageLimits, config: dict) -> dict:
+    """Runs one advisory through every stage, each stage waits for a slot of its kind
+
+    Args:
+        advisory (dict): id, repo_owner, repo_name and sha (VFC) of the advisory
+        limits (StageLimits): Shared stage limits
+        config (dict): clone_path, db_cache_root, codeql_output and optional clone_options,
+            threads_per_job, ram_per_job, compilation_cache
+
+    Returns:
+        dict: Advisory with status, error, db_path, matched functions and seconds per stage
+    """
+    result = {
+        "id": advisory["id"],
+        "repo_owner": advisory["repo_owner"],
+        "repo_name": advisory["repo_name"],
+        "sha": advisory["sha"],
+        "status": "done",
+        "error": None,
+        "db_path": None,
+        "vulnerable_functions": None,
+        "vulnerable_entry": None,
+    }
+    seconds = {}
+
+    repo = f"{advisory['repo_owner']}/{advisory['repo_name']}"
+    repo_path = f"{config['clone_path']}{repo}/"
+    stage = None
+    checkout = None
+    # spans of this task and its helpers belong to the advisory
+    trace_helper.current_advisory.set(advisory["id"])
+
+    async def timed(name, func, *args, **kwargs):
+        nonlocal stage
+        stage = name
+        start = time.perf_counter()
+        value = await limits.run(
+            ADVISORY_STAGES[name], trace_helper.traced(func, name=name, category="stage"), *args, **kwargs
+        )
+        seconds[name] = time.perf_counter() - start
+        return value
+
+    try:
+        async with limits.repo_locks[repo]:
+            cloned = await timed(
+                "clone",
+                git_helper.clone_repo,
+                repo_owner=advisory["repo_owner"],
+                repo_name=advisory["repo_name"],
+                clone_path=config["clone_path"],
+                commit_shas=[advisory["sha"]],
+                **config.get("clone_options", {}),
+            )
+        if cloned is False:
+            raise RuntimeError(f"Unable to clone {repo}")
+
+        diff_df = await timed("diff", git_helper.git_diff, repo_path, advisory["sha"], df=True)
+        checkout = await timed("checkout", git_helper.acquire_worktree, repo_path, advisory["sha"])
+
+        result["db_path"] = await timed(
+            "build_db",
+            codeql_helper.get_cached_db,
+            package_path=checkout,
+            repo=repo,
+            commit_sha=advisory["sha"],
+            cache_root=config["db_cache_root"],
+            threads=config.get("threads_per_job", 4),
+            ram=config.get("ram_per_job"),
+        )
+
+        query_results = await timed(
+            "queries",
+            codeql_helper.run_codeql_queries,
+            output_db_path=result["db_path"],
+            output_file_name=f"{config['codeql_output']}{advisory['id']}__{advisory['repo_owner']}__{advisory['repo_name']}__{advisory['sha']}",
+            custom_query_paths=[
+                os.path.join(QUERY_PATH, "extract_functions_module.ql"),
+                os.path.join(QUERY_PATH, "call_graph.ql"),
+            ],
+            threads=config.get("threads_per_job", 4),
+            ram=config.get("ram_per_job"),
+            compilation_cache=config.get("compilation_cache"),
+        )
+
+        result.update(
+            await timed(
+                "match",
+                match_vulnerable_functions,
+                query_results["extract_functions_module"],
+                query_results["call_graph"],
+                diff_df,
+                # a cached DB keeps the checkout path it was built in
+                codeql_helper.db_source_root(result["db_path"]) or checkout,
+            )
+        )
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{stage}: {e}"
+    finally:
+        # the DB holds the source, the checkout is only needed while building and matching
+        if checkout is not None:
+            await limits.run("io", git_helper.release_worktree, repo_path, advisory["sha"])
+
+    result.update({f"{name}_seconds": value for name, value in seconds.items()})
+
+    return result
+
+
+async def stream_advisories(
+    advisories,
+    clone_path: str,
+    db_cache_root: str,
+    codeql_output: str,
+    io_limit: int = 8,
+    cpu_limit: int = None,
+    max_in_flight: int = None,
+    **config,
+):
+    """Feeds advisories through the stages as a stream and yields each result when it completes.
+    Later advisories clone and diff while earlier ones build DBs, so a backlog runs at
+    the pace of the slowest stage rather than the sum of all stages.
+
+    Args:
+        advisories (iterable): Sync or async iterable of dicts with id, repo_owner, repo_name, sha
+        clone_path (str): Desired location to clone repositories
+        db_cache_root (str): Root of the CodeQL DB cache
+        codeql_output (str): Prefix of the query result files
+        io_limit (int, optional): Concurrent I/O stages (clone, diff, checkout). Defaults to 8.
+        cpu_limit (int, optional): Concurrent CodeQL stages. Defaults to os.cpu_count() // threads_per_job.
+        max_in_flight (int, optional): Advisories started but not finished, bounds the
+            worktrees on disk. Defaults to io_limit + 2 * cpu_limit.
+        **config: clone_options, threads_per_job, ram_per_job, compilation_cache
+
+    Yields:
+        dict: Result of process_advisory, in completion order
+    """
+    threads_per_job = config.get("threads_per_job", 4)
+    cpu_limit = cpu_limit or max(1, (os.cpu_count() or 1) // threads_per_job)
+    max_in_flight = max_in_flight or io_limit + 2 * cpu_limit
+
+    config.update(clone_path=clone_path, db_cache_root=db_cache_root, codeql_output=codeql_output)
+    limits = StageLimits(io_limit, cpu_limit)
+
+    async def iterate():
+        if hasattr(advisories, "__aiter__"):
+            async for advisory in advisories:
+                yield advisory
+        else:
+            for advisory in advisories:
+                yield advisory
+
+    pending = set()
+    try:
+        async for advisory in iterate():
+            while len(pending) >= max_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.create_task(process_advisory(advisory, limits, config)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        limits.close()
+
+
+def orchestrate(advisories, clone_path: str, db_cache_root: str, codeql_output: str, **options) -> pd.DataFrame:
+    """Runs stream_advisories to completion, use stream_advisories directly inside a running
+    event loop (e.g., Jupyter)
+
+    Args:
+        advisories (iterable): Dicts with id, repo_owner, repo_name, sha
+        clone_path (str): Desired location to clone repositories
+        db_cache_root (str): Root of the CodeQL DB cache
+        codeql_output (str): Prefix of the query result files
+        **options: io_limit, cpu_limit, max_in_flight and the config of stream_advisories
+
+    Returns:
+        pd.DataFrame: One row per advisory with status, error, db_path, matched functions
+            and seconds per stage
+    """
+    advisories = list(advisories)
+
+    async def collect():
+        results = []
+        async for result in stream_advisories(
+            advisories, clone_path, db_cache_root, codeql_output, **options
+        ):
+            results.append(result)
+            print(
+                f"[{len(results)}/{len(advisories)}] {result['id']} "
+                f"{result['repo_owner']}/{result['repo_name']}@{result['sha']} {result['status']}"
+            )
+        return results
+
+    return pd.DataFrame(asyncio.run(collect()))
@@ -5,6 +5,32 @@ import json
 import pandas as pd
 import re
 import os
+import zipfile
+from functools import lru_cache
+
+# schema shipped with the package, independent of the working directory
+OSV_SCHEMA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "schema", "osv_schema.json"
+)
+
+GITHUB_COMMIT_REGEX = re.compile(r"github.com/(.*)/commit/(.*)")
+
+# closing events of an OSV range, paired with the preceding introduced event
+OSV_RANGE_END_EVENTS = ["fixed", "last_affected", "limit"]
+
+
+@lru_cache(maxsize=None)
+def load_osv_schema(schema_path: str = OSV_SCHEMA_PATH) -> dict:
+    """Loads the OSV schema once per process
+
+    Args:
+        schema_path (str, optional): Location of the OSV schema. Defaults to utils/schema/osv_schema.json.
+
+    Returns:
+        dict: OSV schema
+    """
+    with open(schema_path, "r") as f:
+        return json.load(f)
 
 
 def parse_osv(osv_json_filename: str) -> dict:
@@ -18,12 +44,8 @@ def parse_osv(osv_json_filename: str) -> dict:
     Returns:
         dict: _description_
     """
-    working_dir = os.getcwd()
-    
-     # load/parse report
-    with open(f"{working_dir}/utils/schema/osv_schema.json", "r") as f:
-        osv_schema = json.load(f)
-        f.close()
+    # load/parse report
+    osv_schema = load_osv_schema()
 
     # Open the json
     with open(osv_json_filename, "r") as f:
@@ -87,23 +109,15 @@ def parse_osv(osv_json_filename: str) -> dict:
                                 osv_json[key], record_path=["ranges"]
                             )
 
-                            affected_ranges["introduced"] = affected_ranges.apply(
-                                lambda x: x["events"][0]["introduced"], axis=1
-                            )
-
-                            affected_ranges["fixed"] = affected_ranges.apply(
-                                lambda x: x["events"][1]["fixed"]
-                                if "fixed" in str(x["events"])
-                                else None,
-                                axis=1,
-                            )
-
-                            affected_ranges["limit"] = affected_ranges.apply(
-                                lambda x: x["events"][1]["limit"]
-                                if "limit" in str(x["events"])
-                                else None,
-                                axis=1,
-                            )
+                            # first event of each kind, wherever it is in the range
+                            for event_type in ["introduced", "fixed", "limit"]:
+                                affected_ranges[event_type] = [
+                                    next(
+                                        (e[event_type] for e in events if event_type in e),
+                                        None,
+                                    )
+                                    for events in affected_ranges["events"]
+                                ]
 
                             affected_base = pd.merge(
                                 affected_base,
@@ -141,39 +155,231 @@ def parse_osv(osv_json_filename: str) -> dict:
     # generate references
     temp_refs = pd.DataFrame(osv_json['references'])
 
-    github_commit_regex = r"github.com/(.*)/commit/(.*)"
+    temp_refs["vfc"] = (
+        temp_refs["url"].astype(str).str.strip().str.extract(GITHUB_COMMIT_REGEX)[0].notna()
+    )
 
-    temp_refs["vfc"] = temp_refs.apply(
-        lambda x: True if re.search(github_commit_regex, str(x["url"]).strip()) else False, 
-        axis=1)
-    
     temp_vfc = temp_refs[temp_refs['vfc']==True].reset_index(drop=True)
 
     if len(temp_vfc)>0:
-        temp_vfc['repo_owner'] = temp_vfc.apply(
-            lambda x: x['url'].split('github.com/')[1].split('/')[0],
-            axis=1
-        )
-        
-        temp_vfc['repo_name'] = temp_vfc.apply(
-            lambda x: x['url'].split('github.com/')[1].split('/')[1],
-            axis=1
-        )
-
-        temp_vfc['sha'] = temp_vfc.apply(
-            lambda x: x['url'].split('github.com/')[1].split('/')[-1],
-            axis=1
-        )
+        url_parts = temp_vfc['url'].str.split('github.com/').str[1].str.split('/')
+
+        temp_vfc['repo_owner'] = url_parts.str[0]
+        temp_vfc['repo_name'] = url_parts.str[1]
+        temp_vfc['sha'] = url_parts.str[-1]
 
     return osv_parsed, affected_base, temp_vfc
 
 
 def identify_gh_commit(refs:list):
-    github_commit_regex = r"github.com/(.*)/commit/(.*)"
-
     gh_commits = []
     for ref in refs:
-        if re.search(github_commit_regex, ref[1]):
+        if GITHUB_COMMIT_REGEX.search(ref[1]):
             gh_commits.append(ref)
     
-    return gh_commits
\ No newline at end of file
+    return gh_commits
+
+
+def iter_osv_files(osv_path: str):
+    """Streams OSV advisories from a directory or an OSV all.zip export.
+    Zip members are read one at a time without extracting the archive.
+
+    Args:
+        osv_path (str): Directory of OSV JSON files or an OSV all.zip export
+
+    Yields:
+        (str, dict): File/member name and the parsed OSV JSON
+    """
+    if zipfile.is_zipfile(osv_path):
+        with zipfile.ZipFile(osv_path) as osv_zip:
+            for member in osv_zip.infolist():
+                if member.is_dir() or not member.filename.endswith(".json"):
+                    continue
+                with osv_zip.open(member) as f:
+                    yield member.filename, json.load(f)
+    else:
+        for root, dirs, files in os.walk(osv_path):
+            dirs.sort()
+            for file_name in sorted(files):
+                if not file_name.endswith(".json"):
+                    continue
+                with open(os.path.join(root, file_name), "r") as f:
+                    yield os.path.join(root, file_name), json.load(f)
+
+
+def parse_osv_fields(osv_json: dict, osv_schema: dict) -> dict:
+    """Parses the report level fields of an OSV advisory, same keys as the report from parse_osv
+
+    Args:
+        osv_json (dict): OSV advisory
+        osv_schema (dict): OSV schema from load_osv_schema
+
+    Returns:
+        dict: Parsed report fields
+    """
+    osv_keys = osv_schema["properties"]
+
+    osv_parsed = dict()
+
+    for key in osv_keys:
+        if osv_keys[key]["type"] == "string":
+            osv_parsed[key] = osv_json.get(key)
+        elif osv_keys[key]["type"] == "array":
+            if osv_keys[key]["items"]["type"] == "string":
+                osv_parsed[key] = list(osv_json.get(key, []))
+            elif key == "references":
+                refs = osv_json.get(key, [])
+                osv_parsed["reference_type"] = [ref.get("type") for ref in refs]
+                osv_parsed["reference_url"] = [ref.get("url") for ref in refs]
+                osv_parsed["reference_combined"] = [
+                    [ref["type"], ref["url"]] if "url" in ref else None for ref in refs
+                ]
+            elif key == "affected":
+                if osv_json.get(key):
+                    package = osv_json[key][0].get("package", {})
+                    osv_parsed["ecosystem"] = package.get("ecosystem")
+                    osv_parsed["package_name"] = package.get("name")
+                else:
+                    osv_parsed["ecosystem"] = None
+                    osv_parsed["package_name"] = None
+        elif osv_keys[key]["type"] == "object" and key == "database_specific":
+            database_specific = osv_json.get(key, {})
+            osv_parsed["cwe_ids"] = database_specific.get("cwe_ids")
+            osv_parsed["severity"] = database_specific.get("severity")
+
+    return osv_parsed
+
+
+def parse_osv_ranges(osv_json: dict) -> list:
+    """Flattens the affected ranges of an OSV advisory.
+    Every introduced event is paired with the closing event that follows it.
+
+    Args:
+        osv_json (dict): OSV advisory
+
+    Returns:
+        list: One dict per (affected package, range interval)
+    """
+    ranges = []
+
+    for affected_index, affected in enumerate(osv_json.get("affected", [])):
+        package = affected.get("package", {})
+        for range_index, affected_range in enumerate(affected.get("ranges", [])):
+            base = {
+                "id": osv_json.get("id"),
+                "affected_index": affected_index,
+                "range_index": range_index,
+                "package.ecosystem": package.get("ecosystem"),
+                "package.name": package.get("name"),
+                "package.purl": package.get("purl"),
+                "type": affected_range.get("type"),
+                "repo": affected_range.get("repo"),
+            }
+
+            current = None
+            for event in affected_range.get("events", []):
+                if "introduced" in event:
+                    if current is not None:
+                        ranges.append(current)
+                    current = {
+                        **base,
+                        "introduced": event["introduced"],
+                        "fixed": None,
+                        "last_affected": None,
+                        "limit": None,
+                    }
+                else:
+                    for end_event in OSV_RANGE_END_EVENTS:
+                        if end_event in event and current is not None:
+                            current[end_event] = event[end_event]
+                            ranges.append(current)
+                            current = None
+
+            if current is not None:
+                ranges.append(current)
+
+    return ranges
+
+
+def parse_osv_vfcs(osv_json: dict) -> list:
+    """Extracts the GitHub commit references (VFCs) of an OSV advisory
+
+    Args:
+        osv_json (dict): OSV advisory
+
+    Returns:
+        list: One dict per GitHub commit reference
+    """
+    vfcs = []
+
+    for ref in osv_json.get("references", []):
+        url = str(ref.get("url")).strip()
+        if GITHUB_COMMIT_REGEX.search(url):
+            url_parts = url.split("github.com/")[1].split("/")
+            vfcs.append(
+                {
+                    "id": osv_json.get("id"),
+                    "type": ref.get("type"),
+                    "url": url,
+                    "repo_owner": url_parts[0],
+                    "repo_name": url_parts[1],
+                    "sha": url_parts[-1],
+                }
+            )
+
+    return vfcs
+
+
+def parse_osv_bulk(osv_path: str, ecosystem: str = None):
+    """Parses every OSV advisory of a directory or OSV all.zip export in a single pass
+    OSV exports: https://google.github.io/osv.dev/data/#data-dumps
+
+    Args:
+        osv_path (str): Directory of OSV JSON files or an OSV all.zip export
+        ecosystem (str, optional): Only keep advisories affecting this ecosystem (e.g., Go).
+            Defaults to None (all advisories).
+
+    Returns:
+        (pd.DataFrame, pd.DataFrame, pd.DataFrame): Report fields, affected ranges and VFC references
+    """
+    osv_schema = load_osv_schema()
+
+    reports = []
+    ranges = []
+    vfcs = []
+
+    for file_name, osv_json in iter_osv_files(osv_path):
+        if ecosystem is not None and not any(
+            x.get("package", {}).get("ecosystem") == ecosystem
+            for x in osv_json.get("affected", [])
+        ):
+            continue
+
+        report = parse_osv_fields(osv_json, osv_schema)
+        report["file_name"] = file_name
+        reports.append(report)
+
+        ranges.extend(parse_osv_ranges(osv_json))
+        vfcs.extend(parse_osv_vfcs(osv_json))
+
+    reports_df = pd.DataFrame.from_records(reports)
+    ranges_df = pd.DataFrame.from_records(
+        ranges,
+        columns=[
+            "id",
+            "affected_index",
+            "range_index",
+            "package.ecosystem",
+            "package.name",
+            "package.purl",
+            "type",
+            "repo",
+            "introduced",
+        ]
+        + OSV_RANGE_END_EVENTS,
+    )
+    vfcs_df = pd.DataFrame.from_records(
+        vfcs, columns=["id", "type", "url", "repo_owner", "repo_name", "sha"]
+    )
+
+    return reports_df, ranges_df, vfcs_df
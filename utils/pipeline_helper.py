@@ -0,0 +1,569 @@
+"""
+Memoized pipeline for the end-to-end reachability flow of poc.ipynb
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import inspect
+import subprocess
+import pandas as pd
+from . import osv_helper, sbom_helper, git_helper, codeql_helper, callgraph_helper, trace_helper
+from .govulndb_helper import file_sha256
+
+# custom queries shipped with the package
+QUERY_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "codeql_queries"
+)
+
+
+def fingerprint(value) -> str:
+    """Content hash of a stage input or output
+
+    Args:
+        value: JSON-able value, pandas object or any picklable object
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    digest = hashlib.sha256()
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        try:
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+            columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+            digest.update(repr(list(columns)).encode())
+            return digest.hexdigest()
+        except TypeError:
+            # list columns (e.g., new_modified_lines) are not hashable by pandas
+            pass
+
+    try:
+        digest.update(json.dumps(value, sort_keys=True).encode())
+    except (TypeError, ValueError):
+        digest.update(pickle.dumps(value, protocol=4))
+
+    return digest.hexdigest()
+
+
+def file_fingerprint(file_path: str) -> str:
+    """Fingerprint of a file input, its content rather than its path"""
+    return file_sha256(file_path)
+
+
+def git_fingerprint(repo_path: str) -> str:
+    """Fingerprint of a source tree, its HEAD plus uncommitted changes to tracked files"""
+    head = subprocess.run(
+        ["git", "-C", repo_path, "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+    ).stdout.strip()
+    changes = subprocess.run(
+        ["git", "-C", repo_path, "diff", "HEAD"], capture_output=True, check=True
+    ).stdout
+
+    return f"{head}:{hashlib.sha256(changes).hexdigest()}"
+
+
+def code_fingerprint(func, version: str = None, modules: list = None) -> str:
+    """Code version of a stage, its source plus the source files of the helper modules it relies on
+
+    Args:
+        func (callable): Stage function
+        version (str, optional): Extra version string (e.g., hash of a query). Defaults to None.
+        modules (list, optional): Modules whose source is part of the version. Defaults to None.
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    digest = hashlib.sha256()
+    try:
+        digest.update(inspect.getsource(func).encode())
+    except (OSError, TypeError):
+        digest.update(f"{func.__module__}.{func.__qualname__}".encode())
+
+    digest.update(str(version).encode())
+
+    for module in modules or []:
+        digest.update(file_sha256(module.__file__).encode())
+
+    return digest.hexdigest()
+
+
+class Pipeline:
+    """Stages keyed by a hash of their code, parameters and upstream outputs.
+    A stage only runs when its key has no cached output (or the cached output fails
+    its validate check). Downstream keys use the hash of the upstream output, so a
+    stage that reruns but produces the same output does not invalidate its dependents.
+    """
+
+    def __init__(self, cache_path: str, verbose=True):
+        self.cache_path = cache_path
+        self.verbose = verbose
+        self.stages = {}
+        self.last_run = pd.DataFrame(columns=["stage", "status", "key", "seconds"])
+
+    def add_stage(
+        self,
+        name: str,
+        func,
+        deps: list = None,
+        params: list = None,
+        fingerprints: dict = None,
+        output_fingerprint=None,
+        validate=None,
+        version: str = None,
+        modules: list = None,
+    ):
+        """Adds a stage, func is called with the params and dependency outputs as keyword arguments
+
+        Args:
+            name (str): Stage name, also the keyword its output is passed as
+            func (callable): Stage function
+            deps (list, optional): Upstream stages, must be added first. Defaults to None.
+            params (list, optional): Pipeline parameters used by the stage. Defaults to None.
+            fingerprints (dict, optional): {param: callable} for params whose value is a
+                reference (e.g., file_fingerprint for a path). Defaults to None (the value itself).
+            output_fingerprint (callable, optional): Hash of the output passed downstream,
+                e.g., file_fingerprint when the output is a path. Defaults to None (fingerprint).
+            validate (callable, optional): Checks a cached output is still usable
+                (e.g., a DB on disk). Defaults to None.
+            version (str, optional): Extra code version. Defaults to None.
+            modules (list, optional): Helper modules whose source is part of the code version.
+                Defaults to None.
+        """
+        for dep in deps or []:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+
+        self.stages[name] = {
+            "func": func,
+            "deps": list(deps or []),
+            "params": list(params or []),
+            "fingerprints": dict(fingerprints or {}),
+            "output_fingerprint": output_fingerprint or fingerprint,
+            "validate": validate,
+            "code": code_fingerprint(func, version, modules),
+        }
+
+    def stage_path(self, name: str, key: str) -> str:
+        """Cache path of a stage output without suffix"""
+        return os.path.join(self.cache_path, name, key)
+
+    def stage_key(self, name: str, params: dict, output_hashes: dict) -> str:
+        """Key of a stage for the given params and upstream output hashes"""
+        stage = self.stages[name]
+
+        inputs = {}
+        for param in stage["params"]:
+            if param not in params:
+                raise ValueError(f"Stage {name} is missing the param {param}")
+            inputs[param] = stage["fingerprints"].get(param, fingerprint)(params[param])
+
+        key_parts = {
+            "stage": name,
+            "code": stage["code"],
+            "params": inputs,
+            "deps": {dep: output_hashes[dep] for dep in stage["deps"]},
+        }
+
+        return hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode()).hexdigest()
+
+    def read_output(self, name: str, key: str):
+        """Loads a cached stage output"""
+        with open(f"{self.stage_path(name, key)}.pkl", "rb") as f:
+            return pickle.load(f)
+
+    def read_meta(self, name: str, key: str):
+        """Meta data of a cached stage output, None if there is no complete entry"""
+        try:
+            with open(f"{self.stage_path(name, key)}.json", "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def write_output(self, name: str, key: str, value, meta: dict):
+        """Atomically stores a stage output and its meta data"""
+        os.makedirs(os.path.join(self.cache_path, name), exist_ok=True)
+        path = self.stage_path(name, key)
+
+        # output first, the meta file marks a complete entry
+        for suffix, mode, write in [
+            (".pkl", "wb", lambda f: pickle.dump(value, f, protocol=4)),
+            (".json", "w", lambda f: json.dump(meta, f, indent=2)),
+        ]:
+            tmp_path = f"{path}{suffix}.tmp"
+            with open(tmp_path, mode) as f:
+                write(f)
+            os.replace(tmp_path, f"{path}{suffix}")
+
+    def required_stages(self, targets: list) -> list:
+        """Targets and everything upstream of them, in stage order"""
+        required = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name}")
+            if name not in required:
+                required.add(name)
+                pending.extend(self.stages[name]["deps"])
+
+        return [name for name in self.stages if name in required]
+
+    def run(self, params: dict, targets: list = None, force: list = None) -> dict:
+        """Runs the stages needed for targets, reusing cached outputs whose key did not change
+
+        Args:
+            params (dict): Pipeline parameters
+            targets (list, optional): Stages to return. Defaults to None (stages without dependents).
+            force (list, optional): Stages to rerun even when cached. Defaults to None.
+
+        Returns:
+            dict: {target: output}
+        """
+        if targets is None:
+            upstream = {dep for stage in self.stages.values() for dep in stage["deps"]}
+            targets = [name for name in self.stages if name not in upstream]
+        force = set(force or [])
+
+        keys = {}
+        output_hashes = {}
+        # outputs are only loaded when a stage runs or is returned
+        outputs = {}
+
+        def load(name):
+            if name not in outputs:
+                outputs[name] = self.read_output(name, keys[name])
+            return outputs[name]
+
+        summary = []
+        for name in self.required_stages(targets):
+            stage = self.stages[name]
+            key = self.stage_key(name, params, output_hashes)
+            keys[name] = key
+
+            meta = None if name in force else self.read_meta(name, key)
+            if meta is not None and not os.path.exists(f"{self.stage_path(name, key)}.pkl"):
+                meta = None
+            if meta is not None and stage["validate"] is not None:
+                try:
+                    if not stage["validate"](load(name)):
+                        meta = None
+                        outputs.pop(name, None)
+                except (OSError, pickle.UnpicklingError, EOFError):
+                    meta = None
+                    outputs.pop(name, None)
+
+            trace_helper.record_cache(
+                "pipeline", hits=int(meta is not None), misses=int(meta is None), stage=name
+            )
+            if meta is not None:
+                if self.verbose:
+                    print(f"Stage {name}: cached")
+                output_hashes[name] = meta["output_hash"]
+                summary.append([name, "cached", key, 0.0])
+                continue
+
+            if self.verbose:
+                print(f"Stage {name}: running")
+            start = time.perf_counter()
+
+            kwargs = {param: params[param] for param in stage["params"]}
+            kwargs.update({dep: load(dep) for dep in stage["deps"]})
+            with trace_helper.span(name, "pipeline", key=key):
+                value = stage["func"](**kwargs)
+
+            seconds = time.perf_counter() - start
+            output_hashes[name] = stage["output_fingerprint"](value)
+            outputs[name] = value
+            self.write_output(
+                name,
+                key,
+                value,
+                {"output_hash": output_hashes[name], "seconds": seconds, "created": time.time()},
+            )
+            summary.append([name, "ran", key, seconds])
+
+        self.last_run = pd.DataFrame(summary, columns=["stage", "status", "key", "seconds"])
+
+        return {name: load(name) for name in targets}
+
+
+def report_stage(osv_path: str) -> dict:
+    """Parses the advisory, parse_osv outputs"""
+    report, report_df, report_vfc = osv_helper.parse_osv(osv_json_filename=osv_path)
+    return {"report": report, "affected": report_df, "vfc": report_vfc}
+
+
+def vfc_stage(report: dict) -> dict:
+    """First VFC of the advisory and the package it affects"""
+    if len(report["vfc"]) == 0:
+        raise ValueError(f"No VFC in {report['report']['id']}")
+
+    aliases = report["report"].get("aliases") or []
+    return {
+        "id": report["report"]["id"],
+        "alias": aliases[0] if aliases else report["report"]["id"],
+        "package_name": report["report"]["package_name"],
+        "repo_owner": report["vfc"].iloc[0]["repo_owner"],
+        "repo_name": report["vfc"].iloc[0]["repo_name"],
+        "sha": report["vfc"].iloc[0]["sha"],
+    }
+
+
+def sbom_stage(product_path: str, sbom_output: str) -> str:
+    """Generates the SBOM of the product, returns its path"""
+    sbom_helper.generate_go_sbom(target_dir=product_path, output_loc=sbom_output)
+    return os.path.join(sbom_output, "bom-go-mod.spdx")
+
+
+def dependency_stage(sbom: str, vfc: dict) -> dict:
+    """Roots of the SBOM graph and the dependency paths from each root to the vulnerable package"""
+    graph = sbom_helper.load_sbom_graph(sbom)
+
+    # the packages the SBOM DESCRIBES, packages nothing depends on otherwise
+    roots = graph.roots or [v for v, d in graph.in_degree() if d == 0]
+    if len(roots) == 0:
+        raise ValueError(f"No root package in {sbom}: no DESCRIBES relationship and every package has a dependent")
+
+    return {
+        "roots": roots,
+        "paths": {
+            root: sbom_helper.dependency_paths(
+                temp_graph=graph, source_node=root, target_node=vfc["package_name"]
+            )
+            for root in roots
+        },
+    }
+
+
+def clone_stage(vfc: dict, clone_path: str) -> str:
+    """Clones the repository of the VFC, returns the clone path"""
+    git_helper.clone_repo(
+        repo_owner=vfc["repo_owner"], repo_name=vfc["repo_name"], clone_path=clone_path
+    )
+    return f"{clone_path}{vfc['repo_owner']}/{vfc['repo_name']}/"
+
+
+def diff_stage(clone: str, vfc: dict) -> pd.DataFrame:
+    """git_diff of the VFC with the changed line columns"""
+    return git_helper.git_diff(clone_path=clone, commit_sha=vfc["sha"], df=True)
+
+
+def db_stage(clone: str, vfc: dict, db_cache_root: str) -> str:
+    """CodeQL DB of the VFC from the DB cache, built from a worktree of the VFC"""
+    # the worktree only lives while the DB is built, the DB holds the source afterwards,
+    # so no checkout path is cached that cleanup_worktrees may remove later
+    with git_helper.commit_worktree(clone, vfc["sha"]) as checkout:
+        return codeql_helper.get_cached_db(
+            package_path=checkout,
+            repo=f"{vfc['repo_owner']}/{vfc['repo_name']}",
+            commit_sha=vfc["sha"],
+            cache_root=db_cache_root,
+        )
+
+
+def functions_stage(db: str, vfc: dict, codeql_output: str) -> pd.DataFrame:
+    """Functions of the vulnerable package (extract_functions_module.ql)"""
+    return codeql_helper.run_codeql(
+        output_db_path=db,
+        output_file_name=f"{codeql_output}{vfc['id']}__{vfc['repo_owner']}__{vfc['repo_name']}__{vfc['sha']}",
+        custom_query_path=os.path.join(QUERY_PATH, "extract_functions_module.ql"),
+    )
+
+
+def call_graph_stage(db: str, vfc: dict, codeql_output: str) -> pd.DataFrame:
+    """Call graph of the vulnerable package (call_graph.ql)"""
+    return codeql_helper.run_codeql(
+        output_db_path=db,
+        output_file_name=f"{codeql_output}{vfc['id']}__{vfc['repo_owner']}__{vfc['repo_name']}__{vfc['sha']}__call_graph",
+        custom_query_path=os.path.join(QUERY_PATH, "call_graph.ql"),
+    )
+
+
+def vulnerable_functions_stage(
+    functions: pd.DataFrame, diff: pd.DataFrame, db: str
+) -> pd.DataFrame:
+    """Functions changed by the VFC"""
+    # funcFile is prefixed with the checkout the DB was built in, not the current one
+    function_index = git_helper.build_function_index(
+        functions, base_path=codeql_helper.db_source_root(db)
+    )
+    matches = git_helper.match_changed_lines(function_index, diff)
+    matches["uniqueFunction"] = callgraph_helper.unique_function_keys(
+        matches, "functionName", "funcFile", "funcStartLine"
+    )
+
+    return matches.drop(columns=["line"]).drop_duplicates().reset_index(drop=True)
+
+
+def entry_stage(
+    call_graph: pd.DataFrame, functions: pd.DataFrame, vulnerable_functions: pd.DataFrame
+) -> pd.DataFrame:
+    """Functions of the vulnerable package with a path to a vulnerable function"""
+    ancestors = callgraph_helper.vulnerable_ancestors(
+        callgraph_helper.build_call_graph(call_graph),
+        vulnerable_functions["uniqueFunction"],
+    )
+
+    functions = functions.copy()
+    functions["uniqueFunction"] = callgraph_helper.unique_function_keys(
+        functions, "functionName", "funcFile", "funcStartLine"
+    )
+
+    return pd.merge(functions, ancestors, on="uniqueFunction", how="inner")
+
+
+def product_db_stage(product_path: str, product_name: str, db_cache_root: str) -> str:
+    """CodeQL DB of the product at its current HEAD"""
+    commit_sha = git_fingerprint(product_path).split(":")[0]
+    return codeql_helper.get_cached_db(
+        package_path=product_path,
+        repo=product_name,
+        commit_sha=commit_sha,
+        cache_root=db_cache_root,
+    )
+
+
+def external_api_stage(product_db: str, vfc: dict, product_name: str, codeql_output: str) -> pd.DataFrame:
+    """External API calls of the product into the vulnerable package"""
+    external_api_calls = codeql_helper.run_codeql(
+        output_db_path=product_db,
+        output_file_name=f"{codeql_output}{product_name.replace('/', '__')}__external_api",
+        custom_query_path=os.path.join(QUERY_PATH, "external_api.ql"),
+    )
+
+    # only consider API calls to the vulnerable package
+    return external_api_calls[
+        external_api_calls["functionDescription"].str.contains(vfc["package_name"], regex=False)
+    ].drop_duplicates()
+
+
+def vex_stage(
+    external_api: pd.DataFrame, entry: pd.DataFrame, functions: pd.DataFrame, vfc: dict, dependencies: dict
+) -> dict:
+    """Reachability decision and the OpenVEX impact statement"""
+    # join the API calls back with the function info based on the fully qualified name
+    target_api_calls = pd.merge(
+        functions,
+        external_api[["functionDescription"]],
+        left_on=["functionQualifiedName"],
+        right_on=["functionDescription"],
+        how="inner",
+    ).drop_duplicates()
+
+    reachable = target_api_calls["functionName"].isin(entry["functionName"]).any()
+    product = ", ".join(dependencies["roots"])
+
+    # https://github.com/openvex/spec/blob/main/OPENVEX-SPEC.md#note-on-justification-and-impact_statement
+    impact_statement = None
+    if not reachable:
+        impact_statement = {
+            "vulnerability": vfc["alias"],
+            "products": list(dependencies["roots"]),
+            "status": "not_affected",
+            "justification": "component_not_present",
+            "impact_statement": f"The vulnerable code in the dependency ({vfc['package_name']}) is not reachable from {product}.",
+        }
+
+    return {
+        "reachable": bool(reachable),
+        "impact_statement": impact_statement,
+        "api_calls": target_api_calls["functionQualifiedName"].drop_duplicates().tolist(),
+        "vulnerable_entry": entry["functionQualifiedName"].drop_duplicates().tolist(),
+    }
+
+
+def reachability_pipeline(cache_path: str, verbose=True) -> Pipeline:
+    """The poc.ipynb flow as memoized stages
+
+    Params of run: osv_path, product_path, product_name, sbom_output, clone_path,
+    db_cache_root and codeql_output. The OSV file and the SBOM are keyed by content and
+    the product by its git HEAD/changes, so a change to the product only reruns the SBOM,
+    product DB, external API and VEX stages, the vulnerable package stages stay cached.
+
+    Args:
+        cache_path (str): Location of the stage outputs
+        verbose (bool, optional): Print the stage progress. Defaults to True.
+
+    Returns:
+        Pipeline: Pipeline with the vex stage as its target
+    """
+    pipeline = Pipeline(cache_path, verbose=verbose)
+
+    def query_version(query):
+        return file_sha256(os.path.join(QUERY_PATH, query))
+
+    pipeline.add_stage(
+        "report",
+        report_stage,
+        params=["osv_path"],
+        fingerprints={"osv_path": file_fingerprint},
+        modules=[osv_helper],
+    )
+    pipeline.add_stage("vfc", vfc_stage, deps=["report"])
+    pipeline.add_stage(
+        "sbom",
+        sbom_stage,
+        params=["product_path", "sbom_output"],
+        fingerprints={"product_path": git_fingerprint},
+        output_fingerprint=file_fingerprint,
+        validate=os.path.isfile,
+    )
+    pipeline.add_stage("dependencies", dependency_stage, deps=["sbom", "vfc"], modules=[sbom_helper])
+    pipeline.add_stage("clone", clone_stage, deps=["vfc"], params=["clone_path"], validate=os.path.isdir)
+    pipeline.add_stage("diff", diff_stage, deps=["clone", "vfc"], modules=[git_helper])
+    pipeline.add_stage(
+        "db",
+        db_stage,
+        deps=["clone", "vfc"],
+        params=["db_cache_root"],
+        validate=codeql_helper.is_valid_db,
+    )
+    pipeline.add_stage(
+        "functions",
+        functions_stage,
+        deps=["db", "vfc"],
+        params=["codeql_output"],
+        version=query_version("extract_functions_module.ql"),
+    )
+    pipeline.add_stage(
+        "call_graph",
+        call_graph_stage,
+        deps=["db", "vfc"],
+        params=["codeql_output"],
+        version=query_version("call_graph.ql"),
+    )
+    pipeline.add_stage(
+        "vulnerable_functions",
+        vulnerable_functions_stage,
+        deps=["functions", "diff", "db"],
+        modules=[git_helper, codeql_helper],
+    )
+    pipeline.add_stage(
+        "entry",
+        entry_stage,
+        deps=["call_graph", "functions", "vulnerable_functions"],
+        modules=[callgraph_helper],
+    )
+    pipeline.add_stage(
+        "product_db",
+        product_db_stage,
+        params=["product_path", "product_name", "db_cache_root"],
+        fingerprints={"product_path": git_fingerprint},
+        validate=codeql_helper.is_valid_db,
+    )
+    pipeline.add_stage(
+        "external_api",
+        external_api_stage,
+        deps=["product_db", "vfc"],
+        params=["product_name", "codeql_output"],
+        version=query_version("external_api.ql"),
+    )
+    pipeline.add_stage(
+        "vex",
+        vex_stage,
+        deps=["external_api", "entry", "functions", "vfc", "dependencies"],
+    )
+
+    return pipeline
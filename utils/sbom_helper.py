@@ -3,13 +3,25 @@ import json
 import networkx as nx
 import os
 import subprocess
-from sbom2dot.dotgenerator import DOTGenerator
-from lib4sbom.parser import SBOMParser
-from lib4sbom.output import SBOMOutput
-import pygraphviz
-from networkx.drawing import nx_agraph
 import matplotlib.pyplot as plt
 import pandas as pd
+import heapq
+import itertools
+import numpy as np
+from array import array
+from collections import deque
+from .callgraph_helper import csr_from_edges
+
+# SBOM relationships that become dependency edges, *_OF/CONTAINED_BY point the other way
+SBOM_FORWARD_RELATIONSHIPS = {"DEPENDS_ON", "CONTAINS"}
+SBOM_REVERSE_RELATIONSHIPS = {
+    "DEPENDENCY_OF",
+    "DEV_DEPENDENCY_OF",
+    "OPTIONAL_DEPENDENCY_OF",
+    "BUILD_DEPENDENCY_OF",
+    "RUNTIME_DEPENDENCY_OF",
+    "CONTAINED_BY",
+}
 
 
 def generate_go_sbom(target_dir: str, output_loc: str):
@@ -36,61 +48,660 @@ def generate_go_sbom(target_dir: str, output_loc: str):
     subprocess.run(sbom_cmd, shell=True, check=True)
 
 
+class SBOMGraph:
+    """Dependency graph of an SBOM stored as CSR adjacency arrays over integer node IDs.
+    Nodes are package names, package versions are kept as node attributes (version is the
+    first one seen, versions lists every version of the name in the SBOM).
+    """
+
+    def __init__(self, nodes: list, attributes: list, src, dst, roots: list = None):
+        self.nodes = nodes
+        self.attributes = attributes
+        self.node_ids = {x: i for i, x in enumerate(nodes)}
+        self.roots = roots or []
+
+        src = np.asarray(src, dtype=np.int32)
+        dst = np.asarray(dst, dtype=np.int32)
+        if len(src):
+            edges = np.unique(np.stack([src, dst], axis=1), axis=0)
+            src, dst = edges[:, 0], edges[:, 1]
+        self.src = src
+        self.dst = dst
+
+        self.forward_indptr, self.forward_indices = csr_from_edges(src, dst, len(nodes))
+        self.reverse_indptr, self.reverse_indices = csr_from_edges(dst, src, len(nodes))
+
+    def __contains__(self, node) -> bool:
+        return node in self.node_ids
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __str__(self) -> str:
+        return f"SBOMGraph with {len(self.nodes)} nodes and {len(self.src)} edges"
+
+    def number_of_edges(self) -> int:
+        return len(self.src)
+
+    def successors(self, node) -> list:
+        node_id = self.node_ids[node]
+        children = self.forward_indices[
+            self.forward_indptr[node_id]:self.forward_indptr[node_id + 1]
+        ]
+        return [self.nodes[x] for x in children]
+
+    def predecessors(self, node) -> list:
+        node_id = self.node_ids[node]
+        parents = self.reverse_indices[
+            self.reverse_indptr[node_id]:self.reverse_indptr[node_id + 1]
+        ]
+        return [self.nodes[x] for x in parents]
+
+    def in_degree(self) -> list:
+        return list(zip(self.nodes, np.diff(self.reverse_indptr).tolist()))
+
+    def out_degree(self) -> list:
+        return list(zip(self.nodes, np.diff(self.forward_indptr).tolist()))
+
+    def to_networkx(self) -> nx.DiGraph:
+        """Converts to a networkx DiGraph, e.g., for drawing
+
+        Returns:
+            nx.DiGraph: Dependency graph with the package attributes on the nodes
+        """
+        graph = nx.DiGraph()
+        graph.add_nodes_from(zip(self.nodes, self.attributes))
+        graph.add_edges_from(
+            (self.nodes[x], self.nodes[y]) for x, y in zip(self.src.tolist(), self.dst.tolist())
+        )
+
+        return graph
+
+
+def sbom_format(sbom_path: str) -> str:
+    """Detects the SBOM format from the start of the file
+
+    Args:
+        sbom_path (str): SBOM location
+
+    Returns:
+        str: spdx-tag, spdx-json or cyclonedx-json, None if the file is not a known SBOM
+    """
+    try:
+        with open(sbom_path, "r", encoding="utf-8") as f:
+            head = f.read(4096)
+    except UnicodeDecodeError:
+        return None
+
+    stripped = head.lstrip()
+
+    # SBOM documents are JSON objects, other JSON (e.g., a list) is not an SBOM
+    if stripped.startswith("{"):
+        if "bomFormat" in head or "CycloneDX" in head:
+            return "cyclonedx-json"
+        if "spdxVersion" in head or "SPDXID" in head:
+            return "spdx-json"
+        return None
+    if "SPDXVersion:" in head:
+        return "spdx-tag"
+
+    return None
+
+
+# tags that start a non-package section of an SPDX tag-value document
+SPDX_SECTION_TAGS = {
+    "FileName",
+    "SnippetSPDXID",
+    "LicenseID",
+    "Annotator",
+    "Reviewer",
+    "DocumentName",
+    "SPDXVersion",
+}
+
+
+def read_spdx_tag(sbom_path: str):
+    """Streams packages and relationships out of an SPDX tag-value SBOM.
+    Only the first SPDXID of a package section names the package, the SPDXIDs of file,
+    snippet and other sections are not packages.
+
+    Args:
+        sbom_path (str): SBOM location
+
+    Returns:
+        (dict, list): {SPDXID: {name, version}}, [(source SPDXID, type, target SPDXID)]
+    """
+    packages = {}
+    relationships = []
+    package = None
+    package_id = None
+
+    with open(sbom_path, "r", encoding="utf-8") as f:
+        for line in f:
+            tag, _, value = line.partition(":")
+            value = value.strip()
+
+            if tag == "PackageName":
+                package = {"name": value, "version": None}
+                package_id = None
+            elif tag in SPDX_SECTION_TAGS:
+                package = None
+            elif tag == "SPDXID" and package is not None and package_id is None:
+                package_id = value
+                packages[value] = package
+            elif tag == "PackageVersion" and package is not None:
+                package["version"] = value
+            elif tag == "Relationship":
+                parts = value.split()
+                if len(parts) >= 3:
+                    relationships.append((parts[0], parts[1], parts[2]))
+
+    return packages, relationships
+
+
+def read_spdx_json(sbom_path: str):
+    """Reads packages and relationships from an SPDX JSON SBOM
+
+    Args:
+        sbom_path (str): SBOM location
+
+    Returns:
+        (dict, list): {SPDXID: {name, version}}, [(source SPDXID, type, target SPDXID)]
+    """
+    with open(sbom_path, "r", encoding="utf-8") as f:
+        sbom = json.load(f)
+
+    packages = {
+        x["SPDXID"]: {"name": x.get("name"), "version": x.get("versionInfo")}
+        for x in sbom.get("packages", [])
+    }
+    relationships = [
+        (x["spdxElementId"], x["relationshipType"], x["relatedSpdxElement"])
+        for x in sbom.get("relationships", [])
+    ]
+
+    return packages, relationships
+
+
+def read_cyclonedx_json(sbom_path: str):
+    """Reads components and dependencies from a CycloneDX JSON SBOM
+
+    Args:
+        sbom_path (str): SBOM location
+
+    Returns:
+        (dict, list): {bom-ref: {name, version}}, [(source bom-ref, type, target bom-ref)]
+    """
+    with open(sbom_path, "r", encoding="utf-8") as f:
+        sbom = json.load(f)
+
+    components = list(sbom.get("components", []))
+    root = sbom.get("metadata", {}).get("component")
+    if root is not None:
+        components.append(root)
+
+    packages = {}
+    for component in components:
+        name = component.get("name")
+        if component.get("group"):
+            name = f"{component['group']}/{name}"
+        packages[component.get("bom-ref", name)] = {
+            "name": name,
+            "version": component.get("version"),
+        }
+
+    relationships = [
+        (x["ref"], "DEPENDS_ON", y)
+        for x in sbom.get("dependencies", [])
+        for y in x.get("dependsOn", [])
+    ]
+    if root is not None:
+        relationships.append(("DOCUMENT", "DESCRIBES", root.get("bom-ref", root.get("name"))))
+
+    return packages, relationships
+
+
+def load_sbom_graph(sbom_path: str) -> SBOMGraph:
+    """Loads the dependency graph of an SPDX tag-value, SPDX JSON or CycloneDX JSON SBOM
+    in one pass over its relationships, without lib4sbom or a DOT round trip
+
+    Args:
+        sbom_path (str): SBOM location
+
+    Returns:
+        SBOMGraph: Dependency graph keyed by package name
+    """
+    readers = {
+        "spdx-tag": read_spdx_tag,
+        "spdx-json": read_spdx_json,
+        "cyclonedx-json": read_cyclonedx_json,
+    }
+    sbom_type = sbom_format(sbom_path)
+    if sbom_type is None:
+        raise ValueError(f"{sbom_path} is not an SPDX or CycloneDX SBOM")
+    packages, relationships = readers[sbom_type](sbom_path)
+
+    nodes = []
+    attributes = []
+    node_ids = {}
+
+    def node_id(ref: str) -> int:
+        package = packages.get(ref, {"name": ref, "version": None})
+        name = package["name"] or ref
+        if name not in node_ids:
+            node_ids[name] = len(nodes)
+            nodes.append(name)
+            attributes.append({"version": package["version"], "ref": ref, "versions": []})
+
+        # every version of a name is kept, e.g., two major versions of a module
+        versions = attributes[node_ids[name]]["versions"]
+        if package["version"] is not None and package["version"] not in versions:
+            versions.append(package["version"])
+        return node_ids[name]
+
+    src = array("i")
+    dst = array("i")
+    roots = []
+
+    for source, relationship, target in relationships:
+        if relationship == "DESCRIBES":
+            roots.append(node_id(target))
+        elif relationship in SBOM_FORWARD_RELATIONSHIPS:
+            src.append(node_id(source))
+            dst.append(node_id(target))
+        elif relationship in SBOM_REVERSE_RELATIONSHIPS:
+            src.append(node_id(target))
+            dst.append(node_id(source))
+
+    return SBOMGraph(
+        nodes, attributes, src, dst, roots=[nodes[x] for x in dict.fromkeys(roots)]
+    )
+
+
 def convert_sbom2graph(sbom_path: str):
     """Converts an SBOM to a graph.
-    Relies on sbom2dot: https://github.com/anthonyharrison/sbom2dot
+    Reads the SBOM relationships directly with load_sbom_graph.
 
     Args:
-        sbom_path (str): _description_
+        sbom_path (str): SPDX tag-value, SPDX JSON or CycloneDX JSON SBOM
+
+    Returns:
+        nx.DiGraph: Dependency graph with package versions as node attributes
     """
+    return load_sbom_graph(sbom_path).to_networkx()
 
-    # parse the SBOM 
-    dot_parser = SBOMParser()
 
-    # parse the SBOM file
-    dot_parser.parse_file(sbom_path)
+def dependency_distances(temp_graph, target_node: str) -> dict:
+    """Shortest number of dependency hops from every node to the target node (reverse BFS)
 
-    sbom_dot = DOTGenerator(dot_parser.get_sbom()["packages"])
-    sbom_dot.generatedot(dot_parser.get_sbom()["relationships"])
-    dot = sbom_dot.getDOT()
-    
-    # convert to a dot string
-    dot_string = '\n'.join(dot)
+    Args:
+        temp_graph: Dependency graph
+        target_node (str): Target Node
 
-    # generates a graph from the dot_string
-    G = nx_agraph.from_agraph(pygraphviz.AGraph(dot_string))
+    Returns:
+        dict: {node: hops to target_node}, only nodes that depend on target_node
+    """
+    distances = {target_node: 0}
+    queue = deque([target_node])
 
-    return G
+    while queue:
+        node = queue.popleft()
+        for parent in temp_graph.predecessors(node):
+            if parent not in distances:
+                distances[parent] = distances[node] + 1
+                queue.append(parent)
 
+    return distances
 
 
-def dependency_paths(temp_graph, source_node: str, target_node: str):
-    """Prints all paths from a source node to a target node
+def count_dependency_paths(
+    temp_graph, source_node: str, target_node: str, max_depth: int = None
+):
+    """Counts the dependency paths from a source node to a target node exactly with
+    dynamic programming over the DAG, without enumerating them
 
     Args:
-        temp_graph
+        temp_graph: Dependency graph
         source_node (str): Source Node
         target_node (str): Target Node
+        max_depth (int, optional): Only count paths with at most max_depth hops. Defaults to None.
+
+    Returns:
+        int: Number of paths, None if the relevant part of the graph has a cycle
     """
-    """"""
-    dotFormat = """
-        digraph G {
-        0 -> 1;
-        1 -> 2;
-        1 -> 3;
-        2 -> 4;
-        3 -> 4;
-        4 -> 5;
-        3 -> 6;
+    if source_node not in temp_graph or target_node not in temp_graph:
+        return 0
+
+    distances = dependency_distances(temp_graph, target_node)
+    if source_node not in distances:
+        return 0
+
+    # nodes on some path from source_node to target_node
+    relevant = {source_node}
+    queue = deque([source_node])
+    while queue:
+        node = queue.popleft()
+        for child in temp_graph.successors(node):
+            if child in distances and child not in relevant:
+                relevant.add(child)
+                queue.append(child)
+
+    children = {
+        node: [x for x in temp_graph.successors(node) if x in relevant] for node in relevant
+    }
+
+    # topological order (Kahn), a cycle means simple paths cannot be counted this way
+    in_degree = {node: 0 for node in relevant}
+    for node in relevant:
+        for child in children[node]:
+            in_degree[child] += 1
+    order = [node for node in relevant if in_degree[node] == 0]
+    for node in order:
+        for child in children[node]:
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                order.append(child)
+    if len(order) != len(relevant):
+        return None
+
+    if max_depth is None:
+        paths = {}
+        for node in reversed(order):
+            paths[node] = 1 if node == target_node else sum(paths[x] for x in children[node])
+
+        return paths[source_node]
+
+    # paths[node] = number of paths to target_node with at most depth hops
+    paths = {node: 1 if node == target_node else 0 for node in relevant}
+    for depth in range(max_depth):
+        paths = {
+            node: (1 if node == target_node else 0) + sum(paths[x] for x in children[node])
+            for node in relevant
         }
+
+    return paths[source_node]
+
+
+def dependency_paths(
+    temp_graph,
+    source_node: str,
+    target_node: str,
+    limit: int = 10,
+    max_depth: int = None,
+) -> dict:
+    """Finds the shortest dependency paths from a source node to a target node and counts all of them
+
+    Paths are found shortest first with a best-first search guided by the exact distance
+    to target_node, so only limit paths are ever built.
+
+    Args:
+        temp_graph: Dependency graph
+        source_node (str): Source Node
+        target_node (str): Target Node
+        limit (int, optional): Maximum number of paths to return. Defaults to 10.
+        max_depth (int, optional): Only consider paths with at most max_depth hops. Defaults to None.
+
+    Returns:
+        dict: count (exact number of paths, None if the graph has a cycle), shortest
+            (hops of the shortest path) and paths (shortest first)
+    """
+    result = {"count": 0, "shortest": None, "paths": []}
+
+    if source_node not in temp_graph or target_node not in temp_graph:
+        return result
+
+    distances = dependency_distances(temp_graph, target_node)
+    if source_node not in distances or (
+        max_depth is not None and distances[source_node] > max_depth
+    ):
+        return result
+
+    result["count"] = count_dependency_paths(
+        temp_graph, source_node, target_node, max_depth=max_depth
+    )
+    result["shortest"] = distances[source_node]
+
+    # (hops so far + hops left, -hops so far, tie breaker, path), equal estimates extend
+    # the deepest path first, otherwise equally long paths are expanded breadth first
+    counter = itertools.count()
+    heap = [(distances[source_node], 0, next(counter), [source_node])]
+
+    while heap and len(result["paths"]) < limit:
+        estimate, _, _, path = heapq.heappop(heap)
+        node = path[-1]
+
+        if node == target_node:
+            result["paths"].append(path)
+            continue
+
+        for child in temp_graph.successors(node):
+            if child not in distances or child in path:
+                continue
+            child_estimate = len(path) + distances[child]
+            if max_depth is not None and child_estimate > max_depth:
+                continue
+            heapq.heappush(heap, (child_estimate, -len(path), next(counter), path + [child]))
+
+    return result
+
+
+# columns of the fleet-wide module -> product index
+FLEET_INDEX_COLUMNS = ["module", "product", "version", "depth", "direct", "sbom_path"]
+
+
+def sbom_dependency_rows(sbom_path: str) -> list:
+    """Lists every module of an SBOM with its version and shortest depth from the product.
+    An SBOM that DESCRIBES several products gets the rows of each of them.
+
+    Args:
+        sbom_path (str): SBOM location
+
+    Returns:
+        list: Dicts with module, product, version, depth, direct and sbom_path
+    """
+    graph = load_sbom_graph(sbom_path)
+
+    roots = graph.roots or [x for x, degree in graph.in_degree() if degree == 0]
+    if len(roots) == 0:
+        print(f"WARNING: {sbom_path} has no root package, it is not indexed")
+        return []
+
+    rows = []
+    for product in roots:
+        # BFS from the product gives the shortest depth of every module
+        depths = {product: 0}
+        queue = deque([product])
+        while queue:
+            node = queue.popleft()
+            for child in graph.successors(node):
+                if child not in depths:
+                    depths[child] = depths[node] + 1
+                    queue.append(child)
+
+        rows.extend(
+            {
+                "module": module,
+                "product": product,
+                "version": graph.attributes[graph.node_ids[module]]["version"],
+                "depth": depth,
+                "direct": depth == 1,
+                "sbom_path": sbom_path,
+            }
+            for module, depth in depths.items()
+            if depth > 0
+        )
+
+    return rows
+
+
+def find_sboms(sbom_dir: str) -> list:
+    """Finds the SPDX/CycloneDX SBOMs in a directory, other .spdx/.json files are skipped
+
+    Args:
+        sbom_dir (str): Directory of SBOMs, searched recursively
+
+    Returns:
+        list: Sorted SBOM paths
+    """
+    sbom_paths = []
+    for root, dirs, files in os.walk(sbom_dir):
+        for file_name in files:
+            if not file_name.endswith((".spdx", ".json")):
+                continue
+
+            sbom_path = os.path.join(root, file_name)
+            if sbom_format(sbom_path) is None:
+                print(f"Skipping {sbom_path}: not an SPDX or CycloneDX SBOM")
+                continue
+            sbom_paths.append(sbom_path)
+
+    return sorted(sbom_paths)
+
+
+def read_fleet_index(index_path: str):
+    """Reads the fleet index and its manifest
+
+    Args:
+        index_path (str): Directory of the fleet index
+
+    Returns:
+        (pd.DataFrame, dict): Index rows sorted by module, {sbom_path: {mtime_ns, size}}
+    """
+    manifest_path = os.path.join(index_path, "manifest.json")
+    rows_path = os.path.join(index_path, "index.parquet")
+
+    if not (os.path.exists(manifest_path) and os.path.exists(rows_path)):
+        return pd.DataFrame(columns=FLEET_INDEX_COLUMNS), {}
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    return pd.read_parquet(rows_path), manifest
+
+
+def write_fleet_index(
+    index_path: str, fleet_index: pd.DataFrame, manifest: dict
+) -> pd.DataFrame:
+    """Writes the fleet index sorted by module, renaming into place
+
+    Args:
+        index_path (str): Directory of the fleet index
+        fleet_index (pd.DataFrame): Index rows
+        manifest (dict): {sbom_path: {mtime_ns, size}}
+
+    Returns:
+        pd.DataFrame: Index rows sorted by module
+    """
+    if not os.path.exists(index_path):
+        os.makedirs(index_path)
+
+    manifest_path = os.path.join(index_path, "manifest.json")
+    rows_path = os.path.join(index_path, "index.parquet")
+
+    fleet_index = fleet_index.sort_values(["module", "product"]).reset_index(drop=True)
+    fleet_index.to_parquet(f"{rows_path}.tmp", index=False)
+    os.replace(f"{rows_path}.tmp", rows_path)
+
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    return fleet_index
+
+
+def add_sboms(index_path: str, sbom_paths: list) -> pd.DataFrame:
+    """Adds (or replaces) SBOMs in the fleet index
+
+    Args:
+        index_path (str): Directory of the fleet index
+        sbom_paths (list): SBOMs to add
+
+    Returns:
+        pd.DataFrame: Updated index
+    """
+    fleet_index, manifest = read_fleet_index(index_path)
+
+    rows = []
+    for sbom_path in sbom_paths:
+        rows.extend(sbom_dependency_rows(sbom_path))
+        stat = os.stat(sbom_path)
+        manifest[sbom_path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    fleet_index = fleet_index[~fleet_index["sbom_path"].isin(sbom_paths)]
+    new_rows = pd.DataFrame.from_records(rows, columns=FLEET_INDEX_COLUMNS)
+    frames = [x for x in [fleet_index, new_rows] if len(x) > 0]
+    fleet_index = pd.concat(frames, ignore_index=True) if frames else new_rows
+
+    return write_fleet_index(index_path, fleet_index, manifest)
+
+
+def remove_sboms(index_path: str, sbom_paths: list) -> pd.DataFrame:
+    """Removes SBOMs from the fleet index
+
+    Args:
+        index_path (str): Directory of the fleet index
+        sbom_paths (list): SBOMs to remove
+
+    Returns:
+        pd.DataFrame: Updated index
     """
+    fleet_index, manifest = read_fleet_index(index_path)
+
+    for sbom_path in sbom_paths:
+        manifest.pop(sbom_path, None)
+    fleet_index = fleet_index[~fleet_index["sbom_path"].isin(sbom_paths)]
+
+    return write_fleet_index(index_path, fleet_index, manifest)
 
-    for path in nx.all_simple_paths(temp_graph, 
-                                    source=source_node, 
-                                    target=target_node):
-        print(path)
 
-    # sorted(nx.ancestors(G, 'github.com/hashicorp/consul'))
-    # print("use networkx to parse the graph")
-    
+def update_fleet_index(sbom_dir: str, index_path: str, verbose=True) -> pd.DataFrame:
+    """Syncs the fleet index with a directory of SBOMs.
+    New or changed SBOMs are (re)ingested and deleted SBOMs are removed, unchanged ones are not parsed.
+
+    Args:
+        sbom_dir (str): Directory of SBOMs, searched recursively
+        index_path (str): Directory of the fleet index
+        verbose (bool): Prints the number of added/removed SBOMs
+
+    Returns:
+        pd.DataFrame: Updated index
+    """
+    fleet_index, manifest = read_fleet_index(index_path)
+    sbom_paths = find_sboms(sbom_dir)
+
+    changed = []
+    for sbom_path in sbom_paths:
+        stat = os.stat(sbom_path)
+        if manifest.get(sbom_path) != {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}:
+            changed.append(sbom_path)
+
+    removed = [
+        x for x in manifest if x not in set(sbom_paths) and x.startswith(sbom_dir)
+    ]
+
+    if verbose:
+        print(f"Fleet index: {len(changed)} SBOMs added/changed, {len(removed)} removed")
+
+    if removed:
+        fleet_index = remove_sboms(index_path, removed)
+    if changed or not os.path.exists(os.path.join(index_path, "index.parquet")):
+        fleet_index = add_sboms(index_path, changed)
+
+    return fleet_index
+
+
+def lookup_module(fleet_index: pd.DataFrame, module: str) -> pd.DataFrame:
+    """Finds every product that pulls in a module, at which version and how deep
+
+    Args:
+        fleet_index (pd.DataFrame): Index from update_fleet_index/read_fleet_index (sorted by module)
+        module (str): Module of an advisory (e.g., github.com/hashicorp/consul)
+
+    Returns:
+        pd.DataFrame: Index rows of the module
+    """
+    modules = fleet_index["module"].to_numpy()
+    lo = np.searchsorted(modules, module, side="left")
+    hi = np.searchsorted(modules, module, side="right")
 
+    return fleet_index.iloc[lo:hi].reset_index(drop=True)
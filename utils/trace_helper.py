@@ -0,0 +1,485 @@
+"""
+Stage-level tracing of the helpers and resource accounting of their subprocesses
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import resource
+import functools
+import importlib
+import threading
+import subprocess
+import contextvars
+from contextlib import contextmanager
+import pandas as pd
+
+# helper entry points wrapped by enable_tracing, small per-row helpers are left out
+ENTRY_POINTS = {
+    "git_helper": [
+        "clone_repo",
+        "clone_repos",
+        "update_mirror",
+        "fetch_commits",
+        "git_checkout_commit",
+        "acquire_worktree",
+        "release_worktree",
+        "cleanup_worktrees",
+        "git_diff",
+        "git_diff_batch",
+        "add_changed_line_columns",
+        "get_tags",
+        "build_function_index",
+        "match_changed_lines",
+        "match_functions",
+    ],
+    "codeql_helper": [
+        "build_db",
+        "build_dbs",
+        "get_cached_db",
+        "evict_db_cache",
+        "run_codeql",
+        "decode_bqrs",
+        "load_results",
+        "run_codeql_queries",
+        "extract_functions_at_lines",
+        "extract_functions_in_files",
+    ],
+    "govulndb_helper": [
+        "load_all_reports",
+        "parse_reports",
+        "update_report_index",
+        "read_report_cache",
+        "write_report_cache",
+    ],
+    "osv_helper": ["parse_osv", "parse_osv_bulk"],
+    "sbom_helper": [
+        "generate_go_sbom",
+        "load_sbom_graph",
+        "convert_sbom2graph",
+        "dependency_paths",
+        "count_dependency_paths",
+        "update_fleet_index",
+    ],
+    "callgraph_helper": [
+        "build_call_graph",
+        "vulnerable_ancestors",
+        "build_reachability_index",
+        "get_reachability_index",
+        "reachable_pairs",
+    ],
+    "version_helper": ["is_affected", "affected_versions"],
+    "orchestrator_helper": ["match_vulnerable_functions"],
+}
+
+# columns of a recorded span
+SPAN_COLUMNS = [
+    "name",
+    "category",
+    "advisory",
+    "thread",
+    "start",
+    "seconds",
+    "cpu_seconds",
+    "child_cpu_seconds",
+    "peak_rss_mb",
+    "read_bytes",
+    "write_bytes",
+    "cache_hits",
+    "cache_misses",
+    "depth",
+    "args",
+]
+
+trace_lock = threading.Lock()
+trace_state = {"enabled": False, "origin": None, "spans": [], "patched": []}
+
+# open spans and advisory of the running task/thread
+current_spans = contextvars.ContextVar("current_spans", default=())
+current_advisory = contextvars.ContextVar("current_advisory", default=None)
+
+# ru_maxrss is in bytes on macOS, KB elsewhere
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def process_io() -> tuple:
+    """Bytes this process read from and wrote to storage (Linux), (0, 0) elsewhere"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["read_bytes"]), int(counters["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """Peak resident set size in MB"""
+    return resource.getrusage(who).ru_maxrss * RSS_UNIT / 2**20
+
+
+def command_name(args) -> str:
+    """Short span name of a command, the program and its subcommands
+    (e.g., codeql database create, git for-each-ref)
+    """
+    if isinstance(args, (str, bytes)):
+        args = args.decode() if isinstance(args, bytes) else args
+        try:
+            args = shlex.split(args)
+        except ValueError:
+            args = args.split()
+    args = [os.fsdecode(x) for x in args]
+    if not args:
+        return "subprocess"
+
+    parts = [os.path.basename(args[0])]
+    skip = False
+    for arg in args[1:]:
+        if len(parts) == 3:
+            break
+        if skip:
+            skip = False
+        elif arg in ("-C", "-c"):
+            skip = True
+        elif not arg.startswith("-") and "/" not in arg and "=" not in arg:
+            parts.append(arg)
+
+    return " ".join(parts)
+
+
+def open_span(name: str, category: str, args: dict = None) -> dict:
+    """Starts a span under the open spans of the caller"""
+    parents = current_spans.get()
+    return {
+        "name": name,
+        "category": category,
+        "advisory": current_advisory.get(),
+        "thread": threading.current_thread().name,
+        "start": time.perf_counter() - trace_state["origin"],
+        "seconds": 0.0,
+        "cpu_seconds": time.thread_time(),
+        "child_cpu_seconds": 0.0,
+        "peak_rss_mb": 0.0,
+        "read_bytes": 0,
+        "write_bytes": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "depth": len(parents),
+        "args": dict(args or {}),
+        "parents": parents,
+    }
+
+
+def close_span(span: dict):
+    """Records a finished span, subprocess usage and cache lookups are added to every open
+    parent span directly, so helper spans do not pass them on again
+    """
+    parents = span.pop("parents")
+    with trace_lock:
+        if span["category"] in ("subprocess", "cache"):
+            for parent in parents:
+                parent["child_cpu_seconds"] += span["child_cpu_seconds"]
+                parent["peak_rss_mb"] = max(parent["peak_rss_mb"], span["peak_rss_mb"])
+                parent["read_bytes"] += span["read_bytes"]
+                parent["write_bytes"] += span["write_bytes"]
+                parent["cache_hits"] += span["cache_hits"]
+                parent["cache_misses"] += span["cache_misses"]
+        if trace_state["enabled"]:
+            trace_state["spans"].append(span)
+
+
+@contextmanager
+def span(name: str, category: str = "helper", **args):
+    """Traces a block as a span: wall time, CPU time of the calling thread, CPU time and
+    peak RSS of the subprocesses it ran, bytes read/written and cache hits. I/O bytes are
+    process-wide (/proc/self/io), so they include other threads running at the same time.
+    A no-op while tracing is disabled.
+
+    Args:
+        name (str): Span name
+        category (str, optional): Span category (e.g., helper, stage, pipeline). Defaults to "helper".
+        **args: Extra values stored with the span
+    """
+    if not trace_state["enabled"]:
+        yield None
+        return
+
+    record = open_span(name, category, args)
+    read_start, write_start = process_io()
+    wall_start = time.perf_counter()
+    token = current_spans.set(record["parents"] + (record,))
+    try:
+        yield record
+    except BaseException as e:
+        record["args"]["error"] = repr(e)
+        raise
+    finally:
+        current_spans.reset(token)
+        read_end, write_end = process_io()
+        record["seconds"] = time.perf_counter() - wall_start
+        record["cpu_seconds"] = time.thread_time() - record["cpu_seconds"]
+        record["read_bytes"] += read_end - read_start
+        record["write_bytes"] += write_end - write_start
+        record["peak_rss_mb"] = max(record["peak_rss_mb"], peak_rss_mb())
+        close_span(record)
+
+
+def traced(func, name: str = None, category: str = "helper"):
+    """Wraps a function so each call is a span (see span)
+
+    Args:
+        func (callable): Function to trace
+        name (str, optional): Span name. Defaults to None (module.function).
+        category (str, optional): Span category. Defaults to "helper".
+
+    Returns:
+        callable: Traced function
+    """
+    name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not trace_state["enabled"]:
+            return func(*args, **kwargs)
+        with span(name, category):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0, **args):
+    """Records cache hits/misses on the open spans, a no-op while tracing is disabled
+
+    Args:
+        cache (str): Cache name (e.g., codeql_db, tags, pipeline)
+        hits (int, optional): Hits. Defaults to 0.
+        misses (int, optional): Misses. Defaults to 0.
+        **args: Extra values stored with the event (e.g., key)
+    """
+    if not trace_state["enabled"]:
+        return
+
+    record = open_span(cache, "cache", args)
+    record["cpu_seconds"] = 0.0
+    record["cache_hits"] = hits
+    record["cache_misses"] = misses
+    close_span(record)
+
+
+@contextmanager
+def advisory_context(advisory_id: str):
+    """Attributes the spans of the block (and of the threads it hands work to with
+    contextvars.copy_context) to an advisory
+
+    Args:
+        advisory_id (str): Advisory ID
+    """
+    token = current_advisory.set(advisory_id)
+    try:
+        yield
+    finally:
+        current_advisory.reset(token)
+
+
+class TracedPopen(subprocess.Popen):
+    """Popen that reaps its child with wait4 and records the child's CPU time, peak RSS
+    and block I/O as a subprocess span. Usage includes the descendants the child waited
+    for (e.g., the JVM under the codeql launcher or a shell=True command). Linux keeps the
+    RSS high-water mark across exec, so the peak RSS of a small command can show the
+    size of the forking Python process.
+    """
+
+    def __init__(self, args, *posargs, **kwargs):
+        self.trace_span = open_span(command_name(args), "subprocess") if trace_state["enabled"] else None
+        self.trace_rusage = None
+        self.trace_start = time.perf_counter()
+        super().__init__(args, *posargs, **kwargs)
+        if self.trace_span is not None:
+            self.trace_span["args"]["cmd"] = (
+                args if isinstance(args, str) else " ".join(os.fsdecode(x) for x in args)
+            )[:500]
+            self.trace_span["args"]["pid"] = self.pid
+
+    def trace_waitpid(self, pid, flags):
+        """waitpid that keeps the resource usage of the reaped child"""
+        pid, status, rusage = os.wait4(pid, flags)
+        if pid == self.pid:
+            self.trace_rusage = rusage
+        return pid, status
+
+    def _try_wait(self, wait_flags):
+        try:
+            return self.trace_waitpid(self.pid, wait_flags)
+        except ChildProcessError:
+            # child already reaped elsewhere, the status is lost
+            return self.pid, 0
+
+    def _internal_poll(self, _deadstate=None, **kwargs):
+        kwargs["_waitpid"] = self.trace_waitpid
+        return super()._internal_poll(_deadstate=_deadstate, **kwargs)
+
+    def _handle_exitstatus(self, sts, *args, **kwargs):
+        super()._handle_exitstatus(sts, *args, **kwargs)
+
+        record, self.trace_span = self.trace_span, None
+        if record is None:
+            return
+
+        record["seconds"] = time.perf_counter() - self.trace_start
+        record["cpu_seconds"] = 0.0
+        record["args"]["returncode"] = self.returncode
+        if self.trace_rusage is not None:
+            usage = self.trace_rusage
+            record["child_cpu_seconds"] = usage.ru_utime + usage.ru_stime
+            record["peak_rss_mb"] = usage.ru_maxrss * RSS_UNIT / 2**20
+            # block I/O in 512-byte units
+            record["read_bytes"] = usage.ru_inblock * 512
+            record["write_bytes"] = usage.ru_oublock * 512
+        close_span(record)
+
+
+def patch(owner, attribute: str, value):
+    """Replaces an attribute and remembers the original for disable_tracing"""
+    trace_state["patched"].append((owner, attribute, getattr(owner, attribute)))
+    setattr(owner, attribute, value)
+
+
+def enable_tracing(entry_points: dict = None, subprocesses: bool = True):
+    """Starts a new trace. Wraps the helper entry points in spans and, on POSIX, makes
+    subprocess.run/Popen (and GitPython) record every command as a subprocess span.
+
+    Args:
+        entry_points (dict, optional): {helper module: [function names]} to wrap.
+            Defaults to None (ENTRY_POINTS).
+        subprocesses (bool, optional): Account for subprocesses. Defaults to True.
+    """
+    disable_tracing()
+
+    for module_name, functions in (ENTRY_POINTS if entry_points is None else entry_points).items():
+        module = importlib.import_module(f".{module_name}", __package__)
+        for function in functions:
+            patch(module, function, traced(getattr(module, function)))
+
+    if subprocesses and hasattr(os, "wait4"):
+        patch(subprocess, "Popen", TracedPopen)
+        try:
+            import git.cmd
+
+            patch(git.cmd, "Popen", TracedPopen)
+        except ImportError:
+            pass
+
+    with trace_lock:
+        trace_state.update(enabled=True, origin=time.perf_counter(), spans=[])
+
+
+def disable_tracing():
+    """Stops tracing and restores the wrapped functions, the recorded spans are kept"""
+    trace_state["enabled"] = False
+    while trace_state["patched"]:
+        owner, attribute, original = trace_state["patched"].pop()
+        setattr(owner, attribute, original)
+
+
+@contextmanager
+def tracing(**options):
+    """Traces the block, see enable_tracing for the options"""
+    enable_tracing(**options)
+    try:
+        yield
+    finally:
+        disable_tracing()
+
+
+def trace_spans() -> pd.DataFrame:
+    """Recorded spans, start and seconds relative to enable_tracing
+
+    Returns:
+        pd.DataFrame: One row per span with the SPAN_COLUMNS
+    """
+    with trace_lock:
+        spans = list(trace_state["spans"])
+
+    return pd.DataFrame(spans, columns=SPAN_COLUMNS).sort_values("start", ignore_index=True)
+
+
+def advisory_summary(spans: pd.DataFrame = None) -> pd.DataFrame:
+    """Per advisory and span name totals. Times are inclusive, a helper span contains the
+    subprocess spans it ran, so compare rows of one category at a time.
+
+    Args:
+        spans (pd.DataFrame, optional): Output of trace_spans. Defaults to None (recorded spans).
+
+    Returns:
+        pd.DataFrame: advisory, category, name, calls, seconds, cpu_seconds,
+            child_cpu_seconds, peak_rss_mb, read_bytes, write_bytes, cache_hits, cache_misses
+    """
+    spans = trace_spans() if spans is None else spans
+    spans = spans.assign(advisory=spans["advisory"].fillna(""))
+
+    summary = (
+        spans.groupby(["advisory", "category", "name"], sort=False)
+        .agg(
+            calls=("name", "size"),
+            seconds=("seconds", "sum"),
+            cpu_seconds=("cpu_seconds", "sum"),
+            child_cpu_seconds=("child_cpu_seconds", "sum"),
+            peak_rss_mb=("peak_rss_mb", "max"),
+            read_bytes=("read_bytes", "sum"),
+            write_bytes=("write_bytes", "sum"),
+            cache_hits=("cache_hits", "sum"),
+            cache_misses=("cache_misses", "sum"),
+        )
+        .reset_index()
+    )
+
+    return summary.sort_values(["advisory", "seconds"], ascending=[True, False], ignore_index=True)
+
+
+def export_chrome_trace(trace_path: str, spans: pd.DataFrame = None) -> str:
+    """Writes the spans as Chrome trace event JSON, open it in Perfetto (ui.perfetto.dev)
+    or chrome://tracing. Threads are the tracks, cache lookups are instant events.
+
+    Args:
+        trace_path (str): Output JSON location
+        spans (pd.DataFrame, optional): Output of trace_spans. Defaults to None (recorded spans).
+
+    Returns:
+        str: trace_path
+    """
+    spans = trace_spans() if spans is None else spans
+    pid = os.getpid()
+    threads = {name: tid for tid, name in enumerate(spans["thread"].unique(), start=1)}
+
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for name, tid in threads.items()
+    ]
+    for row in spans.itertuples(index=False):
+        args = {
+            column: getattr(row, column)
+            for column in SPAN_COLUMNS[6:13]
+            if getattr(row, column)
+        }
+        args.update(row.args)
+        if pd.notna(row.advisory):
+            args["advisory"] = row.advisory
+
+        event = {
+            "name": row.name,
+            "cat": row.category,
+            "ts": row.start * 1e6,
+            "pid": pid,
+            "tid": threads[row.thread],
+            "args": args,
+        }
+        if row.category == "cache":
+            event.update(ph="i", s="t")
+        else:
+            event.update(ph="X", dur=row.seconds * 1e6)
+        events.append(event)
+
+    with open(trace_path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    return trace_path
@@ -0,0 +1,246 @@
+"""
+Helper functions to order Go module versions and evaluate OSV affected ranges
+"""
+import re
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+
+# Go semver, the v prefix is optional since OSV Go advisories omit it
+# shorthand v1 / v1.2 are accepted like golang.org/x/mod/semver
+GO_VERSION_REGEX = re.compile(
+    r"^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?"
+    r"(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?"
+    r"(?:\+([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?$"
+)
+
+# vX.0.0-yyyymmddhhmmss-hash, vX.Y.Z-pre.0.yyyymmddhhmmss-hash, vX.Y.(Z+1)-0.yyyymmddhhmmss-hash
+PSEUDO_VERSION_REGEX = re.compile(
+    r"^v?\d+\.(?:0\.0-|\d+\.\d+-(?:[^+]*\.)?0\.)\d{14}-[A-Za-z0-9]+(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?$"
+)
+
+# OSV range types ordered by version, GIT ranges are ordered by commit
+VERSION_RANGE_TYPES = ["SEMVER", "ECOSYSTEM"]
+
+
+@lru_cache(maxsize=None)
+def parse_go_version(version: str):
+    """Parses a Go module version (semver, pseudo-version, +incompatible) into a sortable tuple.
+    Build metadata such as +incompatible does not take part in the order, same as Go.
+
+    Args:
+        version (str): Version with or without the v prefix
+
+    Returns:
+        tuple: (major, minor, patch, is_release, prerelease identifiers), None if not a version
+    """
+    if not isinstance(version, str):
+        return None
+
+    match = GO_VERSION_REGEX.match(version.strip())
+    if match is None:
+        return None
+
+    major, minor, patch, prerelease, _ = match.groups()
+
+    # numeric identifiers sort before alphanumeric ones
+    identifiers = ()
+    if prerelease is not None:
+        identifiers = tuple(
+            (0, int(x), "") if x.isdigit() else (1, 0, x) for x in prerelease.split(".")
+        )
+
+    return (
+        int(major),
+        int(minor or 0),
+        int(patch or 0),
+        prerelease is None,
+        identifiers,
+    )
+
+
+def is_pseudo_version(version: str) -> bool:
+    """Checks if a version is a Go pseudo-version (untagged commit)
+
+    Args:
+        version (str): Version with or without the v prefix
+
+    Returns:
+        bool: True for pseudo-versions
+    """
+    return isinstance(version, str) and PSEUDO_VERSION_REGEX.match(version.strip()) is not None
+
+
+def version_keys(versions) -> np.ndarray:
+    """Converts versions into dense integer keys, equal versions share a key.
+    Every distinct string is parsed once. Keys are only comparable within one call,
+    so versions that are compared against each other have to be keyed together.
+
+    Args:
+        versions (list-like): Versions to key
+
+    Returns:
+        np.ndarray: int64 key per version, -1 for versions that cannot be parsed
+    """
+    codes, uniques = pd.factorize(pd.Series(versions, dtype=object), use_na_sentinel=True)
+
+    parsed = [parse_go_version(x) for x in uniques]
+    valid = [i for i, x in enumerate(parsed) if x is not None]
+    valid.sort(key=lambda i: parsed[i])
+
+    # dense rank of the unique versions, ties for equal precedence
+    unique_keys = np.full(len(uniques) + 1, -1, dtype=np.int64)
+    rank = -1
+    previous = None
+    for i in valid:
+        if parsed[i] != previous:
+            rank += 1
+            previous = parsed[i]
+        unique_keys[i] = rank
+
+    # code -1 (missing) picks the trailing -1
+    return unique_keys[codes]
+
+
+def sort_versions(versions) -> pd.DataFrame:
+    """Sorts versions by Go semver precedence, unparsable versions are dropped
+
+    Args:
+        versions (list-like): Versions to sort
+
+    Returns:
+        pd.DataFrame: version and version_key in ascending order
+    """
+    versions_df = pd.DataFrame({"version": list(versions)})
+    versions_df["version_key"] = version_keys(versions_df["version"])
+
+    return (
+        versions_df[versions_df["version_key"] >= 0]
+        .sort_values("version_key", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def range_intervals(ranges_df: pd.DataFrame, keys: np.ndarray, key_count: int) -> pd.DataFrame:
+    """Converts OSV range events into half open [start, end) intervals of version keys
+
+    introduced "0" is open to the left, a range without a closing event is open to
+    the right, last_affected is inclusive and fixed/limit are exclusive.
+
+    Args:
+        ranges_df (pd.DataFrame): Output of osv_helper.parse_osv_ranges/parse_osv_bulk
+        keys (np.ndarray): version_keys of introduced, fixed, last_affected and limit stacked
+        key_count (int): Number of distinct keys in the version_keys call
+
+    Returns:
+        pd.DataFrame: start and end per range on the axis of version keys + 1
+    """
+    count = len(ranges_df)
+    introduced, fixed, last_affected, limit = keys.reshape(4, count)
+
+    # shift keys by one so 0 can stand for "every version before"
+    top = key_count + 1
+    start = np.where(ranges_df["introduced"].astype(str).to_numpy() == "0", 0, introduced + 1)
+    end = np.full(count, top + 1, dtype=np.int64)
+    end = np.where(limit >= 0, limit + 1, end)
+    end = np.where(last_affected >= 0, last_affected + 2, end)
+    end = np.where(fixed >= 0, fixed + 1, end)
+
+    # introduced that cannot be parsed is an empty interval
+    start = np.where((introduced < 0) & (start != 0), top + 1, start)
+
+    return pd.DataFrame({"start": start, "end": end}, index=ranges_df.index)
+
+
+def is_affected(
+    ranges_df: pd.DataFrame,
+    pairs_df: pd.DataFrame,
+    package_column: str = "package.name",
+    version_column: str = "version",
+    id_column: str = "id",
+) -> np.ndarray:
+    """Checks many (package version, advisory) pairs against OSV affected ranges at once
+
+    Every range of an advisory/package is placed on one global axis
+    (group * stride + version key) and each pair is answered with one searchsorted.
+
+    Args:
+        ranges_df (pd.DataFrame): Output of osv_helper.parse_osv_ranges/parse_osv_bulk
+        pairs_df (pd.DataFrame): Pairs with package_column, version_column and id_column
+        package_column (str, optional): Package column of pairs_df. Defaults to "package.name".
+        version_column (str, optional): Version column of pairs_df. Defaults to "version".
+        id_column (str, optional): Advisory column of pairs_df. Defaults to "id".
+
+    Returns:
+        np.ndarray: bool per row of pairs_df
+    """
+    ranges_df = ranges_df[ranges_df["type"].isin(VERSION_RANGE_TYPES)]
+    if len(ranges_df) == 0 or len(pairs_df) == 0:
+        return np.zeros(len(pairs_df), dtype=bool)
+
+    # key range events and queried versions together
+    event_versions = pd.concat(
+        [ranges_df[x] for x in ["introduced", "fixed", "last_affected", "limit"]],
+        ignore_index=True,
+    )
+    keys = version_keys(pd.concat([event_versions, pairs_df[version_column]], ignore_index=True))
+    key_count = keys.max(initial=-1) + 1
+    intervals = range_intervals(ranges_df, keys[: len(event_versions)], key_count)
+    query_keys = keys[len(event_versions) :] + 1
+
+    # one group per (advisory, package)
+    group_ids, groups = pd.MultiIndex.from_arrays(
+        [ranges_df["id"], ranges_df["package.name"]]
+    ).factorize()
+    stride = key_count + 3
+
+    starts = group_ids * stride + intervals["start"].to_numpy()
+    ends = group_ids * stride + intervals["end"].to_numpy()
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    # overlapping ranges are covered by the running max of the ends
+    max_ends = np.maximum.accumulate(ends[order])
+
+    query_groups = groups.get_indexer(
+        pd.MultiIndex.from_arrays([pairs_df[id_column], pairs_df[package_column]])
+    )
+    positions = query_groups * stride + query_keys
+    candidates = np.searchsorted(starts, positions, side="right") - 1
+
+    return (
+        (query_groups >= 0)
+        & (query_keys > 0)
+        & (candidates >= 0)
+        & (max_ends[np.clip(candidates, 0, None)] > positions)
+    )
+
+
+def affected_versions(
+    ranges_df: pd.DataFrame,
+    modules_df: pd.DataFrame,
+    package_column: str = "package.name",
+    version_column: str = "version",
+) -> pd.DataFrame:
+    """Finds every advisory affecting a set of module versions (e.g., SBOM components)
+
+    Args:
+        ranges_df (pd.DataFrame): Output of osv_helper.parse_osv_ranges/parse_osv_bulk
+        modules_df (pd.DataFrame): Module versions with package_column and version_column
+        package_column (str, optional): Package column of modules_df. Defaults to "package.name".
+        version_column (str, optional): Version column of modules_df. Defaults to "version".
+
+    Returns:
+        pd.DataFrame: modules_df rows joined with the id of each advisory affecting them
+    """
+    advisories = (
+        ranges_df.loc[ranges_df["type"].isin(VERSION_RANGE_TYPES), ["id", "package.name"]]
+        .drop_duplicates()
+        .rename(columns={"package.name": package_column})
+    )
+    pairs_df = pd.merge(modules_df, advisories, on=package_column, how="inner")
+
+    affected = is_affected(
+        ranges_df, pairs_df, package_column=package_column, version_column=version_column
+    )
+
+    return pairs_df[affected].reset_index(drop=True)